@@ -1,6 +1,10 @@
 import streamlit as st
 import os
-from main import VeterinaryCrew
+from main import VeterinaryCrew, groq_scheduler
+from conversation_memory import ConversationMemory
+from rate_limiter import RateLimitExceeded
+from vector_db import retrieval_engine
+from tracing import tracer
 import logging
 
 # Configure logging
@@ -38,10 +42,21 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# Pipeline mode: "crew" (classification, retrieval and specialist agents, the answer appears when the crew finishes),
+# "speculative" or "fast" (the specialist is called directly and its tokens appear as they arrive)
+APP_PIPELINE_MODE = os.getenv("VET_APP_MODE", "crew")
+
+# Messages kept on screen per session (older ones only live on in the conversation memory's summary)
+MAX_DISPLAYED_MESSAGES = 100
+
 # Initialize session state
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# History sent with each query (recent turns + summary, bounded by tokens)
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationMemory()
+
 if "crew" not in st.session_state:
     st.session_state.crew = None
 
@@ -56,7 +71,13 @@ def is_daily_limit(error_message: str) -> bool:
 def initialize_crew():
     """Initialize the Veterinary Crew once"""
     try:
-        return VeterinaryCrew()
+        crew = VeterinaryCrew(mode=APP_PIPELINE_MODE)
+        # Load embedding model and open collection in the background so the UI renders right away
+        retrieval_engine.warm_up(background=True)
+        # Prometheus endpoint for the request spans and counters (only with VET_TRACING=1)
+        if tracer.enabled:
+            tracer.serve()
+        return crew
     except Exception as e:
         logger.error(f"Error initializing crew: {str(e)}")
         return None
@@ -85,6 +106,7 @@ with st.sidebar:
 
     if st.button("🗑️ Limpiar conversación"):
         st.session_state.messages = []
+        st.session_state.memory.clear()
         st.rerun()
     
     st.divider()
@@ -96,6 +118,16 @@ with st.sidebar:
     </div>
     """, unsafe_allow_html=True)
 
+    # Current LLM budget (client-side estimate)
+    budget = groq_scheduler.status()
+    remaining, limits = budget["remaining"], budget["limits"]
+    st.caption(
+        f"Solicitudes disponibles: {max(remaining['requests_per_minute'], 0)}/{limits['requests_per_minute']} por minuto · "
+        f"{max(remaining['requests_per_day'], 0)}/{limits['requests_per_day']} por día  \n"
+        f"Tokens disponibles: {max(remaining['tokens_per_minute'], 0)}/{limits['tokens_per_minute']} por minuto  \n"
+        f"Consultas en espera: {budget['queue_depth']}"
+    )
+
 # Initialize crew if not already done
 if st.session_state.crew is None:
     with st.spinner("Inicializando sistema..."):
@@ -121,34 +153,43 @@ if prompt := st.chat_input("Escribe tu consulta veterinaria..."):
         message_placeholder = st.empty()
 
         try:
-            with st.spinner("Procesando consulta..."):
-                #Call the crew
-                response = st.session_state.crew.run(prompt)
-
-                # Extract the actual response text
-                if hasattr(response, "raw"):
-                    response_text = response.raw
-                elif hasattr(response, "output"):
-                    response_text = response.output
-                else:
-                    response_text = str(response)
-                
-                # Display response
-                message_placeholder.markdown(response_text)
-
-                # Add assistant message to chat
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": response_text
-                })
+            response_text = ""
+            message_placeholder.markdown("⏳ Procesando consulta...")
+
+            # Render progress and the specialist's tokens as they arrive
+            for event in st.session_state.crew.stream(prompt, memory=st.session_state.memory):
+                if event["type"] == "classification":
+                    message_placeholder.markdown("🔎 Consulta clasificada, buscando información...")
+                elif event["type"] == "retrieval":
+                    message_placeholder.markdown("📚 Información recuperada, redactando respuesta...")
+                elif event["type"] == "token":
+                    response_text += event["content"]
+                    message_placeholder.markdown(response_text + "▌")
+                elif event["type"] == "done":
+                    response_text = event["content"]
+                    message_placeholder.markdown(response_text)
+                    st.caption(f"⏱️ Primer token: {event['time_to_first_token']:.2f} s · Total: {event['seconds']:.2f} s")
+                    logger.info(f"Time to first token: {event['time_to_first_token']:.2f}s ({event['source']})")
+
+            # Add assistant message to chat
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": response_text
+            })
+            del st.session_state.messages[:-MAX_DISPLAYED_MESSAGES]
         
         except Exception as e:
             error_message = str(e)
 
             # Check for rate limit errors
             if any(keyword in error_message.lower() for keyword in ["rate limit", "token", "quota", "429", "rpm", "tpm", "rpd", "tpd"]):
-                # Determine if it's a daily or minute limit
-                if is_daily_limit(error_message):
+                # Determine if it's a daily or minute limit, and how long until there's budget again
+                if isinstance(e, RateLimitExceeded):
+                    daily_limit, wait_seconds = e.daily, e.wait_seconds
+                else:
+                    daily_limit, wait_seconds = is_daily_limit(error_message), groq_scheduler.estimate_wait()
+
+                if daily_limit:
                     st.markdown("""
                     <div class="error-box">
                         <strong>⚠️ Límite alcanzado</strong>
@@ -160,11 +201,11 @@ if prompt := st.chat_input("Escribe tu consulta veterinaria..."):
                     </div>
                     """, unsafe_allow_html=True)
                 else:
-                    st.markdown("""
+                    st.markdown(f"""
                     <div class="error-box">
                         <strong>⚠️ Límite alcanzado</strong>
                         <p>El sistema ha alcanzado el límite de tokens/solicitudes por minuto.</p>
-                        <p><strong>Por favor, espera 30-60 segundos e intenta de nuevo.</strong></p>
+                        <p><strong>Por favor, espera {max(round(wait_seconds), 5)} segundos e intenta de nuevo.</strong></p>
                         <p style='font-size: 0.85rem; margin-top: 0.5rem;'>
                         Esto es una limitación temporal debido a la fase prototípica.
                         </p>
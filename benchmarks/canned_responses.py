@@ -0,0 +1,52 @@
+"""
+Latency of canned responses (system/out-of-scope queries answered without the LLM)
+
+Usage (from the repository root):
+    python -m benchmarks.canned_responses --repeat 20
+"""
+import argparse
+import statistics
+import time
+
+from query_router import LocalQueryClassifier, CannedResponseRouter
+from vector_db import retrieval_engine
+
+QUERIES = [
+    "Hola",
+    "Hola, ¿qué puedes hacer?",
+    "Muchas gracias",
+    "Adiós",
+    "Tengo dolor de cabeza",
+    "¿Cuáles son los síntomas del parvovirus?", # Must NOT be routed
+    "Hola, mi perro comió chocolate", # Must NOT be routed
+]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure canned response routing latency")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed calls per query")
+    args = parser.parse_args()
+
+    retrieval_engine.warm_up()
+    router = CannedResponseRouter(LocalQueryClassifier(retrieval_engine.embedding_function))
+
+    print("\n" + "="*30)
+    print("CANNED RESPONSES")
+    print("="*30)
+
+    for query in QUERIES:
+        # First call embeds the query with the model, the rest hit the embedding cache
+        start = time.perf_counter()
+        response = router.route(query)
+        first_ms = (time.perf_counter() - start) * 1000
+
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            router.route(query)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        routed = "canned" if response is not None else "LLM"
+        print(f"{query:<45} {routed:<7} first {first_ms:7.1f} ms   median {statistics.median(timings):7.2f} ms")
+
+if __name__ == "__main__":
+    main()
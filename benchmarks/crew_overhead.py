@@ -0,0 +1,49 @@
+"""
+Per-request Python overhead of preparing the CrewAI pipeline (no LLM calls are made)
+
+"rebuild" creates agents, tool, tasks and crew for every request (the previous behaviour),
+"pooled" borrows a prebuilt crew and only interpolates the user query into its task templates.
+
+Usage (from the repository root):
+    python -m benchmarks.crew_overhead --requests 200
+"""
+import argparse
+import statistics
+import time
+
+from main import VeterinaryCrew
+
+def measure(function, requests: int) -> list:
+    """Milliseconds per call"""
+    timings = []
+    for i in range(requests):
+        start = time.perf_counter()
+        function(f"¿Cuáles son los síntomas del parvovirus? #{i}")
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure crew preparation overhead per request")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    args = parser.parse_args()
+
+    vet_crew = VeterinaryCrew(use_canned_responses=False, use_response_cache=False)
+
+    def rebuild(user_query: str):
+        crew = vet_crew._build_crew()
+        crew._interpolate_inputs(vet_crew._crew_inputs(user_query))
+
+    def pooled(user_query: str):
+        with vet_crew._pooled_crew("crew") as crew:
+            crew._interpolate_inputs(vet_crew._crew_inputs(user_query))
+
+    print("\n" + "="*30)
+    print("CREW PREPARATION OVERHEAD")
+    print("="*30)
+
+    for name, function in (("rebuild", rebuild), ("pooled", pooled)):
+        timings = measure(function, args.requests)
+        print(f"{name:<8} median {statistics.median(timings):8.3f} ms   p95 {sorted(timings)[int(len(timings) * 0.95) - 1]:8.3f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Sentence Transformers (PyTorch) vs ONNX Runtime (float32 / int8) query embedding
+
+Each engine runs in a fresh interpreter with the embedding cache disabled and reports model
+load time, single-query latency, batch throughput and peak RSS. Quality is compared against
+the Sentence Transformers vectors (cosine similarity of the same query) and as recall@k/MRR of
+vector-only retrieval over the labelled query set, against the existing index.
+
+Needs the ONNX export first (python onnx_embedding.py) and an indexed knowledge base.
+
+Usage (from the repository root):
+    python -m benchmarks.embedding_engines --output embedding_engines.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (embedding engine, ONNX model file)
+ENGINES = {
+    "sentence_transformers": ("sentence_transformers", None),
+    "onnx": ("onnx", "model.onnx"),
+    "onnx-int8": ("onnx", "model_int8.onnx"),
+}
+
+# ===================================================
+# WORKER (fresh interpreter, prints one JSON line)
+# ===================================================
+def worker(name: str, vectors_path: str, repeat: int) -> dict:
+    import numpy as np
+    import vector_db
+    from benchmarks.retrieval import load_queries, QUERIES_PATH, expected_rank, RECALL_AT
+
+    engine, model_file = ENGINES[name]
+    vector_db.logger.setLevel("WARNING")
+    retrieval_engine = vector_db.retrieval_engine
+    retrieval_engine.embedding_engine = engine
+    retrieval_engine.onnx_model_file = model_file or retrieval_engine.onnx_model_file
+    retrieval_engine.cache_size = 0
+    queries = load_queries(QUERIES_PATH)
+    texts = [f"query: {item['query']}" for item in queries]
+
+    start = time.perf_counter()
+    model = retrieval_engine.embedding_function.inner # Loads the model
+    model(["query: warm up"])
+    load_seconds = time.perf_counter() - start
+
+    timings = []
+    for _ in range(repeat):
+        for text in texts:
+            start = time.perf_counter()
+            model([text])
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+
+    start = time.perf_counter()
+    vectors = np.asarray(model(texts), dtype=np.float32)
+    batch_seconds = time.perf_counter() - start
+    np.save(vectors_path, vectors)
+
+    results = vector_db.query_diseases_batch([item["query"] for item in queries], mode="vector")
+    ranks = [expected_rank(item, [(hit.disease, hit.category, hit.distance, False) for hit in result.hits]) for item, result in zip(queries, results)]
+
+    return {
+        "load_seconds": load_seconds,
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[min(int(len(timings) * 0.95), len(timings) - 1)],
+        "batch_qps": len(texts) / batch_seconds,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "recall_at": {str(k): sum(1 for rank in ranks if rank and rank <= k) / len(ranks) for k in RECALL_AT},
+        "mrr": sum(1 / rank for rank in ranks if rank) / len(ranks),
+    }
+
+def run_worker(name: str, vectors_path: str, repeat: int) -> dict:
+    completed = subprocess.run([sys.executable, "-m", "benchmarks.embedding_engines", "--worker", name, vectors_path, str(repeat)], cwd=ROOT_DIR, capture_output=True, text=True)
+    for line in completed.stdout.splitlines():
+        if line.startswith("{"):
+            return json.loads(line)
+    raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "no output")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare query embedding engines")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES), help="Engines to run (the first one is the quality reference)")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the query set for single-query latency")
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--worker", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        name, vectors_path, repeat = args.worker
+        print(json.dumps(worker(name, vectors_path, int(repeat))))
+        return
+
+    import numpy as np
+
+    print("\n" + "="*30)
+    print("EMBEDDING ENGINES")
+    print("="*30)
+
+    report = {}
+    reference = None
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in args.engines:
+            vectors_path = os.path.join(tmp_dir, f"{name}.npy")
+            try:
+                record = run_worker(name, vectors_path, args.repeat)
+            except Exception as e:
+                report[name] = {"error": str(e)}
+                print(f"{name:<22} failed: {e}")
+                continue
+
+            # Same queries, so row-wise dot products of the normalized vectors are cosine similarities to the reference
+            vectors = np.load(vectors_path)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            if reference is None:
+                reference = vectors
+            similarities = (vectors * reference).sum(axis=1)
+            record["cosine_to_reference"] = {"mean": float(similarities.mean()), "min": float(similarities.min())}
+            report[name] = record
+
+            print(
+                f"{name:<22} load {record['load_seconds']:6.2f} s   p50 {record['p50_ms']:7.2f} ms   p95 {record['p95_ms']:7.2f} ms   "
+                f"batch {record['batch_qps']:7.1f} q/s   rss {record['peak_rss_mb']:7.1f} MB   "
+                f"recall@1 {record['recall_at']['1']:.2f}   MRR {record['mrr']:.3f}   cos min {record['cosine_to_reference']['min']:.4f}"
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Load test of the HTTP service (server.py): throughput, latency percentiles and errors under concurrency
+
+Sends --requests queries with --concurrency in flight to /query, /query/stream or /query/batch and
+reports requests per second, p50/p95/p99 latency, errors by status and, for streams, time to first
+token. Queries cycle through a fixed set, and a suffix doesn't make a query new to the semantic
+response cache, so the pipeline is only measured with the server's cache off: --spawn starts the
+server with --no-response-cache, and with --url the server must run with it too (its /ready report
+is checked). --repeat measures cache hits instead, with the cache on.
+
+--spawn starts the server itself with the stub LLM backend (no Groq calls, no API key), so the
+numbers measure the service (workers, threads, retrieval, orchestration) rather than the provider:
+
+    python -m benchmarks.load_test --spawn --workers 2 --requests 500 --concurrency 64
+    python -m benchmarks.load_test --spawn --endpoint stream --requests 200 --concurrency 32
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --endpoint batch --batch-size 8
+
+Against a server running on Groq keep --concurrency and --requests within the rate limits.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+from collections import Counter
+
+import httpx
+
+# Veterinary questions (classification, search and specialist) plus a greeting answered without the LLM.
+# The client doesn't import main, so the load generator stays light next to the server it measures
+QUERIES = [
+    "Mi perro comió chocolate hace 1 hora, ¿qué hago?",
+    "¿Cuáles son los síntomas del parvovirus?",
+    "Perro con vómitos y diarrea con sangre, está muy débil",
+    "Qué es la leishmaniasis canina",
+    "Dosis de meloxicam en gatos",
+    "Hola, ¿qué puedes hacer?",
+]
+
+READY_TIMEOUT_SECONDS = 180 # Loading the embedding model on a cold start
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+def make_queries(count: int) -> list:
+    return [QUERIES[i % len(QUERIES)] for i in range(count)]
+
+def check_response_cache(url: str, repeat: bool):
+    """Warn when the server's response cache state doesn't match what the run measures"""
+    try:
+        response_cache = httpx.get(f"{url}/ready", timeout=10).json().get("response_cache")
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"Warning: couldn't read {url}/ready to check the response cache: {str(e)}", file=sys.stderr)
+        return
+    if response_cache and not repeat:
+        print("Warning: the server's response cache is on, repeated queries will be answered from it (start it with --no-response-cache)", file=sys.stderr)
+    elif response_cache is False and repeat:
+        print("Warning: the server's response cache is off, --repeat won't measure cache hits", file=sys.stderr)
+
+async def send_query(client: httpx.AsyncClient, endpoint: str, queries: list) -> dict:
+    """One request, timed (status, seconds and, for streams, time to first token)"""
+    start = time.perf_counter()
+    result = {"status": None, "seconds": None, "time_to_first_token": None, "queries": len(queries)}
+    try:
+        if endpoint == "stream":
+            async with client.stream("POST", "/query/stream", json={"query": queries[0]}) as response:
+                result["status"] = response.status_code
+                async for line in response.aiter_lines():
+                    if line.startswith("event: token") and result["time_to_first_token"] is None:
+                        result["time_to_first_token"] = time.perf_counter() - start
+                    elif line.startswith("event: error"):
+                        result["status"] = "stream_error"
+        elif endpoint == "batch":
+            response = await client.post("/query/batch", json={"queries": queries})
+            result["status"] = response.status_code
+            if response.status_code == 200:
+                failed = [item for item in response.json()["results"] if "error" in item]
+                if failed:
+                    result["status"] = f"batch_{failed[0]['status']}"
+        else:
+            response = await client.post("/query", json={"query": queries[0]})
+            result["status"] = response.status_code
+    except httpx.HTTPError as e:
+        result["status"] = type(e).__name__
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+async def run_load(url: str, endpoint: str, queries: list, concurrency: int, batch_size: int) -> tuple:
+    """All requests with at most concurrency in flight, plus the wall time"""
+    groups = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)] if endpoint == "batch" else [[query] for query in queries]
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=None, limits=limits) as client:
+        async def bounded(group):
+            async with semaphore:
+                return await send_query(client, endpoint, group)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(bounded(group) for group in groups))
+        return results, time.perf_counter() - start
+
+def summarize(results: list, wall_seconds: float) -> dict:
+    ok = [result for result in results if result["status"] == 200]
+    latencies = [result["seconds"] for result in ok]
+    first_tokens = [result["time_to_first_token"] for result in ok if result["time_to_first_token"] is not None]
+    summary = {
+        "requests": len(results),
+        "queries": sum(result["queries"] for result in results),
+        "errors": {str(status): count for status, count in Counter(result["status"] for result in results if result["status"] != 200).items()},
+        "wall_seconds": wall_seconds,
+        "requests_per_second": len(results) / wall_seconds,
+        "queries_per_second": sum(result["queries"] for result in ok) / wall_seconds,
+        "p50_seconds": percentile(latencies, 0.50),
+        "p95_seconds": percentile(latencies, 0.95),
+        "p99_seconds": percentile(latencies, 0.99),
+        "max_seconds": max(latencies, default=float("nan")),
+    }
+    if first_tokens:
+        summary["p50_time_to_first_token"] = percentile(first_tokens, 0.50)
+        summary["p95_time_to_first_token"] = percentile(first_tokens, 0.95)
+    return summary
+
+def spawn_server(args) -> subprocess.Popen:
+    """Start server.py on the stub LLM backend and wait until it's ready"""
+    command = [
+        sys.executable, "server.py",
+        "--port", str(args.port), "--workers", str(args.workers), "--mode", args.mode,
+        "--max-concurrency", str(args.max_concurrency), "--llm-backend", args.llm_backend,
+    ]
+    if not args.repeat:
+        command.append("--no-response-cache")
+    server = subprocess.Popen(command, env=dict(os.environ))
+    deadline = time.time() + READY_TIMEOUT_SECONDS
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{args.port}/ready", timeout=2).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(1)
+    server.terminate()
+    raise RuntimeError(f"Server not ready after {READY_TIMEOUT_SECONDS} s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the HTTP service")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Service to test (ignored with --spawn)")
+    parser.add_argument("--endpoint", default="query", choices=["query", "stream", "batch"])
+    parser.add_argument("--requests", type=int, default=200, help="Queries to send")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight")
+    parser.add_argument("--batch-size", type=int, default=8, help="Queries per request with --endpoint batch")
+    parser.add_argument("--repeat", action="store_true", help="Measure response cache hits (server with its cache on)")
+    parser.add_argument("--warmup", type=int, default=10, help="Requests sent before measuring")
+    parser.add_argument("--spawn", action="store_true", help="Start server.py with the stub LLM backend for the test")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the spawned server")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes of the spawned server")
+    parser.add_argument("--max-concurrency", type=int, default=64, help="Queries at once per worker of the spawned server")
+    parser.add_argument("--mode", default="fast", choices=["crew", "fast", "speculative"], help="Pipeline mode of the spawned server")
+    parser.add_argument("--llm-backend", default="stub", help="LLM backend of the spawned server")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    server = spawn_server(args) if args.spawn else None
+    url = f"http://127.0.0.1:{args.port}" if args.spawn else args.url
+    try:
+        check_response_cache(url, args.repeat)
+        if args.warmup:
+            asyncio.run(run_load(url, args.endpoint, make_queries(args.warmup), args.concurrency, args.batch_size))
+        results, wall_seconds = asyncio.run(run_load(url, args.endpoint, make_queries(args.requests), args.concurrency, args.batch_size))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    summary = summarize(results, wall_seconds)
+    print("\n" + "="*30)
+    print(f"LOAD TEST ({args.endpoint}, {args.concurrency} concurrent)")
+    print("="*30)
+    print(f"Requests:     {summary['requests']} ({summary['queries']} queries) in {summary['wall_seconds']:.2f} s")
+    print(f"Throughput:   {summary['requests_per_second']:.1f} req/s, {summary['queries_per_second']:.1f} queries/s")
+    print(f"Latency:      p50 {summary['p50_seconds']:.3f} s   p95 {summary['p95_seconds']:.3f} s   p99 {summary['p99_seconds']:.3f} s   max {summary['max_seconds']:.3f} s")
+    if "p50_time_to_first_token" in summary:
+        print(f"First token:  p50 {summary['p50_time_to_first_token']:.3f} s   p95 {summary['p95_time_to_first_token']:.3f} s")
+    print(f"Errors:       {summary['errors'] or 'none'}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump({"settings": vars(args), "summary": summary}, output_file, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Throughput of the orchestration, retrieval and caching layers on the stub LLM backend (no network)
+
+Runs VeterinaryCrew.arun concurrently in-process for each pipeline mode, twice: with the response
+cache off (every query goes through classification, search and the stub LLM) and on (queries drawn
+from a small set of variants, so most are answered from the cache). Reports requests per second,
+latency percentiles (all queries are submitted at once, so they include the wait for a slot), the
+stub's calls and tokens per request and the cache hit rate.
+
+The stub's latencies are drawn from --latency by one generator seeded with --seed, so reruns with
+the same settings sample the same latencies (which call gets which depends on the order the calls
+land in) and repeated prompts don't all wait the same time. --latency
+fixed:0 measures the pipeline's own overhead; a distribution like lognormal:0.8,0.5 with
+--token-latency 0.004 approximates Groq.
+
+Usage (from the repository root):
+    python -m benchmarks.orchestration --requests 2000 --concurrency 200
+    python -m benchmarks.orchestration --modes fast --latency lognormal:0.8,0.5 --response-tokens 400 --output orchestration.json
+"""
+import time
+import json
+import random
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from main import VeterinaryCrew, create_llm_backend
+from vector_db import retrieval_engine
+from benchmarks.load_test import QUERIES, percentile
+
+async def drive(vet_crew: VeterinaryCrew, queries: list, threads: int) -> tuple:
+    """Latency of every query (None if it failed) sent at once, arun's semaphore bounds the concurrency"""
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=threads, thread_name_prefix="benchmark-worker"))
+
+    async def timed(query):
+        start = time.perf_counter()
+        try:
+            await vet_crew.arun(query)
+            return time.perf_counter() - start
+        except Exception as e:
+            print(f"Error: {e}")
+            return None
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(timed(query) for query in queries))
+    return latencies, time.perf_counter() - start
+
+def make_queries(count: int, variants: int, seed: int) -> list:
+    """Unique queries, or drawn from variants per base query when variants is set (cache hits)"""
+    if not variants:
+        return [f"{QUERIES[i % len(QUERIES)]} (caso {i})" for i in range(count)]
+    rng = random.Random(seed)
+    return [f"{rng.choice(QUERIES)} (caso {rng.randrange(variants)})" for _ in range(count)]
+
+def run_scenario(mode: str, cached: bool, args) -> dict:
+    backend = create_llm_backend("stub", latency=args.latency, token_latency=args.token_latency, response_tokens=args.response_tokens, seed=args.seed)
+    vet_crew = VeterinaryCrew(mode=mode, use_response_cache=cached, max_concurrency=args.concurrency, compact_prompts=args.compact_prompts, llm_backend=backend)
+    queries = make_queries(args.requests, args.variants if cached else None, args.seed)
+
+    latencies, wall_seconds = asyncio.run(drive(vet_crew, queries, args.threads))
+    ok = [latency for latency in latencies if latency is not None]
+    stub = backend.llm.stats.snapshot()
+    return {
+        "mode": mode,
+        "response_cache": cached,
+        "requests": len(queries),
+        "errors": len(queries) - len(ok),
+        "wall_seconds": wall_seconds,
+        "requests_per_second": len(ok) / wall_seconds,
+        "p50_seconds": percentile(ok, 0.50),
+        "p95_seconds": percentile(ok, 0.95),
+        "p99_seconds": percentile(ok, 0.99),
+        "llm_calls_per_request": stub["calls"] / len(queries),
+        "prompt_tokens_per_request": stub["prompt_tokens"] / len(queries),
+        "completion_tokens_per_request": stub["completion_tokens"] / len(queries),
+        "mean_llm_latency_seconds": stub["mean_latency_seconds"],
+        "cache_hit_rate": vet_crew.response_cache.stats()["hit_rate"] if vet_crew.response_cache is not None else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark orchestration, retrieval and caching on the stub LLM backend")
+    parser.add_argument("--modes", nargs="+", default=list(VeterinaryCrew.PIPELINE_MODES), choices=VeterinaryCrew.PIPELINE_MODES)
+    parser.add_argument("--requests", type=int, default=1000, help="Queries per scenario")
+    parser.add_argument("--concurrency", type=int, default=100, help="Queries in flight (VeterinaryCrew max_concurrency)")
+    parser.add_argument("--threads", type=int, default=64, help="Threads for blocking steps (embedding, search, crews)")
+    parser.add_argument("--latency", default="fixed:0", help="Stub latency distribution (fixed:S, uniform:A,B, normal:MEAN,STD, lognormal:MEDIAN,SIGMA, exponential:MEAN)")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Stub seconds per completion token")
+    parser.add_argument("--response-tokens", type=int, default=0, help="Pad the stub specialist's answers to about this many tokens")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the stub latencies and the cached query draw")
+    parser.add_argument("--variants", type=int, default=5, help="Variants per base query in the cached scenario")
+    parser.add_argument("--compact-prompts", action="store_true", help="Use the compact prompts")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    retrieval_engine.warm_up() # Model loading shouldn't count towards the first scenario
+
+    results = [run_scenario(mode, cached, args) for mode in args.modes for cached in (False, True)]
+
+    print("\n" + "="*30)
+    print(f"ORCHESTRATION (stub LLM {args.latency}, {args.concurrency} concurrent)")
+    print("="*30)
+    for result in results:
+        hit_rate = f"{result['cache_hit_rate']:6.1%}" if result["cache_hit_rate"] is not None else "     -"
+        print(
+            f"{result['mode']:<12} cache {'on ' if result['response_cache'] else 'off'}   "
+            f"{result['requests_per_second']:7.1f} req/s   p50 {result['p50_seconds']:6.3f} s   p95 {result['p95_seconds']:6.3f} s   p99 {result['p99_seconds']:6.3f} s   "
+            f"LLM calls {result['llm_calls_per_request']:4.2f}   tokens {result['prompt_tokens_per_request'] + result['completion_tokens_per_request']:7.0f}   "
+            f"hits {hit_rate}   errors {result['errors']}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump({"settings": vars(args), "results": results}, output_file, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Latency and token use of the "crew", "fast" and "speculative" pipeline modes of VeterinaryCrew
+
+Per-stage timings are recorded for the fast and speculative modes, the latter also reports how
+often the search of the raw query was reused and the latency it would have had with its stages
+run one after another.
+
+Needs GROQ_API_KEY. The response cache is disabled so every query reaches the LLM, and a pause
+between queries keeps the run under Groq's per-minute limits. --llm-backend stub runs offline
+against the scripted LLM (VET_STUB_* settings), for the orchestration's share of the latency.
+
+Usage (from the repository root):
+    python -m benchmarks.pipeline_modes --pause 20 --output pipeline_modes.json
+    VET_STUB_LATENCY=lognormal:0.8,0.5 python -m benchmarks.pipeline_modes --llm-backend stub --pause 0
+"""
+import argparse
+import json
+import statistics
+import time
+
+from main import VeterinaryCrew
+from vector_db import retrieval_engine
+
+QUERIES = [
+    "Mi perro comió chocolate hace 1 hora, ¿qué hago?",
+    "¿Cuáles son los síntomas del parvovirus?",
+    "Perro con vómitos y diarrea con sangre, está muy débil",
+    "Qué es la leishmaniasis canina",
+    "Hola, ¿qué puedes hacer?",
+    "Tengo dolor de cabeza",
+]
+
+def run_mode(mode: str, queries: list, pause: float, compact_prompts: bool = False, llm_backend: str = None) -> list:
+    """Run every query once in the given mode and collect latency/token usage"""
+    crew = VeterinaryCrew(mode=mode, use_response_cache=False, compact_prompts=compact_prompts, llm_backend=llm_backend)
+    records = []
+    for query in queries:
+        start = time.perf_counter()
+        timings = {}
+        try:
+            usage = {}
+            crew.run(query, timings=timings, usage=usage)
+            records.append({
+                "query": query,
+                "seconds": time.perf_counter() - start,
+                "timings": timings,
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "completion_tokens": usage.get("completion_tokens"),
+                "total_tokens": usage.get("total_tokens"),
+                "llm_requests": usage.get("successful_requests"),
+            })
+        except Exception as e:
+            records.append({"query": query, "error": str(e)})
+        time.sleep(pause)
+    return records
+
+def summarize(records: list) -> dict:
+    """Median latency and mean tokens/requests per query"""
+    ok = [record for record in records if "error" not in record]
+    if not ok:
+        return {"errors": len(records)}
+    # Median seconds per stage (only queries that went through the stage)
+    stages = {}
+    for record in ok:
+        for stage, value in record["timings"].items():
+            if not isinstance(value, bool):
+                stages.setdefault(stage, []).append(value)
+    reuse = [record["timings"]["search_reused"] for record in ok if "search_reused" in record["timings"]]
+
+    return {
+        "median_seconds": statistics.median(record["seconds"] for record in ok),
+        "median_stage_seconds": {stage: statistics.median(values) for stage, values in stages.items()},
+        "search_reuse_rate": sum(reuse) / len(reuse) if reuse else None,
+        "mean_total_tokens": statistics.mean(record["total_tokens"] or 0 for record in ok),
+        "mean_llm_requests": statistics.mean(record["llm_requests"] or 0 for record in ok),
+        "errors": len(records) - len(ok),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare crew, fast and speculative pipeline modes")
+    parser.add_argument("--pause", type=float, default=20.0, help="Seconds between queries (rate limits)")
+    parser.add_argument("--llm-backend", help="groq (default) or stub, scripted answers without the network (--pause 0)")
+    parser.add_argument("--output", help="Write raw records and summary as JSON")
+    args = parser.parse_args()
+
+    retrieval_engine.warm_up() # Model loading shouldn't count towards the first query
+
+    report = {}
+    for mode in VeterinaryCrew.PIPELINE_MODES:
+        records = run_mode(mode, QUERIES, args.pause, llm_backend=args.llm_backend)
+        report[mode] = {"summary": summarize(records), "records": records}
+
+    print("\n" + "="*30)
+    print("PIPELINE MODES")
+    print("="*30)
+    for mode, data in report.items():
+        print(f"{mode:<6} {data['summary']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
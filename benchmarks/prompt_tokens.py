@@ -0,0 +1,119 @@
+"""
+Prompt tokens per task of the full vs compact prompts (VeterinaryCrew(compact_prompts=True))
+
+Each task's prompt is rendered the way CrewAI sends it (agent role/backstory/goal as the system
+message, task description, expected output and context outputs as the user message) and counted
+with the local tokenizer (rate_limiter.count_tokens). Context outputs are what each pipeline
+passes downstream: the classification in its expected format and the knowledge base search of
+the refined query (with compact prompts the crew's specialist and quality check get a summary of
+the classification instead). Tool descriptions CrewAI adds to the retrieval agent are the same in both
+styles and left out. No LLM calls are made.
+
+--live also runs the pipeline modes against Groq with both prompt styles, for the latency and
+the provider's token counts (needs GROQ_API_KEY).
+
+Usage (from the repository root):
+    python -m benchmarks.prompt_tokens --output prompt_tokens.json
+    python -m benchmarks.prompt_tokens --live --modes fast speculative --pause 20
+"""
+import argparse
+import json
+import statistics
+
+from main import VeterinaryCrew
+from rate_limiter import count_tokens
+from vector_db import query_diseases, retrieval_engine
+from benchmarks.pipeline_modes import QUERIES, run_mode, summarize
+
+# Stand-in for the specialist's answer reviewed by the quality check task
+SAMPLE_RESPONSE = "⚠️ EMERGENCIA VETERINARIA:\n\nLa teobromina del chocolate es tóxica para los perros. Acude de inmediato a un veterinario; si la ingesta fue hace menos de 2 horas puede inducirse el vómito."
+
+# Tasks sent to the LLM by each pipeline mode
+MODE_TASKS = {
+    "crew": ("classification", "retrieval", "specialist_crew"),
+    "fast": ("specialist_fast",),
+    "speculative": ("classification", "specialist_fast"),
+}
+
+def render(agent, task, context: str = "") -> list:
+    """(system, user) messages of a task, as CrewAI frames them"""
+    user_message = f"{task.description}\n\nThis is the expected criteria for your final answer: {task.expected_output}"
+    if context:
+        user_message += f"\n\nThis is the context you're working with:\n{context}"
+    return [
+        ("system", f"You are {agent.role}. {agent.backstory}\nYour personal goal is: {agent.goal}"),
+        ("human", user_message),
+    ]
+
+def task_prompts(vet_crew: VeterinaryCrew, user_query: str) -> dict:
+    """Rendered prompt of every task for one query"""
+    classification = vet_crew.classifier.classify(user_query)
+    knowledge = query_diseases(classification.refined_query, filters=classification.filters) if classification.needs_search else "BÚSQUEDA NO REQUERIDA"
+    classification_output = classification.to_text() # Both styles ask for the same lines
+    classification_context = classification.to_summary_text() if vet_crew.compact_prompts else classification_output # What the crew's later tasks read
+
+    prompts = {}
+    with vet_crew._pooled_crew("crew") as crew:
+        crew._interpolate_inputs(vet_crew._crew_inputs(user_query))
+        (classification_agent, retrieval_agent, specialist_agent), (classification_task, retrieval_task, specialist_task) = crew.agents, crew.tasks
+        prompts["classification"] = render(classification_agent, classification_task)
+        prompts["retrieval"] = render(retrieval_agent, retrieval_task, classification_output)
+        prompts["specialist_crew"] = render(specialist_agent, specialist_task, f"{classification_context}\n\n----------\n\n{knowledge}")
+
+    with vet_crew._pooled_crew("fast") as crew:
+        crew._interpolate_inputs(vet_crew._specialist_inputs(user_query, classification, None if knowledge == "BÚSQUEDA NO REQUERIDA" else knowledge))
+        prompts["specialist_fast"] = render(crew.agents[0], crew.tasks[0])
+
+    qc_agent = vet_crew.agent_manager.quality_control_agent()
+    qc_task = vet_crew.task_manager.quality_check_task(qc_agent, context=[])
+    prompts["quality_check"] = render(qc_agent, qc_task, f"{classification_context}\n\n----------\n\n{SAMPLE_RESPONSE}")
+    return prompts
+
+def measure_tokens(compact: bool, queries: list) -> dict:
+    """Mean prompt tokens per task and per pipeline mode"""
+    vet_crew = VeterinaryCrew(use_canned_responses=False, use_response_cache=False, compact_prompts=compact)
+    per_task = {}
+    for query in queries:
+        for name, messages in task_prompts(vet_crew, query).items():
+            per_task.setdefault(name, []).append(count_tokens(messages))
+    tasks = {name: statistics.mean(counts) for name, counts in per_task.items()}
+    return {
+        "tasks": tasks,
+        "modes": {mode: sum(tasks[name] for name in names) for mode, names in MODE_TASKS.items()},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt tokens (and optionally latency) of full vs compact prompts")
+    parser.add_argument("--live", action="store_true", help="Also run the pipelines against Groq (needs GROQ_API_KEY)")
+    parser.add_argument("--modes", nargs="+", default=list(VeterinaryCrew.PIPELINE_MODES), choices=VeterinaryCrew.PIPELINE_MODES, help="Pipeline modes for --live")
+    parser.add_argument("--pause", type=float, default=20.0, help="Seconds between live queries (rate limits)")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    retrieval_engine.warm_up()
+    report = {style: measure_tokens(style == "compact", QUERIES) for style in ("full", "compact")}
+    full, compact = report["full"], report["compact"]
+
+    print("\n" + "="*30)
+    print("PROMPT TOKENS (mean per query)")
+    print("="*30)
+    for section in ("tasks", "modes"):
+        for name in full[section]:
+            before, after = full[section][name], compact[section][name]
+            print(f"{name:<16} full {before:7.0f}   compact {after:7.0f}   saved {1 - after / before:6.1%}")
+        print()
+
+    if args.live:
+        report["live"] = {}
+        for mode in args.modes:
+            for style in ("full", "compact"):
+                summary = summarize(run_mode(mode, QUERIES, args.pause, compact_prompts=style == "compact"))
+                report["live"][f"{mode}/{style}"] = summary
+                print(f"{mode:<12} {style:<8} median {summary.get('median_seconds', float('nan')):6.2f} s   tokens {summary.get('mean_total_tokens', float('nan')):7.0f}   errors {summary['errors']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Retrieval quality and latency of query_diseases over a labelled query set (no LLM calls are made)
+
+Every query in retrieval_queries.json is labelled with the chunk_disease/chunk_category it should
+retrieve. Reports recall@k and MRR of the raw ranking, how many relevant chunks survive each
+distance threshold (query_diseases uses DISTANCE_THRESHOLD), and p50/p95/p99 latency and
+throughput of query_diseases at several concurrency levels (and of query_diseases_batch).
+
+The embedding cache is disabled by default so latencies include embedding the query. Use a
+separate --db-path when comparing embedding models (the knowledge base is indexed into it first).
+
+Usage (from the repository root):
+    python -m benchmarks.retrieval --output retrieval.json
+    python -m benchmarks.retrieval --filters --output retrieval_filtered.json
+    python -m benchmarks.retrieval --mode lexical
+    python -m benchmarks.retrieval --model intfloat/multilingual-e5-small --db-path ./vector_db_small
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import vector_db
+from vector_db import retrieval_engine, build_snapshot, query_diseases, query_diseases_batch, retrieve
+from query_router import extract_filters
+
+QUERIES_PATH = os.path.join(os.path.dirname(__file__), "retrieval_queries.json")
+RECALL_AT = (1, 3, 5, 10)
+THRESHOLDS = (0.10, 0.125, 0.15, 0.175, 0.20, 0.225, 0.25, 0.30)
+CONCURRENCY = (1, 8, 64)
+
+def load_queries(path: str) -> list:
+    with open(path, encoding="utf-8") as queries_file:
+        return json.load(queries_file)
+
+def rank_queries(queries: list, use_filters: bool = False) -> list:
+    """Ranked (disease, category, distance) hits per query and whether they're relevant, same search as query_diseases"""
+    if use_filters: # Filters differ per query, so each one is its own search
+        results = [retrieve(item["query"], filters=extract_filters(item["query"])) for item in queries]
+    else:
+        results = query_diseases_batch([item["query"] for item in queries])
+    return [
+        [(hit.disease, hit.category, hit.distance, hit.lexical_score is not None and hit.lexical_score >= vector_db.LEXICAL_MIN_SCORE) for hit in result.hits]
+        for result in results
+    ]
+
+def expected_rank(item: dict, hits: list):
+    """1-based rank of the expected chunk, None if it wasn't retrieved"""
+    for rank, (disease, category, _, _) in enumerate(hits, start=1):
+        if disease == item["disease"] and category == item["category"]:
+            return rank
+    return None
+
+def quality_report(queries: list, rankings: list) -> dict:
+    """recall@k, MRR and per-threshold precision/fallback figures"""
+    ranks = [expected_rank(item, hits) for item, hits in zip(queries, rankings)]
+    report = {
+        "recall_at": {str(k): sum(1 for rank in ranks if rank and rank <= k) / len(ranks) for k in RECALL_AT},
+        "mrr": sum(1 / rank for rank in ranks if rank) / len(ranks),
+        "not_ranked_first": [item["query"] for item, rank in zip(queries, ranks) if rank != 1],
+        "thresholds": {},
+    }
+
+    for threshold in THRESHOLDS:
+        # Strong keyword matches count as relevant at any threshold (hybrid/lexical modes)
+        passed = [[hit for hit in hits if (hit[2] is not None and hit[2] < threshold) or hit[3]] for hits in rankings]
+        expected_passed = sum(
+            1 for item, hits in zip(queries, passed)
+            if any(disease == item["disease"] and category == item["category"] for disease, category, _, _ in hits)
+        )
+        relevant_passed = sum(1 for item, hits in zip(queries, passed) for disease, _, _, _ in hits if disease == item["disease"])
+        total_passed = sum(len(hits) for hits in passed)
+        report["thresholds"][str(threshold)] = {
+            "expected_chunk_passed": expected_passed / len(queries), # Recall after thresholding
+            "same_disease_precision": relevant_passed / total_passed if total_passed else None, # Share of passed chunks about the right disease
+            "mean_chunks_passed": total_passed / len(queries), # Prompt size driver
+            "fallback_rate": sum(1 for hits in passed if not hits) / len(queries), # "bajos niveles de confianza" answers
+        }
+    return report
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def latency_report(queries: list, concurrency: int, repeat: int) -> dict:
+    """Latency percentiles and throughput of query_diseases with `concurrency` threads"""
+    texts = [item["query"] for item in queries] * repeat
+
+    def timed(query: str) -> float:
+        start = time.perf_counter()
+        query_diseases(query)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        timings = list(executor.map(timed, texts))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "queries": len(texts),
+        "p50_ms": percentile(timings, 0.50),
+        "p95_ms": percentile(timings, 0.95),
+        "p99_ms": percentile(timings, 0.99),
+        "throughput_qps": len(texts) / elapsed,
+    }
+
+def batch_report(queries: list, repeat: int) -> dict:
+    """Throughput of query_diseases_batch over the same queries"""
+    texts = [item["query"] for item in queries] * repeat
+    start = time.perf_counter()
+    query_diseases_batch(texts)
+    elapsed = time.perf_counter() - start
+    return {"queries": len(texts), "seconds": elapsed, "throughput_qps": len(texts) / elapsed}
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure query_diseases retrieval quality and latency")
+    parser.add_argument("--queries", default=QUERIES_PATH, help="Labelled query set (JSON)")
+    parser.add_argument("--model", help="Embedding model (defaults to vector_db.EMBEDDING_MODEL)")
+    parser.add_argument("--db-path", help="ChromaDB folder (use a separate one per embedding model)")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the query set per concurrency level")
+    parser.add_argument("--mode", choices=vector_db.RETRIEVAL_MODES, default=vector_db.RETRIEVAL_MODE, help="Vector, hybrid (vector + BM25) or lexical-only retrieval")
+    parser.add_argument("--filters", action="store_true", help="Restrict each search to the disease/category/species named in the query")
+    parser.add_argument("--embedding-cache", action="store_true", help="Keep the embedding cache enabled")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    # Configure the engine before anything opens it
+    if args.model:
+        retrieval_engine.model_name = args.model
+    if args.db_path:
+        retrieval_engine.db_path = args.db_path
+    if not args.embedding_cache:
+        retrieval_engine.cache_size = 0
+
+    vector_db.RETRIEVAL_MODE = args.mode # Used by query_diseases
+
+    # Quiet query_diseases' per-query INFO log while timing it
+    vector_db.logger.setLevel("WARNING")
+
+    if args.mode != "lexical": # Lexical-only retrieval never touches the model or the database
+        build_snapshot() # No-op if the index is up to date
+        retrieval_engine.warm_up()
+    queries = load_queries(args.queries)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "settings": {
+            "embedding_model": retrieval_engine.model_name,
+            "db_path": retrieval_engine.db_path,
+            "collection": retrieval_engine.active_collection_name,
+            "mode": args.mode,
+            "n_results": vector_db.N_RESULTS,
+            "distance_threshold": vector_db.DISTANCE_THRESHOLD,
+            "lexical_min_score": vector_db.LEXICAL_MIN_SCORE,
+            "embedding_cache": args.embedding_cache,
+            "filters": args.filters,
+            "queries": len(queries),
+        },
+        "quality": quality_report(queries, rank_queries(queries, args.filters)),
+        "latency": {str(concurrency): latency_report(queries, concurrency, args.repeat) for concurrency in CONCURRENCY},
+        "batch": batch_report(queries, args.repeat),
+    }
+
+    print("\n" + "="*30)
+    print("RETRIEVAL QUALITY")
+    print("="*30)
+    quality = report["quality"]
+    print("  ".join(f"recall@{k} {value:.2f}" for k, value in quality["recall_at"].items()) + f"  MRR {quality['mrr']:.3f}")
+    for threshold, figures in quality["thresholds"].items():
+        marker = " <- current" if float(threshold) == vector_db.DISTANCE_THRESHOLD else ""
+        precision = figures["same_disease_precision"]
+        print(
+            f"threshold {threshold:<6} expected passed {figures['expected_chunk_passed']:.2f}   "
+            f"precision {precision if precision is None else round(precision, 2)}   "
+            f"chunks {figures['mean_chunks_passed']:.1f}   fallback {figures['fallback_rate']:.2f}{marker}"
+        )
+
+    print("\n" + "="*30)
+    print("RETRIEVAL LATENCY")
+    print("="*30)
+    for concurrency, figures in report["latency"].items():
+        print(f"concurrency {concurrency:<3} p50 {figures['p50_ms']:8.1f} ms   p95 {figures['p95_ms']:8.1f} ms   p99 {figures['p99_ms']:8.1f} ms   {figures['throughput_qps']:7.1f} q/s")
+    print(f"batched         {report['batch']['queries']} queries in {report['batch']['seconds']:.2f} s   {report['batch']['throughput_qps']:7.1f} q/s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Cold start benchmark for the retrieval layer
+
+Runs every scenario in a fresh interpreter (so nothing is cached in sys.modules) and reports
+the median wall time. "eager" scenarios reproduce the old behaviour, where importing vector_db
+opened the ChromaDB client, loaded the embedding model and created the collection.
+
+Usage (from the repository root):
+    python -m benchmarks.startup --runs 5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each scenario prints its own elapsed time so interpreter startup isn't measured
+SCENARIOS = {
+    "import vector_db (lazy)": "import vector_db",
+    "import vector_db + warm up (eager)": "import vector_db; vector_db.retrieval_engine.warm_up()",
+    "import main (lazy)": "import main",
+    "import main + warm up (eager)": "import main, vector_db; vector_db.retrieval_engine.warm_up()",
+}
+
+TEMPLATE = """
+import time
+start = time.perf_counter()
+{statement}
+print(f"ELAPSED {{time.perf_counter() - start:.6f}}")
+"""
+
+def run_scenario(statement: str) -> float:
+    """Run a statement in a fresh interpreter and return its elapsed seconds"""
+    completed = subprocess.run(
+        [sys.executable, "-c", TEMPLATE.format(statement=statement)],
+        cwd=ROOT_DIR,
+        capture_output=True,
+        text=True
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith("ELAPSED "):
+            return float(line.split()[1])
+    raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "no output")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start of vector_db/main imports")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per scenario")
+    args = parser.parse_args()
+
+    print("\n" + "="*30)
+    print("COLD START BENCHMARK")
+    print("="*30)
+
+    for name, statement in SCENARIOS.items():
+        try:
+            timings = [run_scenario(statement) for _ in range(args.runs)]
+            print(f"{name:<40} median {statistics.median(timings)*1000:9.1f} ms   min {min(timings)*1000:9.1f} ms")
+        except Exception as e:
+            print(f"{name:<40} failed: {e}")
+
+if __name__ == "__main__":
+    main()
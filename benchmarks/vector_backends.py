@@ -0,0 +1,139 @@
+"""
+Chroma (HNSW) vs NumPy (exact search) retrieval backends at 1k, 10k and 100k chunks
+
+Random unit vectors with the e5-base dimension stand in for chunk embeddings (no model is
+loaded). Building and querying run in separate fresh interpreters so start-up cost and peak
+memory of each backend are measured on their own.
+
+Usage (from the repository root):
+    python -m benchmarks.vector_backends --sizes 1000 10000 100000 --output vector_backends.json
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIMENSION = 768 # multilingual-e5-base
+UPSERT_BATCH_SIZE = 5000 # Below Chroma's max batch size
+DISEASES = ["parvovirus", "ehrlichiosis", "gvd", "diabetes", "acl"]
+
+def random_vectors(count: int, seed: int):
+    import numpy as np
+    vectors = np.random.default_rng(seed).normal(size=(count, DIMENSION)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def open_engine(backend: str, path: str, dtype: str):
+    from vector_db import RetrievalEngine
+    return RetrievalEngine(db_path=path, collection_name="benchmark", backend=backend, vector_dtype=dtype, cache_size=0)
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # KiB on Linux
+
+def folder_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(folder, name)) for folder, _, names in os.walk(path) for name in names) / 1024 ** 2
+
+# ===================================================
+# WORKERS (run in a fresh interpreter, print one JSON line)
+# ===================================================
+def build_worker(backend: str, path: str, dtype: str, size: int) -> dict:
+    vectors = random_vectors(size, seed=0)
+    start = time.perf_counter()
+    collection = open_engine(backend, path, dtype).collection
+    for offset in range(0, size, UPSERT_BATCH_SIZE):
+        batch = vectors[offset:offset + UPSERT_BATCH_SIZE]
+        collection.upsert(
+            ids=[f"chunk_{offset + i}" for i in range(len(batch))],
+            embeddings=batch.tolist() if backend == "chroma" else batch,
+            documents=[f"passage: chunk {offset + i}" for i in range(len(batch))],
+            metadatas=[{"chunk_disease": DISEASES[(offset + i) % len(DISEASES)], "chunk_category": "overview"} for i in range(len(batch))],
+        )
+    return {"build_seconds": time.perf_counter() - start, "build_peak_rss_mb": peak_rss_mb()}
+
+def query_worker(backend: str, path: str, dtype: str, queries: int, n_results: int) -> dict:
+    query_vectors = random_vectors(queries, seed=1)
+
+    start = time.perf_counter()
+    collection = open_engine(backend, path, dtype).collection
+    collection.query(query_embeddings=query_vectors[:1].tolist(), n_results=n_results, include=["documents", "metadatas", "distances"])
+    startup_ms = (time.perf_counter() - start) * 1000
+
+    timings = []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[vector.tolist()], n_results=n_results, include=["documents", "metadatas", "distances"])
+        timings.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    collection.query(query_embeddings=query_vectors.tolist(), n_results=n_results, where={"chunk_disease": "gvd"}, include=["documents", "metadatas", "distances"])
+    filtered_ms = (time.perf_counter() - start) * 1000 / queries
+
+    timings.sort()
+    return {
+        "startup_ms": startup_ms, # Open collection + first query in a fresh interpreter
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[min(int(len(timings) * 0.95), len(timings) - 1)],
+        "batched_filtered_ms_per_query": filtered_ms,
+        "query_peak_rss_mb": peak_rss_mb(),
+    }
+
+def run_worker(*arguments) -> dict:
+    completed = subprocess.run([sys.executable, "-m", "benchmarks.vector_backends", "--worker", *map(str, arguments)], cwd=ROOT_DIR, capture_output=True, text=True)
+    for line in completed.stdout.splitlines():
+        if line.startswith("{"):
+            return json.loads(line)
+    raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "no output")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Chroma and NumPy retrieval backends")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Collection sizes")
+    parser.add_argument("--backends", nargs="+", default=["chroma", "numpy", "numpy-float16"], help="chroma, numpy and/or numpy-float16")
+    parser.add_argument("--queries", type=int, default=200, help="Timed queries per scenario")
+    parser.add_argument("--n-results", type=int, default=10, help="Chunks retrieved per query")
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--worker", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        kind, backend, path, dtype, *rest = args.worker
+        result = build_worker(backend, path, dtype, int(rest[0])) if kind == "build" else query_worker(backend, path, dtype, int(rest[0]), int(rest[1]))
+        print(json.dumps(result))
+        return
+
+    print("\n" + "="*30)
+    print("VECTOR BACKENDS")
+    print("="*30)
+
+    report = []
+    for size in args.sizes:
+        for name in args.backends:
+            backend, _, dtype = name.partition("-")
+            dtype = dtype or "float32"
+            path = tempfile.mkdtemp(prefix=f"vector_backend_{name}_")
+            try:
+                record = {"backend": name, "size": size}
+                record.update(run_worker("build", backend, path, dtype, size))
+                record["disk_mb"] = folder_mb(path)
+                record.update(run_worker("query", backend, path, dtype, args.queries, args.n_results))
+                print(
+                    f"{name:<14} {size:>7} chunks   build {record['build_seconds']:7.2f} s   startup {record['startup_ms']:8.1f} ms   "
+                    f"p50 {record['p50_ms']:7.2f} ms   p95 {record['p95_ms']:7.2f} ms   rss {record['query_peak_rss_mb']:7.1f} MB   disk {record['disk_mb']:7.1f} MB"
+                )
+            except Exception as e:
+                record["error"] = str(e)
+                print(f"{name:<14} {size:>7} chunks   failed: {e}")
+            finally:
+                shutil.rmtree(path, ignore_errors=True)
+            report.append(record)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import re
+import threading
+import logging
+from typing import Callable, Optional
+
+from rate_limiter import count_tokens
+from query_router import mentions, DISEASE_KEYWORDS, SPECIES_KEYWORDS
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Token budgets of the history sent with every request
+RECENT_TURNS_MAX_TOKENS = 600 # Recent turns kept word for word
+SUMMARY_MAX_TOKENS = 200 # Rolling summary of the turns that no longer fit
+MESSAGE_MAX_TOKENS = 250 # Longer messages (pasted case notes, long answers) are stored truncated
+
+# Longer queries always stand on their own
+FOLLOW_UP_MAX_WORDS = 6
+
+# Openings that lean on the previous question (matched after any leading "¿¡")
+FOLLOW_UP_CONJUNCTION_PATTERN = re.compile(r"^(y|e|o|pero|entonces|tambi[eé]n|adem[aá]s)\b") # "¿y en gatos?", may switch species
+FOLLOW_UP_REFERENCE_PATTERN = re.compile(r"^(eso|esa|ese|esos|esas|esto|esta|este|estos|estas|el|la|los|las|lo|su|sus|cu[aá]nt[oa]s?)\b") # "¿y la dosis?", "¿cuánto tiempo?"
+
+NO_HISTORY = "(sin historial)"
+
+# First sentence of an answer, for the extractive summary
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s")
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens tokens"""
+    text = " ".join(text.split())
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    return text[:len(text) * max_tokens // tokens].rstrip() + "…"
+
+def is_follow_up(query: str) -> bool:
+    """
+    Whether a query leans on the previous question ("¿y la dosis?", "¿eso es grave?")
+
+    Short standalone questions ("¿Qué es el parvovirus canino?", "Tengo dolor de cabeza") aren't:
+    a follow-up names no disease, opens with a conjunction ("y", "pero"...) or, if it names no
+    species either, with a reference to what was said ("eso", "la dosis", "¿cuánto...").
+    """
+    if len(query.split()) > FOLLOW_UP_MAX_WORDS or mentions(query, DISEASE_KEYWORDS):
+        return False
+    opening = query.lower().lstrip("¿¡\"' ")
+    if FOLLOW_UP_CONJUNCTION_PATTERN.match(opening):
+        return True
+    return not mentions(query, SPECIES_KEYWORDS) and FOLLOW_UP_REFERENCE_PATTERN.match(opening) is not None
+
+def extractive_summary(summary: str, turns: list) -> str:
+    """Default summarizer: the question and the first sentence of the answer of each turn (no LLM call)"""
+    lines = [summary] if summary else []
+    for user_message, assistant_message in turns:
+        first_sentence = SENTENCE_END_PATTERN.split(assistant_message.replace("⚠️", "").strip(), maxsplit=1)[0]
+        lines.append(f"- {truncate_tokens(user_message, 40)} → {truncate_tokens(first_sentence, 50)}")
+    return "\n".join(lines)
+
+# ===================================================
+# CONVERSATION MEMORY
+# ===================================================
+class ConversationMemory:
+    """
+    History of one chat, bounded by tokens no matter how long the conversation runs
+
+    The most recent turns are kept word for word within recent_max_tokens. Turns pushed out of
+    that window are folded into a rolling summary (summarizer(summary, turns) -> new summary),
+    which is itself cut to summary_max_tokens by dropping its oldest lines.
+    """
+
+    def __init__(self, recent_max_tokens: int = RECENT_TURNS_MAX_TOKENS, summary_max_tokens: int = SUMMARY_MAX_TOKENS, summarizer: Optional[Callable[[str, list], str]] = None):
+        self.recent_max_tokens = recent_max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.summarizer = summarizer or extractive_summary
+        self.summary = ""
+        self.turns = [] # (user message, assistant message, tokens), oldest first
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    def add_turn(self, user_message: str, assistant_message: str):
+        """Record a question and its answer, summarizing the oldest turns if over budget"""
+        user_message = truncate_tokens(user_message, MESSAGE_MAX_TOKENS)
+        assistant_message = truncate_tokens(assistant_message, MESSAGE_MAX_TOKENS)
+        with self._lock:
+            self.turns.append((user_message, assistant_message, count_tokens(self._render_turn(user_message, assistant_message))))
+            evicted = []
+            while len(self.turns) > 1 and sum(tokens for _, _, tokens in self.turns) > self.recent_max_tokens:
+                user_text, assistant_text, _ = self.turns.pop(0)
+                evicted.append((user_text, assistant_text))
+            if evicted:
+                self._fold(evicted)
+
+    def _fold(self, turns: list):
+        try:
+            summary = self.summarizer(self.summary, turns)
+        except Exception as e: # A failed LLM summary falls back to the extractive one
+            logger.error(f"Error summarizing conversation: {str(e)}")
+            summary = extractive_summary(self.summary, turns)
+
+        # Rolling: the oldest lines go first when the summary outgrows its budget
+        lines = summary.splitlines()
+        while len(lines) > 1 and count_tokens("\n".join(lines)) > self.summary_max_tokens:
+            lines.pop(0)
+        self.summary = truncate_tokens("\n".join(lines), self.summary_max_tokens) if len(lines) == 1 else "\n".join(lines)
+
+    def context(self) -> str:
+        """History text for the prompts (summary and recent turns)"""
+        with self._lock:
+            if not self.turns and not self.summary:
+                return NO_HISTORY
+            sections = []
+            if self.summary:
+                sections.append(f"Resumen de turnos anteriores:\n{self.summary}")
+            sections.extend(self._render_turn(user_message, assistant_message) for user_message, assistant_message, _ in self.turns)
+            return "\n".join(sections)
+
+    def contextualize(self, query: str) -> str:
+        """Standalone version of a follow-up for classification, search and caching (previous question + query)"""
+        with self._lock:
+            if not self.turns or not is_follow_up(query):
+                return query
+            return f"{self.turns[-1][0]} {query}"
+
+    def cache_key(self, query: str) -> Optional[str]:
+        """
+        Key of the query's answer in a response cache shared by every chat (None if it depends on this one)
+
+        With history, only questions that stand on their own and name a disease or species are cached:
+        the answer to "¿Es contagioso?" after a parvovirus question must not answer another chat.
+        """
+        with self._lock:
+            if not self.turns and not self.summary:
+                return query
+        if is_follow_up(query) or not (mentions(query, DISEASE_KEYWORDS) or mentions(query, SPECIES_KEYWORDS)):
+            return None
+        return query
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self.turns = []
+
+    @staticmethod
+    def _render_turn(user_message: str, assistant_message: str) -> str:
+        return f"Usuario: {user_message}\nAsistente: {assistant_message}"
@@ -0,0 +1,250 @@
+import os
+import json
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+import numpy as np
+
+from tracing import tracer
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# ===================================================
+# ON-DISK EMBEDDING CACHE
+# ===================================================
+class EmbeddingCache:
+    """
+    Content-addressed embedding store for one model
+
+    Vectors live in a memory-mapped float32 matrix (one row per cached text) and an append-only
+    log maps each key to its row. When the cache is full the least recently used row is reused.
+    The matrix shape is kept in a meta file, a cache built with another size or vector width is
+    discarded. The files are meant to be written by a single process at a time, other processes
+    can open them read_only (cached vectors are served, new ones aren't stored).
+    """
+
+    VECTORS_FILE = "vectors.f32"
+    INDEX_FILE = "index.log"
+    META_FILE = "meta.json"
+
+    def __init__(self, cache_dir: str, model_name: str, max_entries: int = 20000, read_only: bool = False):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.read_only = read_only
+        # One sub-folder per model, since vector sizes differ between models
+        self.path = os.path.join(cache_dir, model_name.replace("/", "__"))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict() # key -> row, least recently used first
+        self._free_rows = []
+        self._vectors = None
+        self._dim = None
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def key(self, text: str) -> str:
+        """Cache key for a (prefixed) text embedded with this cache's model"""
+        return hashlib.sha256(f"{self.model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Return a copy of the cached vector, or None on a miss"""
+        with self._lock:
+            row = self._entries.get(key)
+            if row is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return np.array(self._vectors[row], dtype=np.float32)
+
+    def put_many(self, keys: list, vectors: list):
+        """Store vectors, evicting least recently used entries when the cache is full"""
+        if self.max_entries <= 0 or self.read_only:
+            return
+        with self._lock:
+            if self._vectors is None:
+                self._open_vectors(len(vectors[0]))
+
+            assigned = {} # key -> (row, vector)
+            evicted_rows = []
+            for key, vector in zip(keys, vectors):
+                if key in self._entries or key in assigned:
+                    continue
+                if not self._free_rows and not self._entries: # Batch larger than the cache
+                    break
+                if self._free_rows:
+                    row = self._free_rows.pop()
+                else:
+                    _, row = self._entries.popitem(last=False)
+                    self.evictions += 1
+                    evicted_rows.append(row)
+                assigned[key] = (row, vector)
+
+            if not assigned:
+                return
+            # Reused rows are released in the log before they're overwritten, so a crash in
+            # between leaves them unowned rather than mapping the evicted keys to new vectors
+            if evicted_rows:
+                self._append_log([f"- {row}\n" for row in evicted_rows])
+            for key, (row, vector) in assigned.items():
+                self._vectors[row] = vector
+                self._entries[key] = row
+            self._vectors.flush()
+            self._append_log([f"{key} {row}\n" for key, (row, _) in assigned.items()])
+
+            # Superseded lines pile up as rows get reused, rewrite the log once it doubles
+            if self._log_lines > 2 * self.max_entries:
+                self._compact()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "read_only": self.read_only,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _open_vectors(self, dim: int, mode: str = "w+"):
+        """Create (or open) the memory-mapped vector matrix"""
+        os.makedirs(self.path, exist_ok=True)
+        self._dim = dim
+        self._vectors = np.memmap(os.path.join(self.path, self.VECTORS_FILE), dtype=np.float32, mode=mode, shape=(self.max_entries, dim))
+        if mode == "w+": # New matrix, record its shape for the next load
+            with open(os.path.join(self.path, self.META_FILE), "w", encoding="utf-8") as meta_file:
+                json.dump({"dim": dim, "max_entries": self.max_entries}, meta_file)
+        used_rows = set(self._entries.values())
+        self._free_rows = [row for row in range(self.max_entries - 1, -1, -1) if row not in used_rows]
+
+    def _load(self):
+        """Replay the index log over an existing vectors file"""
+        vectors_path = os.path.join(self.path, self.VECTORS_FILE)
+        index_path = os.path.join(self.path, self.INDEX_FILE)
+        meta_path = os.path.join(self.path, self.META_FILE)
+        if self.max_entries <= 0 or not os.path.exists(vectors_path) or not os.path.exists(index_path):
+            return
+
+        try:
+            # The row width can't be inferred from the file size once max_entries changes
+            with open(meta_path, encoding="utf-8") as meta_file:
+                meta = json.load(meta_file)
+            dim, max_entries = int(meta["dim"]), int(meta["max_entries"])
+            if max_entries != self.max_entries:
+                raise ValueError(f"built for {max_entries} entries, configured for {self.max_entries}")
+            if dim <= 0 or os.path.getsize(vectors_path) != max_entries * dim * 4:
+                raise ValueError("vectors file doesn't match its recorded shape")
+
+            owners = {} # row -> key (a reused row belongs to the last key logged for it)
+            with open(index_path, encoding="utf-8") as index_file:
+                for line in index_file:
+                    self._log_lines += 1
+                    key, row = line.split()
+                    row = int(row)
+                    if row >= self.max_entries:
+                        continue
+                    previous_key = owners.pop(row, None)
+                    if previous_key is not None:
+                        self._entries.pop(previous_key, None)
+                    if key == "-": # Row released before being reused
+                        continue
+                    self._entries.pop(key, None)
+                    owners[row] = key
+                    self._entries[key] = row
+
+            self._open_vectors(dim, mode="r" if self.read_only else "r+")
+            logger.info(f"Loaded embedding cache: {len(self._entries)} entries from {self.path}")
+        except Exception as e:
+            self._entries.clear()
+            self._log_lines = 0
+            if self.read_only: # Left for its writer to discard
+                logger.warning(f"Ignoring unreadable embedding cache at {self.path}: {str(e)}")
+                return
+            logger.warning(f"Discarding unreadable embedding cache at {self.path}: {str(e)}")
+            for path in (index_path, vectors_path, meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _append_log(self, lines: list):
+        """Append lines to the index log and flush them to disk"""
+        with open(os.path.join(self.path, self.INDEX_FILE), "a", encoding="utf-8") as index_file:
+            index_file.writelines(lines)
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        self._log_lines += len(lines)
+
+    def _compact(self):
+        """Rewrite the index log with one line per live entry (in LRU order)"""
+        index_path = os.path.join(self.path, self.INDEX_FILE)
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as index_file:
+            index_file.writelines(f"{key} {row}\n" for key, row in self._entries.items())
+        os.replace(tmp_path, index_path)
+        self._log_lines = len(self._entries)
+
+class CachedEmbeddingFunction:
+    """
+    Embedding function that serves repeated texts from an EmbeddingCache
+
+    The wrapped embedding function is created through a factory on the first cache miss,
+    so fully cached workloads never load the transformer.
+    """
+
+    def __init__(self, factory, model_name: str, cache: EmbeddingCache):
+        self.factory = factory
+        self.model_name = model_name
+        self.cache = cache
+        self._embedding_function = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the wrapped embedding function (the model) was created"""
+        return self._embedding_function is not None
+
+    @property
+    def inner(self):
+        """Wrapped (uncached) embedding function"""
+        if self._embedding_function is None:
+            with self._lock:
+                if self._embedding_function is None:
+                    self._embedding_function = self.factory()
+        return self._embedding_function
+
+    def __call__(self, input: list) -> list:
+        texts = list(input)
+        keys = [self.cache.key(text) for text in texts]
+        vectors = [self.cache.get(key) for key in keys]
+
+        # Embed each missing text once, even if repeated in the batch
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], texts[i])
+
+        tracer.count("embedding_cache_lookups_total", len(texts) - len(missing), result="hit")
+        if missing:
+            tracer.count("embedding_cache_lookups_total", len(missing), result="miss")
+            with tracer.span("embedding", model=self.model_name, texts=len(texts), computed=len(missing)):
+                computed = self.inner(list(missing.values()))
+            computed = [np.asarray(vector, dtype=np.float32) for vector in computed]
+            self.cache.put_many(list(missing.keys()), computed)
+            by_key = dict(zip(missing.keys(), computed))
+            vectors = [by_key[keys[i]] if vector is None else vector for i, vector in enumerate(vectors)]
+
+        return vectors
+
+    def embed_query(self, input: list) -> list:
+        return self(input)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
@@ -0,0 +1,267 @@
+import os
+import json
+import hashlib
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Supported source documents
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".html", ".htm", ".txt", ".md")
+
+# Chunking settings (characters)
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 150
+MIN_CHUNK_LENGTH = 50 # Shorter chunks (page numbers, headers) are dropped
+
+# Chunks buffered before they're embedded and upserted (several files share embedding batches)
+FLUSH_SIZE = 256
+
+# Progress of previous runs (files already ingested, by size and modification time)
+MANIFEST_FILE = "manifest.json"
+
+# Labels for chunks whose text doesn't name a known disease/category
+DEFAULT_DISEASE = "general"
+DEFAULT_CATEGORY = "overview"
+
+# ===================================================
+# EXTRACTION AND CHUNKING (run in worker processes)
+# ===================================================
+def extract_pages(path: str) -> list:
+    """(page number, text) pairs of a document (single page for non-PDF formats)"""
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == ".pdf":
+        try:
+            import pdfplumber
+            with pdfplumber.open(path) as pdf:
+                return [(number, page.extract_text() or "") for number, page in enumerate(pdf.pages, start=1)]
+        except Exception as e: # Some PDFs break pdfplumber's layout analysis, pypdf is more lenient
+            logger.warning(f"pdfplumber failed on {path}, retrying with pypdf: {str(e)}")
+            from pypdf import PdfReader
+            return [(number, page.extract_text() or "") for number, page in enumerate(PdfReader(path).pages, start=1)]
+
+    if extension == ".docx":
+        import docx
+        document = docx.Document(path)
+        paragraphs = [paragraph.text for paragraph in document.paragraphs]
+        for table in document.tables:
+            paragraphs.extend(" | ".join(cell.text for cell in row.cells) for row in table.rows)
+        return [(1, "\n".join(paragraphs))]
+
+    if extension in (".html", ".htm"):
+        from bs4 import BeautifulSoup
+        with open(path, encoding="utf-8", errors="ignore") as html_file:
+            soup = BeautifulSoup(html_file.read(), "html.parser")
+        for element in soup(["script", "style", "nav", "footer"]):
+            element.decompose()
+        return [(1, soup.get_text("\n"))]
+
+    with open(path, encoding="utf-8", errors="ignore") as text_file:
+        return [(1, text_file.read())]
+
+def label_chunk(text: str, document_filters) -> tuple:
+    """(disease, category, species) named in the chunk, falling back to the document's"""
+    from query_router import extract_filters
+
+    filters = extract_filters(text)
+    disease = (filters and filters.disease) or (document_filters and document_filters.disease) or DEFAULT_DISEASE
+    category = (filters and filters.category) or DEFAULT_CATEGORY
+    species = (filters and filters.species) or (document_filters and document_filters.species)
+    return disease, category, species
+
+def document_id(path: str) -> str:
+    """Short ID of a document from its absolute path (same file name in two folders, two documents)"""
+    return hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+
+def process_file(path: str, source: str, chunk_size: int, chunk_overlap: int) -> list:
+    """Extract, chunk and label one document (source is the name cited in answers)"""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from query_router import extract_filters
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, separators=["\n\n", "\n", ". ", " ", ""])
+    pages = extract_pages(path)
+    # Disease/species named in the document's title and first page, used when a chunk doesn't name one
+    document_filters = extract_filters(f"{os.path.basename(path)}\n{pages[0][1][:2000] if pages else ''}")
+    source_id = document_id(path)
+
+    chunks = []
+    for page_number, text in pages:
+        for index, content in enumerate(splitter.split_text(text)):
+            content = " ".join(content.split())
+            if len(content) < MIN_CHUNK_LENGTH:
+                continue
+            disease, category, species = label_chunk(content, document_filters)
+            chunk = {
+                "id": f"doc_{source_id}_{page_number}_{index}",
+                "content": content,
+                "disease": disease,
+                "category": category,
+                "source": source,
+                "page": page_number,
+            }
+            if species:
+                chunk["species"] = species
+            chunks.append(chunk)
+    return chunks
+
+# ===================================================
+# INGESTION (main process)
+# ===================================================
+def _file_signature(path: str) -> dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+def _write_json_atomic(path: str, data, lines: bool = False):
+    """Write to a temporary file and rename it, so an interrupted run never leaves a half-written file"""
+    with open(f"{path}.tmp", "w", encoding="utf-8") as output_file:
+        if lines:
+            output_file.writelines(json.dumps(item, ensure_ascii=False) + "\n" for item in data)
+        else:
+            json.dump(data, output_file, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def find_documents(root: str) -> list:
+    """Supported files under root, in a stable order"""
+    paths = []
+    for folder, _, names in os.walk(root):
+        paths.extend(os.path.join(folder, name) for name in names if name.lower().endswith(SUPPORTED_EXTENSIONS))
+    return sorted(paths)
+
+def ingest_directory(root: str, workers: int = None, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP, flush_size: int = FLUSH_SIZE, force: bool = False) -> dict:
+    """
+    Ingest every supported document under root into the collection
+
+    Files are extracted and chunked in a process pool while the main process embeds and
+    upserts the chunks in bulk. A file is recorded in the manifest only once all its chunks
+    are stored, so an interrupted run resumes with the files that were still pending, and
+    unchanged files are skipped on later runs (force re-ingests everything). Documents are
+    tracked by absolute path, so several folders can be ingested; those ingested from root
+    earlier but no longer found under it are removed with their chunks.
+
+    Returns:
+        Counts of files ingested, skipped, failed and removed, and of chunks stored and removed
+    """
+    from vector_db import retrieval_engine, insert_diseases
+
+    chunks_path = retrieval_engine.ingested_chunks_path
+    os.makedirs(chunks_path, exist_ok=True)
+    manifest_path = os.path.join(chunks_path, MANIFEST_FILE)
+    root_path = os.path.join(os.path.abspath(root), "")
+    manifest = {} # absolute path -> signature, chunk count and chunk file
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+
+    counts = {"files_ingested": 0, "files_skipped": 0, "files_failed": 0, "files_removed": 0, "chunks_stored": 0, "chunks_removed": 0}
+    pending_paths = []
+    found_paths = set()
+    for path in find_documents(root):
+        path = os.path.abspath(path)
+        found_paths.add(path)
+        if not force and manifest.get(path, {}).get("signature") == _file_signature(path):
+            counts["files_skipped"] += 1
+        else:
+            pending_paths.append((path, os.path.relpath(path, root_path)))
+
+    # Documents deleted from the folder since the last run (those of other folders are left alone)
+    deleted_paths = [path for path in manifest if path.startswith(root_path) and path not in found_paths]
+    for path in deleted_paths:
+        chunk_file = os.path.join(chunks_path, manifest.pop(path)["chunk_file"])
+        counts["chunks_removed"] += _remove_stale_chunks(chunk_file, set())
+        if os.path.exists(chunk_file):
+            os.remove(chunk_file)
+        counts["files_removed"] += 1
+    if deleted_paths:
+        _write_json_atomic(manifest_path, manifest)
+        logger.info(f"Removed {len(deleted_paths)} deleted documents ({counts['chunks_removed']} chunks)")
+    logger.info(f"Ingesting {len(pending_paths)} documents from {root} ({counts['files_skipped']} unchanged)")
+
+    buffer = {} # chunk ID -> chunk data, not stored yet
+    buffered_files = [] # (path, source, chunks) whose chunks are all in the buffer
+
+    def flush():
+        if not buffered_files:
+            return
+        result = insert_diseases(dict(buffer))
+        failed = result["failed"] > 0
+        for path, source, chunks in buffered_files:
+            if failed: # Not recorded in the manifest, so the next run retries it (stored chunks are skipped by hash)
+                counts["files_failed"] += 1
+                continue
+            chunk_file = os.path.join(chunks_path, f"{document_id(path)}.jsonl")
+            counts["chunks_removed"] += _remove_stale_chunks(chunk_file, {chunk["id"] for chunk in chunks})
+            _write_json_atomic(chunk_file, chunks, lines=True)
+            manifest[path] = {"signature": _file_signature(path), "chunks": len(chunks), "chunk_file": os.path.basename(chunk_file)}
+            counts["files_ingested"] += 1
+        if not failed:
+            counts["chunks_stored"] += len(buffer)
+            _write_json_atomic(manifest_path, manifest)
+        buffer.clear()
+        buffered_files.clear()
+
+    # Bounded number of files in flight, so thousands of pages are streamed rather than held in memory
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        remaining = iter(pending_paths)
+        in_flight = {}
+        while True:
+            while len(in_flight) < workers * 2:
+                next_file = next(remaining, None)
+                if next_file is None:
+                    break
+                in_flight[executor.submit(process_file, next_file[0], next_file[1], chunk_size, chunk_overlap)] = next_file
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, source = in_flight.pop(future)
+                try:
+                    chunks = future.result()
+                except Exception as e: # A broken file doesn't stop the others
+                    counts["files_failed"] += 1
+                    logger.error(f"Error processing {source}: {str(e)}")
+                    continue
+                logger.info(f"Extracted {len(chunks)} chunks from {source}")
+                buffer.update({chunk["id"]: {key: value for key, value in chunk.items() if key != "id"} for chunk in chunks})
+                buffered_files.append((path, source, chunks))
+                if len(buffer) >= flush_size:
+                    flush()
+        flush()
+
+    logger.info(f"Ingestion finished: {counts}")
+    return counts
+
+def _remove_stale_chunks(chunk_file: str, current_ids: set) -> int:
+    """Delete chunks a previous version of the document had but this one doesn't"""
+    from vector_db import retrieval_engine
+
+    if not os.path.exists(chunk_file):
+        return 0
+    previous_ids = set()
+    with open(chunk_file, encoding="utf-8") as previous_file:
+        for line in previous_file:
+            previous_ids.add(json.loads(line)["id"])
+    stale_ids = sorted(previous_ids - current_ids)
+    if stale_ids:
+        retrieval_engine.collection.delete(ids=stale_ids)
+        for chunk_id in stale_ids:
+            retrieval_engine.lexical_index.remove(chunk_id)
+        retrieval_engine.index_generation += 1 # Cached answers may cite the removed chunks
+    return len(stale_ids)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest veterinary manuals (PDF, DOCX, HTML, TXT) into the knowledge base")
+    parser.add_argument("directory", help="Folder with the documents (searched recursively)")
+    parser.add_argument("--workers", type=int, help="Extraction processes (defaults to the CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Max characters per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP, help="Characters shared by consecutive chunks")
+    parser.add_argument("--flush-size", type=int, default=FLUSH_SIZE, help="Chunks buffered before embedding and upserting")
+    parser.add_argument("--force", action="store_true", help="Re-ingest every file, even unchanged ones")
+    args = parser.parse_args()
+
+    ingest_directory(args.directory, workers=args.workers, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap, flush_size=args.flush_size, force=args.force)
@@ -0,0 +1,158 @@
+import re
+import math
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# BM25 parameters (standard defaults)
+BM25_K1 = 1.5 # Term frequency saturation
+BM25_B = 0.75 # Document length normalization
+
+# Reciprocal rank fusion constant (60 is the value from the original RRF paper)
+RRF_K = 60
+
+SPANISH_STOPWORDS = {
+    "a", "al", "algo", "como", "con", "cual", "cuales", "cuando", "de", "del", "donde", "el", "ella", "en",
+    "entre", "es", "esta", "este", "esto", "hay", "la", "las", "le", "les", "lo", "los", "mas", "me", "mi",
+    "mis", "muy", "no", "o", "para", "pero", "por", "que", "se", "si", "sin", "sobre", "su", "sus", "te",
+    "tiene", "tu", "un", "una", "uno", "unos", "unas", "y", "ya", "yo", "puede", "son", "ser",
+}
+
+# Stripped in order, each only if a stem of at least MIN_STEM_LENGTH characters is left: the plural
+# ("es" after a consonant, "s" after a vowel), then the longest derivational suffix or else the gender vowel
+DERIVATIONAL_SUFFIXES = (
+    "amiento", "imiento", "acion", "ucion", "idad", "mente", "ismo", "ista",
+    "able", "ible", "oso", "osa", "ivo", "iva", "ico", "ica",
+)
+GENDER_VOWELS = ("a", "o", "e")
+VOWELS = "aeiou"
+MIN_STEM_LENGTH = 4
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# ===================================================
+# TEXT PROCESSING
+# ===================================================
+def fold(text: str) -> str:
+    """Lowercase without accents (ñ becomes n, ü becomes u)"""
+    return "".join(char for char in unicodedata.normalize("NFD", text.lower()) if unicodedata.category(char) != "Mn")
+
+def _strip(token: str, suffix: str) -> Optional[str]:
+    if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM_LENGTH:
+        return token[:-len(suffix)]
+    return None
+
+def stem(token: str) -> str:
+    """Light Spanish stemmer: singular and plural, masculine and feminine forms share a stem (perro, perros, perra → perr)"""
+    if token.endswith("es") and len(token) > 2 and token[-3] not in VOWELS:
+        token = _strip(token, "es") or token
+    elif token.endswith("s") and len(token) > 1 and token[-2] in VOWELS:
+        token = _strip(token, "s") or token
+
+    for suffix in DERIVATIONAL_SUFFIXES:
+        stemmed = _strip(token, suffix)
+        if stemmed is not None:
+            return stemmed
+    for vowel in GENDER_VOWELS:
+        stemmed = _strip(token, vowel)
+        if stemmed is not None:
+            return stemmed
+    return token
+
+def tokenize(text: str) -> List[str]:
+    """Folded, stemmed terms without stopwords"""
+    return [stem(token) for token in TOKEN_PATTERN.findall(fold(text)) if token not in SPANISH_STOPWORDS]
+
+# ===================================================
+# BM25 INDEX
+# ===================================================
+class BM25Index:
+    """
+    In-memory inverted index ranking documents with BM25
+
+    Documents are replaced when added again under the same ID. Each document keeps its text
+    and metadata so lexical-only searches can be answered without the vector database.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = {} # term -> {doc_id: term frequency}
+        self.lengths: Dict[str, int] = {} # doc_id -> number of terms
+        self.documents: Dict[str, Tuple[str, dict]] = {} # doc_id -> (content, metadata)
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, doc_id: str, content: str, metadata: dict = None):
+        """Index (or re-index) one document"""
+        with self._lock:
+            self.remove(doc_id)
+            terms = Counter(tokenize(content))
+            for term, frequency in terms.items():
+                self.postings.setdefault(term, {})[doc_id] = frequency
+            length = sum(terms.values())
+            self.lengths[doc_id] = length
+            self._total_length += length
+            self.documents[doc_id] = (content, metadata or {})
+
+    def remove(self, doc_id: str):
+        """Drop a document (no-op if it isn't indexed)"""
+        with self._lock:
+            if doc_id not in self.documents:
+                return
+            for term in set(tokenize(self.documents[doc_id][0])):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self.postings[term]
+            self._total_length -= self.lengths.pop(doc_id)
+            del self.documents[doc_id]
+
+    def search(self, query: str, n_results: int = 10, where=None) -> List[Tuple[str, float]]:
+        """
+        Best matching documents for a query
+
+        Args:
+            query: Free text
+            n_results: Max documents returned
+            where: Optional callable taking a document's metadata, documents it rejects are skipped
+
+        Returns:
+            (doc_id, BM25 score) pairs, best first (documents sharing no term are left out)
+        """
+        with self._lock:
+            if not self.documents:
+                return []
+            average_length = self._total_length / len(self.documents) or 1.0
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (len(self.documents) - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    if where is not None and not where(self.documents[doc_id][1]):
+                        continue
+                    normalization = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + normalization)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
+
+    def get(self, doc_id: str) -> Optional[Tuple[str, dict]]:
+        """(content, metadata) of a document"""
+        return self.documents.get(doc_id)
+
+# ===================================================
+# RANK FUSION
+# ===================================================
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Merge ranked ID lists: each list adds 1 / (k + rank) to the IDs it contains"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -1,20 +1,163 @@
 import os
-from typing import List, Dict
-from crewai import Agent, Task, Crew, Process
+import re
+import time
+import queue
+import asyncio
+import weakref
+import contextvars
+from functools import lru_cache
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Iterator, Optional, Type, Union
+from crewai import Agent, Task, Crew, Process, LLM
+from crewai.tools import BaseTool
+from crewai.tasks.task_output import TaskOutput
+from crewai.agents.agent_builder.utilities.base_token_process import TokenProcess
+from pydantic import BaseModel, Field
 from langchain_groq import ChatGroq
-from vector_db import query_diseases
+from vector_db import query_diseases, retrieve, format_retrieval, query_similarity, retrieval_engine, knowledge_base_version, RetrievalFilter, DISEASE_SPECIES
+from response_cache import SemanticResponseCache
+from tracing import tracer
+from conversation_memory import ConversationMemory, NO_HISTORY
+from rate_limiter import RateLimitScheduler, estimate_tokens, ESTIMATED_COMPLETION_TOKENS
+from query_router import (
+    LocalQueryClassifier,
+    CannedResponseRouter,
+    QueryClassification,
+    parse_classification,
+    extract_filters,
+    VETERINARIA,
+    SISTEMA,
+    FUERA_DE_ALCANCE,
+    GREETING_RESPONSE,
+    FAREWELL_RESPONSE,
+    THANKS_RESPONSE,
+    OUT_OF_SCOPE_RESPONSE,
+)
 import logging
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Groq LLM
-llm = ChatGroq(
-    model="groq/llama-3.3-70b-versatile",
-    temperature=0.3,
-    api_key=os.getenv("GROQ_API_KEY")
-)
+# Shared client-side pacing of every Groq call (CrewAI agents and direct calls)
+groq_scheduler = RateLimitScheduler()
+
+# Token usage of an LLM call, reported to its tracing span and counters
+def report_llm_tokens(prompt_tokens: int, completion_tokens: int, estimated: bool = False) -> Optional[int]:
+    """Record prompt/completion tokens of the current LLM call, returns their total (None if unknown)"""
+    if prompt_tokens is None or completion_tokens is None:
+        return None
+    tracer.annotate(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, tokens_estimated=estimated)
+    tracer.count("llm_tokens_total", prompt_tokens, kind="prompt")
+    tracer.count("llm_tokens_total", completion_tokens, kind="completion")
+    return prompt_tokens + completion_tokens
+
+def message_usage(message) -> Optional[int]:
+    """Total tokens of a LangChain chat message (provider counts), None if it carries no usage"""
+    usage = message.usage_metadata or {}
+    return report_llm_tokens(usage.get("input_tokens"), usage.get("output_tokens"))
+
+class ScheduledLLM(LLM):
+    """CrewAI LLM whose calls wait for quota in groq_scheduler and retry 429 errors with backoff"""
+
+    def call(self, messages, *args, **kwargs):
+        prompt_tokens = estimate_tokens(messages)
+        return groq_scheduler.call(
+            lambda: super(ScheduledLLM, self).call(messages, *args, **kwargs),
+            estimated_tokens=prompt_tokens + ESTIMATED_COMPLETION_TOKENS,
+            usage=lambda response: report_llm_tokens(prompt_tokens, estimate_tokens(str(response)), estimated=True) # call() only returns the text
+        )
+
+# Groq LLMs, built on first use so the stub backend (and importing this module) needs no GROQ_API_KEY
+# CrewAI converts a ChatGroq into its own (LiteLLM based) LLM with these same settings,
+# building that LLM directly lets the scheduler wrap the calls CrewAI actually makes
+GROQ_MODEL = "llama-3.3-70b-versatile"
+
+@lru_cache(maxsize=None)
+def groq_llms() -> tuple:
+    """(CrewAI LLM for the agents, LangChain ChatGroq for direct specialist calls), shared by every Groq crew"""
+    agent_llm = ScheduledLLM(
+        model=f"groq/{GROQ_MODEL}", # LiteLLM needs the provider prefix
+        temperature=0.3,
+        api_key=os.getenv("GROQ_API_KEY")
+    )
+    # Same model called directly through LangChain (token streaming and async calls of the specialist)
+    chat_llm = ChatGroq(
+        model=GROQ_MODEL,
+        temperature=0.3,
+        api_key=os.getenv("GROQ_API_KEY")
+    )
+    return agent_llm, chat_llm
+
+# ===================================================
+# LLM BACKENDS
+# ===================================================
+LLM_BACKEND = os.getenv("VET_LLM_BACKEND", "groq") # "groq", or "stub" (scripted local answers, for load tests without the network or an API key)
+
+# Quotas of the stub's scheduler, calls still queue through one so its overhead is measured too
+STUB_QUOTA = 10**12
+
+class LLMBackend:
+    """LLMs a crew calls: llm for the CrewAI agents, chat_llm for direct specialist calls, and the scheduler pacing them"""
+
+    def __init__(self, name: str, llm, chat_llm, scheduler: RateLimitScheduler):
+        self.name = name
+        self.llm = llm
+        self.chat_llm = chat_llm
+        self.scheduler = scheduler
+
+def _groq_backend() -> LLMBackend:
+    """Shared Groq LLMs and module-level scheduler"""
+    agent_llm, chat_llm = groq_llms()
+    return LLMBackend("groq", agent_llm, chat_llm, groq_scheduler)
+
+def _stub_backend(**settings) -> LLMBackend:
+    """
+    Scripted local LLMs (stub_llm), a new pair per call
+
+    settings: latency (distribution spec such as "lognormal:0.8,0.5"), token_latency,
+    response_tokens and seed, defaulting to the VET_STUB_* environment variables
+    """
+    from stub_llm import create_stub_llms # Deferred, only load tests and benchmarks use it
+    agent_llm, chat_llm = create_stub_llms(**settings)
+    return LLMBackend("stub", agent_llm, chat_llm, RateLimitScheduler(STUB_QUOTA, STUB_QUOTA, STUB_QUOTA, STUB_QUOTA))
+
+# Backend factories by name, register_llm_backend adds others (another provider, a recorded replay...)
+LLM_BACKEND_FACTORIES = {
+    "groq": _groq_backend,
+    "stub": _stub_backend,
+}
+
+def register_llm_backend(name: str, factory: Callable[..., LLMBackend]):
+    """Make a backend available to create_llm_backend/VeterinaryCrew(llm_backend=name)"""
+    LLM_BACKEND_FACTORIES[name] = factory
+
+def create_llm_backend(name: str = LLM_BACKEND, **settings) -> LLMBackend:
+    """Backend built by the factory registered under name (settings are passed on to it)"""
+    factory = LLM_BACKEND_FACTORIES.get(name)
+    if factory is None:
+        raise ValueError(f"Unknown LLM backend '{name}', expected one of {tuple(LLM_BACKEND_FACTORIES)}")
+    return factory(**settings)
+
+# ===================================================
+# TOOLS DEFINITION
+# ===================================================
+class SearchInput(BaseModel):
+    """Input schema for knowledge base search"""
+    query: str = Field(..., description="Consulta refinada sobre enfermedades, síntomas, diagnósticos o tratamientos veterinarios")
+    enfermedad: Optional[str] = Field(None, description="Filtro opcional: enfermedad indicada por el agente de clasificación")
+    categoria: Optional[str] = Field(None, description="Filtro opcional: overview, symptoms, diagnosis, treatment o protocol")
+    especie: Optional[str] = Field(None, description="Filtro opcional: perro o gato")
+
+class DbRetrievalTool(BaseTool):
+    name: str = "Recuperación de Información de Base de Conocimientos Veterinarios"
+    description: str = "Recuperación de información veterinaria relevante proveniente de la base de conocimientos"
+    args_schema: Type[BaseModel] = SearchInput
+
+    def _run(self, query: str, enfermedad: Optional[str] = None, categoria: Optional[str] = None, especie: Optional[str] = None) -> str:
+        # Unknown values (or "-") are dropped, an unmatched filter falls back to the whole collection
+        return query_diseases(query, filters=RetrievalFilter.from_values(disease=enfermedad, category=categoria, species=especie))
 
 # ===================================================
 # AGENTS DEFINITION
@@ -22,14 +165,22 @@ llm = ChatGroq(
 class VeterinaryAgents:
     """Define all agents for the veterinary chatbot system"""
 
+    def __init__(self, compact: bool = False, agent_llm=None):
+        self.compact = compact # One-sentence backstories (the system prompt of every call)
+        self.llm = agent_llm or create_llm_backend().llm # Configured backend (VET_LLM_BACKEND) by default
+
+    def _backstory(self, full: str, compact: str) -> str:
+        return compact if self.compact else full
+
     def classification_agent(self) -> Agent:
         """Agent that classifies queries and determines search necessity"""
         return Agent(
             role="Agente de Clasificación Veterinaria",
             goal="Clasificar consulta por tipo y urgencia, determinando si para responder a la consulta se requiere de una búsqueda de información",
-            backstory="""Eres un asistente veterinario experimentado en la clasificación de casos.
+            backstory=self._backstory("""Eres un asistente veterinario experimentado en la clasificación de casos.
             Tienes la habilidad de identificar rápidamente el tipo de consulta, su urgencia médica, y determinar qué información se necesita para responder apropiadamente.""",
-            llm=llm,
+                "Eres un asistente veterinario experto en clasificar consultas."),
+            llm=self.llm,
             verbose=True,
             allow_delegation=False
         )
@@ -39,9 +190,10 @@ class VeterinaryAgents:
         return Agent(
             role="Especialista en Recuperación de Información",
             goal="Recuperar información veterinaria relevante proveniente de la base de conocimientos",
-            backstory="""Eres un bibliotecario médico veterinario experto en recuperación de información.
+            backstory=self._backstory("""Eres un bibliotecario médico veterinario experto en recuperación de información.
             Sabes encontrar información precisa sobre enfermedades, tratamientos y protocolos veterinarios, proveniente de la base de conocimientos.""",
-            llm=llm,
+                "Eres un bibliotecario médico veterinario."),
+            llm=self.llm,
             verbose=True,
             allow_delegation=False,
             tools=[self._create_db_retrieval_tool()]
@@ -52,9 +204,10 @@ class VeterinaryAgents:
         return Agent(
             role="Veterinario Clínico Educador",
             goal="Proporcionar respuestas veterinarias educativas, precisas y apropiadas para estudiantes",
-            backstory="""Eres un veterinario clínico senior con más de 15 años de experiencia y pasión por la enseñanza.
+            backstory=self._backstory("""Eres un veterinario clínico senior con más de 15 años de experiencia y pasión por la enseñanza.
             Te especializas en medicina de pequeños animales y eres excelente explicando conceptos complejos de manera clara. Siempre priorizas la seguridad del paciente y la precisión médica.""",
-            llm=llm,
+                "Eres un veterinario clínico senior y docente de pequeños animales; priorizas la seguridad del paciente y la precisión médica."),
+            llm=self.llm,
             verbose=True,
             allow_delegation=False
         )
@@ -64,45 +217,80 @@ class VeterinaryAgents:
         return Agent(
             role="Supervisor de Calidad y Seguridad",
             goal="Verificar que las respuestas sean seguras, precisas y apropiadas a nivel educativo",
-            backstory="""Eres un supervisor de educación veterinaria enfocado en seguridad del paciente.
+            backstory=self._backstory("""Eres un supervisor de educación veterinaria enfocado en seguridad del paciente.
             Revisas meticulosamente la información médica para asegurar que sea precisa, segura y apropiada para estudiantes de veterinaria.""",
-            llm=llm,
+                "Eres un supervisor de educación veterinaria enfocado en la seguridad del paciente."),
+            llm=self.llm,
             verbose=True,
             allow_delegation=False
         )
     
     def _create_db_retrieval_tool(self):
         """Create tool wrapper for db information retrieval tool"""
-        from crewai.tools import BaseTool
-        from typing import Type
-        from pydantic import BaseModel, Field
-
-        class SearchInput(BaseModel):
-            """Input schema for knowledge base search"""
-            query: str = Field(..., description="Consulta refinada sobre enfermedades, síntomas, diagnósticos o tratamientos veterinarios")
-
-        class DbRetrievalTool(BaseTool):
-            name: str = "Recuperación de Información de Base de Conocimientos Veterinarios"
-            description: str = "Recuperación de información veterinaria relevante proveniente de la base de conocimientos"
-            args_schema: Type[BaseModel] = SearchInput
-
-            def _run(self, query: str) -> str:
-                return query_diseases(query)
-            
         return DbRetrievalTool()
             
 # ===================================================
-# AGENTS DEFINITION
+# TASKS DEFINITION
 # ===================================================
+# Placeholders filled by Crew.kickoff(inputs=...), so prebuilt tasks can be reused across requests
+USER_QUERY_PLACEHOLDER = "{user_query}"
+CLASSIFICATION_PLACEHOLDER = "{classification}"
+KNOWLEDGE_PLACEHOLDER = "{knowledge}"
+INSTRUCTIONS_PLACEHOLDER = "{instructions}"
+HISTORY_PLACEHOLDER = "{history}"
+PLACEHOLDER_PATTERN = re.compile(r"\{(user_query|classification|knowledge|instructions|history)\}")
+
+# Compact prompts: the specialist's rules per query type, only the classified type's rules are sent
+# when the type is known before the call (fast and speculative pipelines)
+COMPACT_SPECIALIST_INSTRUCTIONS = {
+    VETERINARIA: """Consulta veterinaria. Si hay información de la base de conocimientos, úsala como fuente principal con detalles específicos (dosis, protocolos, valores diagnósticos). Si no la hay, comienza con "⚠️ Información basada en conocimiento general (no verificado en base de conocimientos de la UNAM):\n\n", evita dosis específicas y sugiere literatura veterinaria adicional. Si es EMERGENCIA, comienza con "⚠️ EMERGENCIA VETERINARIA:\n\n".""",
+    SISTEMA: f"""Consulta de sistema, responde exactamente con el texto que corresponda.
+Saludo o "¿qué puedes hacer?": "{GREETING_RESPONSE}"
+Despedida: "{FAREWELL_RESPONSE}"
+Agradecimiento: "{THANKS_RESPONSE}\"""",
+    FUERA_DE_ALCANCE: f"""Consulta fuera de alcance, responde exactamente: "{OUT_OF_SCOPE_RESPONSE}\"""",
+}
+
+def specialist_instructions(query_type: str = None) -> str:
+    """Compact specialist rules for a query type (all of them when the type isn't known yet)"""
+    if query_type in COMPACT_SPECIALIST_INSTRUCTIONS:
+        return COMPACT_SPECIALIST_INSTRUCTIONS[query_type]
+    return "\n\n".join(COMPACT_SPECIALIST_INSTRUCTIONS.values())
+
+COMPACT_CLASSIFICATION_OUTPUT = """- Tipo: [VETERINARIA/SISTEMA/FUERA_DE_ALCANCE]
+- Urgencia: [EMERGENCIA/NO_EMERGENCIA]
+- Búsqueda de información necesaria: [Sí/No]
+- Consulta refinada: [frase]
+- Filtros: enfermedad=[enfermedad/-], categoría=[categoría/-], especie=[perro/gato/-]
+Solo las líneas que apliquen, sin explicaciones."""
+
 class VeterinaryTasks:
     """Define all tasks for the veterinary chatbot workflow"""
 
-    def classification_task(self, agent: Agent, user_query:str) -> Task:
-        """Classify query type, urgency, and search necessity"""
+    def __init__(self, compact: bool = False):
+        # Compact prompts drop the examples and repeated rules, and the specialist only receives
+        # the classification fields it uses (type and urgency)
+        self.compact = compact
+
+    def classification_task(self, agent: Agent, user_query: str = USER_QUERY_PLACEHOLDER, history: str = HISTORY_PLACEHOLDER) -> Task:
+        """Classify query type, urgency, and search necessity (follow-ups are read against the conversation history)"""
+        if self.compact:
+            return Task(
+                description=f"""Clasifica la consulta: {user_query}
+Historial (para preguntas de seguimiento): {history}
+Tipo: VETERINARIA (medicina veterinaria), SISTEMA (saludos, despedidas, agradecimientos, preguntas sobre el chatbot) o FUERA_DE_ALCANCE (otros temas, incluida la medicina humana).
+Si es VETERINARIA: urgencia EMERGENCIA (riesgo de vida: shock, convulsiones, hemorragia o dificultad respiratoria severa, intoxicación) o NO_EMERGENCIA; búsqueda = Sí; consulta refinada = frase completa con contexto médico y especie (ej. "Mi perro comió chocolate" → "intoxicación por chocolate en perros"); filtros solo si la consulta los menciona, si no "-": enfermedad ({", ".join(DISEASE_SPECIES)}), categoría (overview, symptoms, diagnosis, treatment, protocol), especie (perro, gato).
+Si no es VETERINARIA: búsqueda = No.""",
+                agent=agent,
+                expected_output=COMPACT_CLASSIFICATION_OUTPUT
+            )
         return Task(
             description=f"""Analiza esta consulta y clasificala:
             
             CONSULTA: {user_query}
+
+            HISTORIAL DE LA CONVERSACIÓN (úsalo para entender preguntas de seguimiento, p. ej. "¿y la dosis?"):
+            {history}
             
             PASO 1 - Determina el TIPO:
             - VETERINARIA: Cualquier tema de medicina veterinaria, enfermedades, síntomas, tratamientos
@@ -118,24 +306,54 @@ class VeterinaryTasks:
             - No: A consultas de tipo SISTEMA Y FUERA_DE_ALCANCE
             
             PASO 4 - Si búsqueda = Sí, crea CONSULTA REFINADA:
-            - Reformula la consulta del usuario para búsqueda semántica
+            - Reformula la consulta del usuario para búsqueda semántica (si es de seguimiento, incluye el tema del historial)
             - Usa frases completas con contexto médico
             - Ejemplos:
                 • "Mi perro comió chocolate" → "intoxicación por chocolate en perros"
                 • "Perro con vómitos y diarrea con sangre" → "síntomas de vómitos y diarrea hemorrágica en perros"
                 • "¿Qué es parvovirus?" → "Información sobre el parvovirus canino"
             - Mantén contexto que sea importante (síntomas, especie, urgencia)
-            - NO uses solo palabras clave sueltas""",
+            - NO uses solo palabras clave sueltas
+
+            PASO 5 - Si búsqueda = Sí, identifica FILTROS de búsqueda (solo si la consulta los menciona claramente, si no usa "-"):
+            - Enfermedad: {", ".join(DISEASE_SPECIES)}
+            - Categoría: overview (información general), symptoms (síntomas), diagnosis (diagnóstico), treatment (tratamiento), protocol (protocolos)
+            - Especie: perro, gato""",
             agent=agent,
             expected_output="""Clasificación estructurada:
             - Tipo: [VETERINARIA/SISTEMA/FUERA_DE_ALCANCE]
             - Urgencia: [EMERGENCIA/NO_EMERGENCIA] (solo si es de tipo VETERINARIA)
             - Búsqueda de información necesaria: [Sí/No]
-            - Consulta refinada: [frase completa con contexto] (solo si búsqueda = Sí)"""
+            - Consulta refinada: [frase completa con contexto] (solo si búsqueda = Sí)
+            - Filtros: enfermedad=[enfermedad/-], categoría=[categoría/-], especie=[perro/gato/-] (solo si búsqueda = Sí)"""
         )
 
+    def classification_summary_task(self, classification_task: Task) -> Task:
+        """
+        Context-only task holding a summary of the classification (type, urgency and refined query)
+
+        It is never executed: the classification task's callback fills its output, so tasks that
+        don't search read the summary instead of the full classification (filters included).
+        """
+        summary_task = Task(description="Resumen de la clasificación", expected_output="Tipo, urgencia y consulta refinada")
+
+        def summarize(output: TaskOutput):
+            summary = parse_classification(output.raw, "").to_summary_text()
+            summary_task.output = TaskOutput(description=summary_task.description, expected_output=summary_task.expected_output, raw=summary, agent=output.agent)
+
+        classification_task.callback = summarize
+        return summary_task
+
     def db_retrieval_task(self, agent: Agent, context: List[Task]) -> Task:
         """Recover knowledge base data based on triage results"""
+        if self.compact:
+            return Task(
+                description="""Si la clasificación indica búsqueda = No, regresa exactamente "BÚSQUEDA NO REQUERIDA".
+Si no, invoca la herramienta "Recuperación de Información de Base de Conocimientos Veterinarios" con la consulta refinada completa como query y los filtros como enfermedad, categoria y especie (omite los "-"), y regresa su resultado sin modificar.""",
+                agent=agent,
+                expected_output='"BÚSQUEDA NO REQUERIDA" o el resultado exacto de la herramienta',
+                context=context
+            )
         return Task(
             description="""Basándote en el análisis del agente de clasificación, recupera información de la base de conocimientos.
 
@@ -146,7 +364,7 @@ class VeterinaryTasks:
 
             Si el agente de clasificación indica "Búsqueda de información necesaria" = Sí:
             1. Recupera la "Consulta refinada" del agente de clasificación
-            2. Invoca la herramienta "Recuperación de Información de Base de Conocimientos Veterinarios" utilizando la consulta refinada como argumento. Es importante que utilices la consulta refinada completa, no palabras clave
+            2. Invoca la herramienta "Recuperación de Información de Base de Conocimientos Veterinarios" utilizando la consulta refinada como argumento. Es importante que utilices la consulta refinada completa, no palabras clave. Si la clasificación incluye Filtros, pásalos también como enfermedad, categoria y especie (omite los que sean "-")
             3. Regresa exactamente lo que la herramienta devuelva, sin modificar
 
             Tu único trabajo es invocar la herramienta y pasar sus resultados al siguiente agente.""",
@@ -157,13 +375,50 @@ class VeterinaryTasks:
             context=context
         )
     
-    def specialist_response_task(self, agent: Agent, user_query: str, context: List[Task]) -> Task:
-        """Formulate appropriate response based on query type"""
+    def specialist_response_task(self, agent: Agent, user_query: str = USER_QUERY_PLACEHOLDER, context: List[Task] = None, classification=None, knowledge: str = None, instructions: str = None, history: str = HISTORY_PLACEHOLDER) -> Task:
+        """
+        Formulate appropriate response based on query type
+
+        Classification and retrieved knowledge come from the context tasks, or are embedded
+        in the description when given directly (fast pipeline), either as values or as placeholders.
+        Compact prompts take the rules to follow as instructions (all query types by default).
+        """
+        if self.compact:
+            provided_inputs = ""
+            if classification is not None:
+                provided_inputs = f"""
+CLASIFICACIÓN: {classification.to_compact_text() if isinstance(classification, QueryClassification) else classification}
+INFORMACIÓN DE LA BASE DE CONOCIMIENTOS:
+{knowledge or "BÚSQUEDA NO REQUERIDA"}"""
+            return Task(
+                description=f"""Responde como veterinario educador, en tono profesional pero accesible{", usando la clasificación y la información recuperada del contexto" if classification is None else ""}.
+CONSULTA: {user_query}
+HISTORIAL: {history}{provided_inputs}
+{instructions or specialist_instructions()}""",
+                agent=agent,
+                expected_output="Respuesta final para el usuario",
+                context=context or []
+            )
+
+        provided_inputs = ""
+        if classification is not None:
+            provided_inputs = f"""
+            CLASIFICACIÓN:
+            {classification.to_text() if isinstance(classification, QueryClassification) else classification}
+
+            INFORMACIÓN RECUPERADA DE LA BASE DE CONOCIMIENTOS:
+            {knowledge or "BÚSQUEDA NO REQUERIDA"}
+            """
+
         return Task(
             description=f"""Basándote en la clasificación de la consulta y la información recuperada (en caso de que hubiera), formula una respuesta apropiada.
             
             CONSULTA ORIGINAL: {user_query}
 
+            HISTORIAL DE LA CONVERSACIÓN (contexto de preguntas de seguimiento, no lo repitas):
+            {history}
+            {provided_inputs}
+
             TIPO 1: CONSULTAS VETERINARIAS
             A) Si hay información proveniente de la base de conocimientos:
                 - Úsala como fuente principal
@@ -177,40 +432,30 @@ class VeterinaryTasks:
 
             TIPO 2: CONSULTAS DE SISTEMA
             A) Saludos/¿Qué puedes hacer?:
-                "¡Hola! Soy tu asistente de aprendizaje en medicina veterinaria 🩺.
-
-                Puedo ayudarte con:
-
-                • Enfermedades y condiciones veterinarias
-
-                • Síntomas y diagnósticos
-
-                • Protocolos de tratamiento
-
-                • Emergencias veterinarias
-
-                • Procedimientos y anestesia
-
-                ¿En qué tema veterinario te gustaría que te ayude?"
+                "{GREETING_RESPONSE}"
             B) Despedidas:
-                "¡Hasta pronto! Estoy aquí cuando necesites ayuda con temas veterinarios 🐕🐈"
-            C) Agradecimientos: "¡Con gusto! Si tienes más consultas veterinarias, estaré encantado de ayudarte 😊."
+                "{FAREWELL_RESPONSE}"
+            C) Agradecimientos: "{THANKS_RESPONSE}"
 
             TIPO 3: CONSULTAS FUERA DE ALCANCE
-            "Soy un asistente especializado en medicina veterinaria.
-
-            Puedo ayudarte con preguntas sobre enfermedades, síntomas, diagnósticos y tratamientos veterinarios, pero no puedo asistir con otros temas.
-
-            Tienes alguna consulta veterinaria en la que pueda ayudarte?"
+            "{OUT_OF_SCOPE_RESPONSE}"
 
             Para todos los tipos de respuesta mantén un tono profesional pero accesible.""",
             agent=agent,
             expected_output="Respuesta completa y apropiada para el tipo de consulta (veterinaria, no veterinaria o de sistema)",
-            context=context
+            context=context or []
         )
     
     def quality_check_task(self, agent: Agent, context: List[Task]) -> Task:
         """Review response for safety, accuracy, and quality"""
+        if self.compact:
+            return Task(
+                description="""Si la consulta es VETERINARIA, revisa la respuesta del Veterinario Clínico Educador: emergencias marcadas con "⚠️ EMERGENCIA VETERINARIA", dosis y protocolos correctos y solo de fuentes verificadas, conocimiento general marcado como tal, terminología correcta en español; agrega al final "📚 Nota Educativa: Esta información es para fines educativos. En la práctica clínica, cada caso debe evaluarse individualmente considerando el historial completo, examen físico y resultados diagnósticos."
+Si es SISTEMA o FUERA_DE_ALCANCE, regrésala sin cambios.""",
+                agent=agent,
+                expected_output="ÚNICAMENTE la respuesta final, sin información de clasificación",
+                context=context
+            )
         return Task(
             description="""Revisa la respuesta del Veterinario Clínico Educador y asegura su calidad.
             
@@ -241,25 +486,315 @@ class VeterinaryTasks:
 # ===================================================
 # CREW ORCHESTRATION
 # ===================================================
+# Speculative pipeline: the raw query's search is kept when the refined query is this similar (e5 cosine).
+# Same bar as the response cache, e5 still scores the same question about another species ~0.95
+SPECULATION_MIN_SIMILARITY = 0.97
+
+# (wall clock, perf counter) when the running crew task started, for per-task tracing spans
+_task_started_at = contextvars.ContextVar("task_started_at", default=None)
+
 class VeterinaryCrew:
-    """Orchestrate the multi-agent veterinary chatbot workflow"""
+    """
+    Orchestrate the multi-agent veterinary chatbot workflow
+
+    Pipeline modes:
+        crew: Classification, retrieval and specialist agents (three LLM calls)
+        fast: Local embedding classifier + direct query_diseases call, only the specialist uses the LLM
+        speculative: Classification agent while the raw query is searched, then the specialist (two LLM calls)
+
+    LLM backends (llm_backend, VET_LLM_BACKEND by default): a registered name (groq, or stub for offline
+    load tests and deterministic benchmarks) or an LLMBackend built with create_llm_backend(name, **settings)
+    """
+
+    PIPELINE_MODES = ("crew", "fast", "speculative")
 
-    def __init__(self):
-        self.agent_manager = VeterinaryAgents()
-        self.task_manager = VeterinaryTasks()
+    def __init__(self, mode: str = "crew", use_canned_responses: bool = True, use_response_cache: bool = True, cache_threshold: float = None, cache_ttl_seconds: float = None, cache_max_entries: int = None, max_concurrency: int = 16, request_timeout: float = 120.0, compact_prompts: bool = False, llm_backend: Union[str, LLMBackend] = None):
+        if mode not in self.PIPELINE_MODES:
+            raise ValueError(f"Unknown pipeline mode '{mode}', expected one of {self.PIPELINE_MODES}")
+        self.mode = mode
+
+        # Async API limits (arun/run_many)
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        self._semaphores = weakref.WeakKeyDictionary() # One semaphore per event loop (asyncio primitives can't be shared between loops)
+
+        # Prebuilt crews (agents, tools and templated tasks) reused across requests, one per concurrent request
+        self._crew_pools = {"crew": queue.SimpleQueue(), "fast": queue.SimpleQueue(), "classification": queue.SimpleQueue()}
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="speculative-search") # Searches run while the classification agent thinks
+        self._specialist_template = None # (system message, human message template) for direct LLM calls
+        self.compact_prompts = compact_prompts # Shorter agent/task prompts (fewer tokens per request)
+        self.llm_backend = llm_backend if isinstance(llm_backend, LLMBackend) else create_llm_backend(llm_backend or LLM_BACKEND)
+        self.agent_manager = VeterinaryAgents(compact=compact_prompts, agent_llm=self.llm_backend.llm)
+        self.task_manager = VeterinaryTasks(compact=compact_prompts)
+        self.classifier = LocalQueryClassifier(retrieval_engine.embedding_function)
+
+        # Greetings, farewells, thanks and out-of-scope queries are answered locally (no LLM calls)
+        self.router = CannedResponseRouter(self.classifier) if use_canned_responses else None
+
+        # Semantic cache of final answers (repeated questions skip the whole crew)
+        self.response_cache = None
+        if use_response_cache:
+            cache_settings = {"threshold": cache_threshold, "ttl_seconds": cache_ttl_seconds, "max_entries": cache_max_entries}
+            self.response_cache = SemanticResponseCache(
+                embedding_function=retrieval_engine.embedding_function,
+                version_function=knowledge_base_version,
+                **{name: value for name, value in cache_settings.items() if value is not None}
+            )
     
-    def run(self, user_query: str) -> str:
+    def run(self, user_query: str, timings: dict = None, memory: ConversationMemory = None, usage: dict = None) -> str:
         """
         Execute the multi-agent workflow for a user query
 
         Args:
             user_query: Veterinary question from the user
-        
+            timings: Filled with the seconds spent per stage (fast and speculative modes) and in total
+            memory: History of the chat the query belongs to (the new turn is added to it)
+            usage: Filled with the provider's token counts of LLM answers (prompt_tokens, completion_tokens,
+                total_tokens, successful_requests), left empty for canned and cached answers
+
         Returns:
-            Final reviewed response
+            Final response text, whichever way it was answered
         """
         logger.info(f"Processing query: {user_query}")
+        with tracer.span("request", api="run", mode=self.mode) as span:
+            search_query = self._search_query(user_query, memory)
+
+            # Answer with canned text if it's a system/out-of-scope query
+            canned_response = self._route_canned(user_query, follow_up=search_query != user_query)
+            if canned_response is not None:
+                span.set(source="canned")
+                return canned_response
+
+            # Answer from cache if a similar question was already answered
+            cache_query = self._cache_query(user_query, memory)
+            cached_response = self._lookup_cache(cache_query)
+            if cached_response is not None:
+                logger.info("Query answered from response cache")
+                span.set(source="cache")
+                self._remember(memory, user_query, cached_response)
+                return cached_response
+
+            start = time.perf_counter()
+            if self.mode == "fast":
+                result = self._run_fast(user_query, timings, memory)
+            elif self.mode == "speculative":
+                result = self._run_speculative(user_query, timings, memory)
+            else:
+                result = self._run_crew(user_query, memory)
+            if timings is not None:
+                timings["total"] = time.perf_counter() - start
+            logger.info("Query processing completed")
+
+            token_usage = getattr(result, "token_usage", None) # Provider counts summed by CrewAI
+            span.set(source="llm", prompt_tokens=getattr(token_usage, "prompt_tokens", None), completion_tokens=getattr(token_usage, "completion_tokens", None), llm_requests=getattr(token_usage, "successful_requests", None))
+            if usage is not None and token_usage is not None:
+                usage.update({field: getattr(token_usage, field, None) for field in ("prompt_tokens", "completion_tokens", "total_tokens", "successful_requests")})
+            response_text = getattr(result, "raw", None) or str(result)
+            if self.response_cache is not None and cache_query is not None:
+                self.response_cache.store(cache_query, response_text)
+            self._remember(memory, user_query, response_text)
+            return response_text
+
+    @staticmethod
+    def _search_query(user_query: str, memory: Optional[ConversationMemory]) -> str:
+        """Query to classify and search: follow-ups ("¿y la dosis?") are joined to the previous question"""
+        return memory.contextualize(user_query) if memory is not None else user_query
 
+    @staticmethod
+    def _cache_query(user_query: str, memory: Optional[ConversationMemory]) -> Optional[str]:
+        """Key of the query in the response cache, shared by every chat (None if its answer depends on the history)"""
+        return memory.cache_key(user_query) if memory is not None else user_query
+
+    @staticmethod
+    def _remember(memory: Optional[ConversationMemory], user_query: str, response_text: str):
+        """Add the turn to the chat's history (canned answers carry no context and are left out)"""
+        if memory is not None:
+            memory.add_turn(user_query, response_text)
+
+    def _crew_inputs(self, user_query: str, memory: ConversationMemory = None) -> dict:
+        """Values for the placeholders of the crew and classification tasks"""
+        return {"user_query": user_query, "history": memory.context() if memory is not None else NO_HISTORY}
+
+    def _route_canned(self, user_query: str, follow_up: bool = False) -> Optional[str]:
+        """Canned answer for system/out-of-scope queries (None for veterinary ones or without a router)"""
+        if self.router is None:
+            return None
+        with tracer.span("canned_router") as span:
+            canned_response = self.router.route(user_query)
+            if canned_response == OUT_OF_SCOPE_RESPONSE and follow_up: # "¿y en gatos?" is out of scope only without the previous question
+                canned_response = None
+            span.set(hit=canned_response is not None)
+        if canned_response is not None:
+            tracer.count("canned_responses_total")
+        return canned_response
+
+    def _lookup_cache(self, user_query: Optional[str]) -> Optional[str]:
+        """Cached answer of a similar earlier query (None on a miss, without a cache or without a cache key)"""
+        if self.response_cache is None or user_query is None:
+            return None
+        with tracer.span("response_cache_lookup") as span:
+            cached_response = self.response_cache.lookup(user_query)
+            span.set(hit=cached_response is not None)
+        return cached_response
+
+    def stream(self, user_query: str, memory: ConversationMemory = None) -> Iterator[dict]:
+        """
+        Execute the workflow yielding progress events and the specialist's tokens as they arrive
+
+        Follows the pipeline mode. In fast and speculative modes the specialist is called directly
+        and its tokens are streamed. In crew mode the specialist runs inside the crew, so the answer
+        arrives as a single token once the crew finishes (no classification/retrieval events).
+
+        Args:
+            user_query: Veterinary question from the user
+            memory: History of the chat the query belongs to (the new turn is added to it)
+
+        Yields:
+            {"type": "classification", "classification": QueryClassification, "seconds": float}
+            {"type": "retrieval", "knowledge": str | None, "seconds": float}
+            {"type": "token", "content": str} (one per streamed chunk)
+            {"type": "done", "content": str, "source": "llm" | "canned" | "cache", "time_to_first_token": float, "seconds": float}
+        """
+        logger.info(f"Streaming query: {user_query}")
+        with tracer.span("request", api="stream", mode=self.mode) as span:
+            yield from self._stream(user_query, span, memory)
+
+    def _stream(self, user_query: str, span, memory: ConversationMemory = None) -> Iterator[dict]:
+        """Body of stream(), inside its request span"""
+        start = time.perf_counter()
+        search_query = self._search_query(user_query, memory)
+        cache_query = self._cache_query(user_query, memory)
+
+        # Canned and cached answers are emitted as a single token
+        lookups = (("canned", lambda: self._route_canned(user_query, follow_up=search_query != user_query)), ("cache", lambda: self._lookup_cache(cache_query)))
+        for source, lookup in lookups:
+            response_text = lookup()
+            if response_text is not None:
+                elapsed = time.perf_counter() - start
+                span.set(source=source)
+                if source == "cache":
+                    self._remember(memory, user_query, response_text)
+                yield {"type": "token", "content": response_text}
+                yield {"type": "done", "content": response_text, "source": source, "time_to_first_token": elapsed, "seconds": elapsed}
+                return
+
+        if self.mode == "crew":
+            result = self._run_crew(user_query, memory)
+            token_usage = getattr(result, "token_usage", None)
+            span.set(prompt_tokens=getattr(token_usage, "prompt_tokens", None), completion_tokens=getattr(token_usage, "completion_tokens", None), llm_requests=getattr(token_usage, "successful_requests", None))
+            response_text = result.raw
+            time_to_first_token = time.perf_counter() - start
+            yield {"type": "token", "content": response_text}
+        else:
+            if self.mode == "speculative":
+                classification, knowledge, _ = self._speculative_context(user_query, {}, memory)
+                yield {"type": "classification", "classification": classification, "seconds": time.perf_counter() - start}
+            else:
+                with tracer.span("classification", classifier="local"):
+                    classification = self.classifier.classify(search_query)
+                yield {"type": "classification", "classification": classification, "seconds": time.perf_counter() - start}
+                knowledge = query_diseases(classification.refined_query, filters=classification.filters) if classification.needs_search else None
+            yield {"type": "retrieval", "knowledge": knowledge, "seconds": time.perf_counter() - start}
+
+            messages = self._specialist_messages(user_query, classification, knowledge, memory)
+            prompt_tokens = estimate_tokens(messages)
+
+            def stream_usage(chunks: list) -> Optional[int]:
+                """Provider counts if a chunk carries them (stream usage, the stub), an estimate otherwise"""
+                usage_chunks = [chunk for chunk in chunks if chunk.usage_metadata]
+                if usage_chunks:
+                    return message_usage(usage_chunks[-1])
+                return report_llm_tokens(prompt_tokens, estimate_tokens("".join(chunk.content for chunk in chunks)), estimated=True)
+
+            with tracer.span("llm_stream", estimated_tokens=prompt_tokens + ESTIMATED_COMPLETION_TOKENS) as llm_span:
+                response_text = ""
+                time_to_first_token = None
+                chunks = self.llm_backend.scheduler.call_stream(
+                    lambda: self.llm_backend.chat_llm.stream(messages),
+                    estimated_tokens=prompt_tokens + ESTIMATED_COMPLETION_TOKENS,
+                    usage=stream_usage
+                )
+                for chunk in chunks:
+                    if not chunk.content:
+                        continue
+                    if time_to_first_token is None:
+                        time_to_first_token = time.perf_counter() - start
+                        llm_span.set(time_to_first_token=time_to_first_token)
+                    response_text += chunk.content
+                    yield {"type": "token", "content": chunk.content}
+
+        elapsed = time.perf_counter() - start
+        span.set(source="llm", time_to_first_token=time_to_first_token or elapsed)
+        logger.info(f"Query streaming completed (first token {time_to_first_token or elapsed:.2f}s, total {elapsed:.2f}s)")
+
+        if self.response_cache is not None and cache_query is not None:
+            self.response_cache.store(cache_query, response_text)
+        self._remember(memory, user_query, response_text)
+        yield {"type": "done", "content": response_text, "source": "llm", "time_to_first_token": time_to_first_token or elapsed, "seconds": elapsed}
+
+    def _specialist_messages(self, user_query: str, classification: QueryClassification, knowledge: str, memory: ConversationMemory = None) -> list:
+        """Chat messages equivalent to the specialist agent's single-task prompt"""
+        if self._specialist_template is None:
+            agent = self.agent_manager.veterinary_specialist_agent()
+            task = self.task_manager.specialist_response_task(agent, classification=CLASSIFICATION_PLACEHOLDER, knowledge=KNOWLEDGE_PLACEHOLDER, instructions=INSTRUCTIONS_PLACEHOLDER)
+            self._specialist_template = (
+                f"You are {agent.role}. {agent.backstory}\nYour personal goal is: {agent.goal}",
+                f"{task.description}\n\nThis is the expected criteria for your final answer: {task.expected_output}",
+            )
+
+        system_message, human_template = self._specialist_template
+        inputs = self._specialist_inputs(user_query, classification, knowledge, memory)
+        return [
+            ("system", system_message),
+            ("human", PLACEHOLDER_PATTERN.sub(lambda match: inputs[match.group(1)], human_template)),
+        ]
+
+    def _specialist_inputs(self, user_query: str, classification: QueryClassification, knowledge: str, memory: ConversationMemory = None) -> dict:
+        """Values for the placeholders of the fast pipeline's specialist task"""
+        return {
+            **self._crew_inputs(user_query, memory),
+            "classification": classification.to_compact_text() if self.compact_prompts else classification.to_text(),
+            "knowledge": knowledge or "BÚSQUEDA NO REQUERIDA",
+            "instructions": specialist_instructions(classification.query_type), # Only used by compact prompts
+        }
+
+    @contextmanager
+    def _pooled_crew(self, kind: str):
+        """Borrow a prebuilt crew ("crew" or "fast"), building one if all are in use"""
+        pool = self._crew_pools[kind]
+        try:
+            crew = pool.get_nowait()
+        except queue.Empty:
+            builders = {"crew": self._build_crew, "fast": self._build_fast_crew, "classification": self._build_classification_crew}
+            crew = builders[kind]()
+
+        # Agents accumulate token usage across kickoffs, reset it so CrewOutput.token_usage covers this request only
+        for agent in crew.agents:
+            agent._token_process = TokenProcess()
+        try:
+            yield crew
+        finally:
+            pool.put(crew)
+
+    def _run_crew(self, user_query: str, memory: ConversationMemory = None):
+        """Classification, retrieval and specialist agents in sequence"""
+        with self._pooled_crew("crew") as crew, tracer.span("crew", tasks=len(crew.tasks)):
+            _task_started_at.set((time.time(), time.perf_counter()))
+            return crew.kickoff(inputs=self._crew_inputs(user_query, memory))
+
+    @staticmethod
+    def _on_task_done(output):
+        """Crew task callback: record a span for the task that just finished (tasks run one after another)"""
+        if not tracer.enabled:
+            return
+        started_at = _task_started_at.get()
+        now = (time.time(), time.perf_counter())
+        if started_at is not None:
+            tracer.record_span("task", started_at[0], now[1] - started_at[1], agent=output.agent, task=(output.name or output.description.strip().splitlines()[0])[:80], output_chars=len(output.raw or ""))
+        _task_started_at.set(now)
+
+    def _build_crew(self) -> Crew:
+        """Crew with classification, retrieval and specialist agents (tasks templated on {user_query} and {history})"""
         # Initialize agents
         classification_agent = self.agent_manager.classification_agent()
         db_retrieval_agent = self.agent_manager.db_retrieval_agent()
@@ -267,22 +802,228 @@ class VeterinaryCrew:
         qc_agent = self.agent_manager.quality_control_agent()
 
         # Create tasks with dependencies
-        classification_task = self.task_manager.classification_task(classification_agent, user_query)
+        classification_task = self.task_manager.classification_task(classification_agent)
         db_retrieval_task = self.task_manager.db_retrieval_task(db_retrieval_agent, context=[classification_task])
-        specialist_task = self.task_manager.specialist_response_task(specialist_agent, user_query, context=[classification_task, db_retrieval_task])
-        qc_task = self.task_manager.quality_check_task(qc_agent, context=[classification_task, specialist_task])
+        # Compact prompts: only the retrieval agent reads the full classification, the others a summary of it
+        classification_context = self.task_manager.classification_summary_task(classification_task) if self.compact_prompts else classification_task
+        specialist_task = self.task_manager.specialist_response_task(specialist_agent, context=[classification_context, db_retrieval_task])
+        qc_task = self.task_manager.quality_check_task(qc_agent, context=[classification_context, specialist_task])
 
-        # Create and run crew (temporarily removing QC to test formatting)
-        crew = Crew(
+        # Create crew (temporarily removing QC to test formatting)
+        return Crew(
             agents=[classification_agent, db_retrieval_agent, specialist_agent],
             tasks=[classification_task, db_retrieval_task, specialist_task],
             process=Process.sequential,
+            task_callback=self._on_task_done, # Per-task tracing spans
             verbose=True
         )
 
-        result = crew.kickoff()
-        logger.info("Query processing completed")
+    def _run_fast(self, user_query: str, timings: dict = None, memory: ConversationMemory = None):
+        """Local classification and direct retrieval, then a single specialist LLM call"""
+        timings = {} if timings is None else timings
+        start = time.perf_counter()
+        with tracer.span("classification", classifier="local"):
+            classification = self.classifier.classify(self._search_query(user_query, memory))
+        timings["classification"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        knowledge = query_diseases(classification.refined_query, filters=classification.filters) if classification.needs_search else None
+        timings["retrieval"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with self._pooled_crew("fast") as crew, tracer.span("specialist"):
+            result = crew.kickoff(inputs=self._specialist_inputs(user_query, classification, knowledge, memory))
+        timings["specialist"] = time.perf_counter() - start
         return result
+
+    def _run_speculative(self, user_query: str, timings: dict = None, memory: ConversationMemory = None):
+        """
+        Classification agent and a search of the raw query at the same time, then the specialist
+
+        The crew pipeline searches only after the classification call (and spends another LLM
+        call on the retrieval agent). Here the user's own words, with the filters they name, are
+        searched while the classification agent runs; the search is repeated with the refined
+        query only if the agent asks for other filters or the refined query means something else.
+        """
+        timings = {} if timings is None else timings
+        start = time.perf_counter()
+        classification, knowledge, classification_output = self._speculative_context(user_query, timings, memory)
+
+        specialist_start = time.perf_counter()
+        with self._pooled_crew("fast") as crew, tracer.span("specialist"):
+            result = crew.kickoff(inputs=self._specialist_inputs(user_query, classification, knowledge, memory))
+        timings["specialist"] = time.perf_counter() - specialist_start
+        result.token_usage.add_usage_metrics(classification_output.token_usage) # Report both LLM calls
+
+        # Same stages one after another, for the latency saved by overlapping them
+        sequential = sum(timings.get(stage, 0.0) for stage in ("classification", "speculative_retrieval", "requery", "specialist"))
+        parallel = time.perf_counter() - start
+        logger.info(
+            f"Speculative pipeline: classification {timings['classification']:.2f}s, search {timings.get('speculative_retrieval', 0.0):.3f}s "
+            f"({'reused' if timings.get('search_reused') else 'repeated' if classification.needs_search else 'not needed'}), "
+            f"specialist {timings['specialist']:.2f}s, total {parallel:.2f}s (sequential {sequential:.2f}s)"
+        )
+        return result
+
+    def _speculative_context(self, user_query: str, timings: dict, memory: ConversationMemory = None) -> tuple:
+        """(classification, knowledge, classification CrewOutput) of the speculative pipeline, before its specialist call"""
+        start = time.perf_counter()
+        search_query = self._search_query(user_query, memory)
+        speculative_filters = extract_filters(search_query)
+        speculative_search = self._executor.submit(contextvars.copy_context().run, self._timed_retrieve, search_query, speculative_filters) # Context copied so its spans join this request
+
+        with self._pooled_crew("classification") as crew, tracer.span("classification", classifier="agent"):
+            classification_output = crew.kickoff(inputs=self._crew_inputs(user_query, memory))
+        classification = parse_classification(classification_output.raw, user_query)
+        timings["classification"] = time.perf_counter() - start
+
+        knowledge = None
+        if classification.needs_search:
+            try:
+                search_result, timings["speculative_retrieval"] = speculative_search.result()
+            except Exception as e: # Same fallback as a failed reuse: search the refined query
+                logger.error(f"Error in speculative search: {str(e)}")
+                search_result = None
+            timings["retrieval_wait"] = time.perf_counter() - start - timings["classification"] # Critical path cost of the search
+
+            timings["search_reused"] = search_result is not None and self._can_reuse_search(search_query, speculative_filters, classification)
+            if timings["search_reused"]:
+                knowledge = format_retrieval(search_result)
+            else:
+                requery_start = time.perf_counter()
+                knowledge = query_diseases(classification.refined_query, filters=classification.filters)
+                timings["requery"] = time.perf_counter() - requery_start
+        else:
+            speculative_search.cancel() # No-op if already running, the result is just dropped
+        return classification, knowledge, classification_output
+
+    @staticmethod
+    def _timed_retrieve(query: str, filters: RetrievalFilter) -> tuple:
+        start = time.perf_counter()
+        with tracer.span("speculative_search"):
+            return retrieve(query, filters=filters), time.perf_counter() - start
+
+    def _can_reuse_search(self, user_query: str, speculative_filters: RetrievalFilter, classification: QueryClassification) -> bool:
+        """Whether the raw query's search stands in for the refined one (same filters and named subjects, close meaning)"""
+        if classification.filters != speculative_filters or extract_filters(classification.refined_query) != speculative_filters:
+            return False
+        similarity = query_similarity(user_query, classification.refined_query)
+        logger.info(f"Refined query similarity {similarity:.3f}: \"{classification.refined_query}\"")
+        return similarity >= SPECULATION_MIN_SIMILARITY
+
+    def _build_classification_crew(self) -> Crew:
+        """Crew with only the classification agent (task templated on {user_query} and {history})"""
+        classification_agent = self.agent_manager.classification_agent()
+        return Crew(
+            agents=[classification_agent],
+            tasks=[self.task_manager.classification_task(classification_agent)],
+            process=Process.sequential,
+            verbose=True
+        )
+
+    def _build_fast_crew(self) -> Crew:
+        """Crew with only the specialist agent (task templated on {user_query}, {history}, {classification}, {knowledge} and, for compact prompts, {instructions})"""
+        specialist_agent = self.agent_manager.veterinary_specialist_agent()
+        specialist_task = self.task_manager.specialist_response_task(specialist_agent, classification=CLASSIFICATION_PLACEHOLDER, knowledge=KNOWLEDGE_PLACEHOLDER, instructions=INSTRUCTIONS_PLACEHOLDER)
+
+        return Crew(
+            agents=[specialist_agent],
+            tasks=[specialist_task],
+            process=Process.sequential,
+            verbose=True
+        )
+
+    # ===================================================
+    # ASYNC API
+    # ===================================================
+    async def arun(self, user_query: str, timeout: float = None, memory: ConversationMemory = None) -> str:
+        """
+        Execute the workflow for a user query without blocking the event loop
+
+        At most max_concurrency queries run at once per event loop, the rest wait for a slot.
+        In fast mode the specialist call goes through ChatGroq's async client (no thread per request),
+        local steps (classification, embedding, vector search) run in the default executor.
+        Crew mode runs the crew in a worker thread, which keeps its pooled crew until the kickoff
+        ends (also after a timeout, so the crew isn't lent to another request while still running).
+
+        Args:
+            user_query: Veterinary question from the user
+            timeout: Seconds before the query is cancelled (defaults to request_timeout)
+            memory: History of the chat the query belongs to (the new turn is added to it)
+
+        Returns:
+            Final response text
+
+        Raises:
+            asyncio.TimeoutError: If the query took longer than the timeout
+        """
+        async with self.concurrency_limit():
+            return await asyncio.wait_for(self._arun(user_query, memory), timeout or self.request_timeout)
+
+    async def run_many(self, user_queries: List[str], timeout: float = None) -> list:
+        """
+        Execute many queries concurrently (bounded by max_concurrency)
+
+        Returns:
+            One entry per query, in order: the response text or the exception it raised
+        """
+        return await asyncio.gather(*(self.arun(user_query, timeout) for user_query in user_queries), return_exceptions=True)
+
+    async def _arun(self, user_query: str, memory: ConversationMemory = None) -> str:
+        """Async counterpart of run()"""
+        logger.info(f"Processing query (async): {user_query}")
+        with tracer.span("request", api="arun", mode=self.mode) as span:
+            search_query = self._search_query(user_query, memory)
+            canned_response = await asyncio.to_thread(self._route_canned, user_query, search_query != user_query)
+            if canned_response is not None:
+                span.set(source="canned")
+                return canned_response
+
+            cache_query = self._cache_query(user_query, memory)
+            cached_response = await asyncio.to_thread(self._lookup_cache, cache_query)
+            if cached_response is not None:
+                logger.info("Query answered from response cache")
+                span.set(source="cache")
+                self._remember(memory, user_query, cached_response)
+                return cached_response
+
+            if self.mode == "fast":
+                with tracer.span("classification", classifier="local"):
+                    classification = await asyncio.to_thread(self.classifier.classify, search_query)
+                knowledge = await asyncio.to_thread(query_diseases, classification.refined_query, classification.filters) if classification.needs_search else None
+                messages = self._specialist_messages(user_query, classification, knowledge, memory)
+                message = await self.llm_backend.scheduler.call_async(
+                    lambda: self.llm_backend.chat_llm.ainvoke(messages),
+                    estimated_tokens=estimate_tokens(messages) + ESTIMATED_COMPLETION_TOKENS,
+                    usage=message_usage
+                )
+                response_text = message.content
+            elif self.mode == "speculative": # Its own search thread overlaps the classification call
+                result = await asyncio.to_thread(self._run_speculative, user_query, None, memory)
+                response_text = result.raw
+            else: # Borrowed and returned in the worker thread, a timed out request can't hand back a crew still running
+                result = await asyncio.to_thread(self._run_crew, user_query, memory)
+                response_text = result.raw
+            logger.info("Query processing completed (async)")
+            span.set(source="llm")
+
+            if self.response_cache is not None and cache_query is not None:
+                await asyncio.to_thread(self.response_cache.store, cache_query, response_text)
+            self._remember(memory, user_query, response_text)
+            return response_text
+
+    def concurrency_limit(self) -> asyncio.Semaphore:
+        """
+        Semaphore bounding the queries in flight (max_concurrency) on the running event loop
+
+        arun holds it for each query, work driven outside arun (e.g. a stream() consumed from a
+        thread) takes a slot with "async with vet_crew.concurrency_limit():"
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
     
 # ===================================================
 # MAIN EXECUTION (for testing)
@@ -318,15 +1059,10 @@ if __name__ == "__main__":
         print(f"Error: {str(e)}")
 
     
-    # Test all queries at the same time (not possible with LiteLLM)
-    # for i, query in enumerate(test_queries, 1):
+    # Test all queries at the same time (async API, keep max_concurrency under the Groq rate limits)
+    # responses = asyncio.run(vet_crew.run_many(test_queries))
+    # for i, (query, response) in enumerate(zip(test_queries, responses), 1):
     #     print(f"\n{'='*30}")
     #     print(f"TEST {i}/{len(test_queries)}: {query}")
     #     print(f"{'='*30}\n")
-
-    #     try:
-    #         response = vet_crew.run(query)
-    #         print(f"\nRESPUESTA:\n{response}\n")
-    #     except Exception as e:
-    #         logger.error(f"Error: {str(e)}")
-    #         print(f"Error: {str(e)}")
+    #     print(f"\nRESPUESTA:\n{response}\n")
@@ -0,0 +1,123 @@
+import os
+import argparse
+import logging
+import numpy as np
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Export the model once (needs torch/transformers, installed with sentence-transformers):
+#    python onnx_embedding.py --output-dir ./models/multilingual-e5-base-onnx
+# At runtime only onnxruntime and tokenizers are used (both come with chromadb) and the files
+# are read from the local folder, no network access.
+
+# Files written by export_model()
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+MAX_LENGTH = 512 # e5 maximum sequence length
+BATCH_SIZE = 32 # Texts per forward pass (sorted by length to limit padding)
+
+class OnnxEmbeddingFunction:
+    """
+    Mean-pooled, L2-normalized e5 embeddings computed with ONNX Runtime
+
+    Same call convention as chromadb's embedding functions: a list of (prefixed) texts in,
+    a list of float32 vectors out.
+    """
+
+    def __init__(self, model_dir: str, model_file: str = QUANTIZED_MODEL_FILE, max_length: int = MAX_LENGTH, batch_size: int = BATCH_SIZE, threads: int = None):
+        import onnxruntime # Deferred imports (only needed when this engine is selected)
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"{model_path} not found, export it with: python onnx_embedding.py --output-dir {model_dir}")
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id("<pad>") or 0, pad_token="<pad>")
+        self.batch_size = batch_size
+        logger.info(f"Loaded ONNX embedding model {model_path}")
+
+    def __call__(self, input: list) -> list:
+        """Embed texts (kept in input order)"""
+        order = sorted(range(len(input)), key=lambda i: len(input[i]))
+        vectors = [None] * len(input)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._embed_batch([input[i] for i in batch])):
+                vectors[i] = vector
+        return vectors
+
+    def _embed_batch(self, texts: list) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        last_hidden_state = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, then unit length (as e5's sentence-transformers config does)
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (last_hidden_state * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return (pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)).astype(np.float32)
+
+# ===================================================
+# EXPORT
+# ===================================================
+def export_model(model_name: str, output_dir: str, quantize: bool = True):
+    """Export a Hugging Face encoder to ONNX (and an int8 dynamically-quantized copy)"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(output_dir) # Writes tokenizer.json (fast tokenizer)
+
+    sample = tokenizer(["query: ejemplo", "passage: texto de ejemplo más largo"], padding=True, return_tensors="pt")
+    model_path = os.path.join(output_dir, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            model_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=17,
+        )
+    logger.info(f"Exported {model_name} to {model_path}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantized_path = os.path.join(output_dir, QUANTIZED_MODEL_FILE)
+        quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+        logger.info(f"Quantized model saved to {quantized_path}")
+
+if __name__ == "__main__":
+    from vector_db import EMBEDDING_MODEL, ONNX_MODEL_DIR
+
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX (and int8)")
+    parser.add_argument("--model", default=EMBEDDING_MODEL, help="Hugging Face model name or local path")
+    parser.add_argument("--output-dir", default=ONNX_MODEL_DIR, help="Folder for model and tokenizer files")
+    parser.add_argument("--no-quantize", action="store_true", help="Only export the float32 model")
+    args = parser.parse_args()
+
+    export_model(args.model, args.output_dir, quantize=not args.no_quantize)
@@ -0,0 +1,374 @@
+import re
+import threading
+import logging
+import unicodedata
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+
+from vector_db import RetrievalFilter, SPECIES_DOG, SPECIES_CAT
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# ===================================================
+# LABELLED EXEMPLARS
+# ===================================================
+# Query types (same labels as the classification agent)
+VETERINARIA = "VETERINARIA"
+SISTEMA = "SISTEMA"
+FUERA_DE_ALCANCE = "FUERA_DE_ALCANCE"
+
+# Urgency levels (only for VETERINARIA queries)
+EMERGENCIA = "EMERGENCIA"
+NO_EMERGENCIA = "NO_EMERGENCIA"
+
+# Fine-grained intents and the query type each one belongs to
+VETERINARY_QUERY = "consulta_veterinaria"
+GREETING = "saludo"
+FAREWELL = "despedida"
+THANKS = "agradecimiento"
+OUT_OF_SCOPE = "fuera_de_alcance"
+
+INTENT_TYPES = {
+    VETERINARY_QUERY: VETERINARIA,
+    GREETING: SISTEMA,
+    FAREWELL: SISTEMA,
+    THANKS: SISTEMA,
+    OUT_OF_SCOPE: FUERA_DE_ALCANCE,
+}
+
+INTENT_EXEMPLARS = {
+    VETERINARY_QUERY: [
+        "¿Qué es el parvovirus canino?",
+        "¿Cuáles son los síntomas del parvovirus?",
+        "Perro con vómitos y diarrea con sangre",
+        "Mi perro comió chocolate, ¿qué hago?",
+        "Tratamiento de la ehrlichiosis en perros",
+        "¿Cómo se diagnostica la diabetes en gatos?",
+        "Dosis de maropitant en perros",
+        "Perro con picazón intensa en patas y orejas",
+        "Perro con cojera en pata trasera que no apoya",
+        "Gato adulto con vómitos y mal aliento",
+        "Protocolo de anestesia para un perro sano",
+        "Perro con abdomen hinchado que intenta vomitar",
+        "¿Qué es la leishmaniasis canina?",
+        "Mi gato no come y está decaído",
+        "Vacunas para cachorros",
+        "Hola, mi perro tiene diarrea",
+        "Gracias, ¿y cuál es la dosis del tratamiento?",
+    ],
+    GREETING: [
+        "Hola",
+        "Hola, ¿qué puedes hacer?",
+        "Buenos días",
+        "Buenas tardes",
+        "¿Quién eres?",
+        "¿En qué me puedes ayudar?",
+    ],
+    FAREWELL: [
+        "Adiós",
+        "Hasta luego",
+        "Nos vemos",
+        "Hasta pronto, bye",
+    ],
+    THANKS: [
+        "Gracias",
+        "Muchas gracias por la ayuda",
+        "Perfecto, gracias",
+        "Te lo agradezco mucho",
+    ],
+    OUT_OF_SCOPE: [
+        "Tengo dolor de cabeza",
+        "¿Cómo preparo una paella?",
+        "¿Quién ganó el partido de fútbol ayer?",
+        "Recomiéndame una película",
+        "¿Qué medicamento tomo para la gripe?",
+        "Ayúdame con mi tarea de matemáticas",
+        "¿Cuál es la capital de Francia?",
+        "Escribe un poema de amor",
+        "¿Cómo invierto en la bolsa?",
+    ],
+}
+
+URGENCY_EXEMPLARS = {
+    EMERGENCIA: [
+        "Mi perro comió chocolate hace una hora",
+        "Perro en shock con abdomen hinchado",
+        "Mi perro está convulsionando",
+        "Perro con hemorragia que no para",
+        "Mi gato no puede respirar",
+        "Perro intoxicado con veneno",
+        "Perro atropellado, está sangrando",
+        "Perro con vómitos y diarrea con sangre, está muy débil",
+    ],
+    NO_EMERGENCIA: [
+        "¿Qué es el parvovirus canino?",
+        "¿Cuáles son los síntomas de la ehrlichiosis?",
+        "¿Cómo se diagnostica la dermatitis atópica?",
+        "Tratamiento de la enfermedad renal crónica",
+        "Perro con picazón en las orejas",
+        "Protocolo de anestesia para un perro sano",
+        "¿Cada cuánto se vacuna a un cachorro?",
+        "Perro con cojera leve desde hace una semana",
+    ],
+}
+
+# Retrieval filter keywords (lowercase, without accents), a label is only used when exactly one matches
+DISEASE_KEYWORDS = {
+    "parvovirus": ["parvovirus", "parvo"],
+    "ehrlichiosis": ["ehrlichia", "erliquia", "garrapata"],
+    "gvd": ["torsion gastrica", "dilatacion gastrica", "volvulo", "gvd"],
+    "diabetes": ["diabetes", "diabetico", "insulina"],
+    "dermatitis_atopica": ["dermatitis atopica", "atopia", "atopica"],
+    "renal_cronica": ["renal", "rinon", "rinones"],
+    "braquicefalico": ["braquicefalico", "braquicefalica", "bulldog", "pug"],
+    "chocolate": ["chocolate", "teobromina"],
+    "acl": ["ligamento cruzado", "cruzado", "tplo"],
+    "anesthesia": ["anestesia", "anestesico", "sedacion"],
+}
+
+CATEGORY_KEYWORDS = {
+    "symptoms": ["sintoma", "signos clinicos"],
+    "diagnosis": ["diagnostic", "prueba", "examen", "analisis"],
+    "treatment": ["tratamiento", "tratar", "dosis", "medicamento", "cirugia"],
+    "protocol": ["protocolo"],
+}
+
+SPECIES_KEYWORDS = {
+    SPECIES_DOG: ["perro", "perra", "cachorro", "canino", "canina"],
+    SPECIES_CAT: ["gato", "gata", "gatito", "felino", "felina"],
+}
+
+def _normalize(text: str) -> str:
+    """Lowercase without accents"""
+    return "".join(char for char in unicodedata.normalize("NFD", text.lower()) if unicodedata.category(char) != "Mn")
+
+def _single_match(text: str, keywords: dict) -> Optional[str]:
+    matches = [label for label, words in keywords.items() if any(word in text for word in words)]
+    return matches[0] if len(matches) == 1 else None
+
+def mentions(query: str, keywords: dict) -> bool:
+    """Whether the query names any of the labels of keywords (DISEASE_KEYWORDS, SPECIES_KEYWORDS...)"""
+    text = _normalize(query)
+    return any(word in text for words in keywords.values() for word in words)
+
+def extract_filters(query: str) -> Optional[RetrievalFilter]:
+    """Disease, category and species named in the query (None if it names none unambiguously)"""
+    text = _normalize(query)
+    return RetrievalFilter.from_values(
+        disease=_single_match(text, DISEASE_KEYWORDS),
+        category=_single_match(text, CATEGORY_KEYWORDS),
+        species=_single_match(text, SPECIES_KEYWORDS),
+    )
+
+# ===================================================
+# CANNED RESPONSES
+# ===================================================
+# Exact texts the specialist agent is instructed to give for SISTEMA and FUERA_DE_ALCANCE queries
+GREETING_RESPONSE = """¡Hola! Soy tu asistente de aprendizaje en medicina veterinaria 🩺.
+
+Puedo ayudarte con:
+
+• Enfermedades y condiciones veterinarias
+
+• Síntomas y diagnósticos
+
+• Protocolos de tratamiento
+
+• Emergencias veterinarias
+
+• Procedimientos y anestesia
+
+¿En qué tema veterinario te gustaría que te ayude?"""
+
+FAREWELL_RESPONSE = "¡Hasta pronto! Estoy aquí cuando necesites ayuda con temas veterinarios 🐕🐈"
+
+THANKS_RESPONSE = "¡Con gusto! Si tienes más consultas veterinarias, estaré encantado de ayudarte 😊."
+
+OUT_OF_SCOPE_RESPONSE = """Soy un asistente especializado en medicina veterinaria.
+
+Puedo ayudarte con preguntas sobre enfermedades, síntomas, diagnósticos y tratamientos veterinarios, pero no puedo asistir con otros temas.
+
+Tienes alguna consulta veterinaria en la que pueda ayudarte?"""
+
+CANNED_RESPONSES = {
+    GREETING: GREETING_RESPONSE,
+    FAREWELL: FAREWELL_RESPONSE,
+    THANKS: THANKS_RESPONSE,
+    OUT_OF_SCOPE: OUT_OF_SCOPE_RESPONSE,
+}
+
+# ===================================================
+# CLASSIFICATION RESULT
+# ===================================================
+@dataclass
+class QueryClassification:
+    """Structured classification of a user query"""
+    query_type: str
+    urgency: Optional[str] = None
+    needs_search: bool = False
+    refined_query: Optional[str] = None
+    confidence: float = 0.0
+    intent: Optional[str] = None
+    similarity: float = 0.0 # Similarity to the nearest exemplar of the chosen type
+    margin: float = 0.0 # similarity minus similarity to the nearest exemplar of any other type
+    filters: Optional[RetrievalFilter] = None # Labels to restrict the knowledge base search to
+
+    def to_text(self) -> str:
+        """Render like the classification agent's expected output"""
+        lines = [f"- Tipo: {self.query_type}"]
+        if self.query_type == VETERINARIA:
+            lines.append(f"- Urgencia: {self.urgency}")
+        lines.append(f"- Búsqueda de información necesaria: {'Sí' if self.needs_search else 'No'}")
+        if self.needs_search:
+            lines.append(f"- Consulta refinada: {self.refined_query}")
+        if self.needs_search and self.filters:
+            lines.append(f"- Filtros: enfermedad={self.filters.disease or '-'}, categoría={self.filters.category or '-'}, especie={self.filters.species or '-'}")
+        return "\n".join(lines)
+
+    def to_compact_text(self) -> str:
+        """Only what the specialist needs (type and urgency), for compact prompts"""
+        return f"{self.query_type}, {self.urgency}" if self.query_type == VETERINARIA and self.urgency else self.query_type
+
+    def to_summary_text(self) -> str:
+        """Type, urgency and refined query, what the crew's specialist and quality check read (compact prompts)"""
+        if self.needs_search and self.refined_query:
+            return f"{self.to_compact_text()}\nConsulta refinada: {self.refined_query}"
+        return self.to_compact_text()
+
+# Lines of the classification agent's output ("- Tipo: VETERINARIA", "- Filtros: enfermedad=gvd, ...")
+CLASSIFICATION_LINE_PATTERN = re.compile(r"^[\s\-•*]*([^:\n]+?)\s*:\s*(.+?)\s*$", re.MULTILINE)
+FILTER_PATTERN = re.compile(r"(enfermedad|categor[ií]a|especie)\s*=\s*([\w\-]+)", re.IGNORECASE)
+
+def parse_classification(text: str, user_query: str) -> QueryClassification:
+    """
+    Read the classification agent's output back into a QueryClassification
+
+    The agent doesn't always follow the format, so anything unreadable falls back to a
+    veterinary query that needs a search of the user's own words (never skips retrieval).
+    """
+    fields = {_normalize(key).strip("[]* "): value.strip("[]* ") for key, value in CLASSIFICATION_LINE_PATTERN.findall(text)}
+
+    query_type = next((label for label in (FUERA_DE_ALCANCE, SISTEMA, VETERINARIA) if label in fields.get("tipo", "").upper()), VETERINARIA)
+    classification = QueryClassification(query_type=query_type)
+    if query_type != VETERINARIA:
+        return classification
+
+    urgency = fields.get("urgencia", "").upper()
+    classification.urgency = EMERGENCIA if EMERGENCIA in urgency and NO_EMERGENCIA not in urgency else NO_EMERGENCIA
+    classification.needs_search = not _normalize(fields.get("busqueda de informacion necesaria", "si")).startswith("no")
+    if classification.needs_search:
+        classification.refined_query = fields.get("consulta refinada") or user_query
+        values = {_normalize(key): value.lower() for key, value in FILTER_PATTERN.findall(fields.get("filtros", ""))}
+        classification.filters = RetrievalFilter.from_values(disease=values.get("enfermedad"), category=values.get("categoria"), species=values.get("especie"))
+    return classification
+
+# ===================================================
+# LOCAL CLASSIFIER
+# ===================================================
+class LocalQueryClassifier:
+    """
+    k-nearest-neighbour classifier over e5 embeddings of labelled exemplars
+
+    Replaces the classification LLM call: intent (hence type) and urgency are voted by the k most
+    similar exemplars (weighted by similarity) and the raw query is used as the refined query.
+    """
+
+    def __init__(self, embedding_function, k: int = 3):
+        self.embedding_function = embedding_function
+        self.k = k
+        self._indexes = None
+        self._lock = threading.Lock()
+
+    def classify(self, query: str) -> QueryClassification:
+        """Classify query type and urgency without calling the LLM"""
+        vector = self._embed([query])[0]
+        indexes = self._get_indexes()
+
+        intent, confidence, similarities = self._vote(indexes["intent"], vector)
+        query_type = INTENT_TYPES[intent]
+
+        # How much closer the query is to its own type than to the nearest exemplar of any other type
+        labels = indexes["intent"][0]
+        same_type = np.array([INTENT_TYPES[label] == query_type for label in labels])
+        similarity = float(similarities[same_type].max())
+        margin = similarity - float(similarities[~same_type].max())
+
+        classification = QueryClassification(query_type=query_type, confidence=confidence, intent=intent, similarity=similarity, margin=margin)
+        if query_type == VETERINARIA:
+            classification.urgency, _, _ = self._vote(indexes["urgency"], vector)
+            classification.needs_search = True
+            classification.refined_query = query
+            classification.filters = extract_filters(query)
+
+        logger.info(f"Local classification: {query_type}/{classification.urgency} ({confidence:.2f})")
+        return classification
+
+    def _embed(self, texts: list):
+        """Unit-length query embeddings"""
+        vectors = np.asarray(self.embedding_function([f"query: {text}" for text in texts]), dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _get_indexes(self) -> dict:
+        """Embed exemplars once (label list + matrix per classification step)"""
+        if self._indexes is None:
+            with self._lock:
+                if self._indexes is None:
+                    self._indexes = {
+                        "intent": self._build_index(INTENT_EXEMPLARS),
+                        "urgency": self._build_index(URGENCY_EXEMPLARS),
+                    }
+        return self._indexes
+
+    def _build_index(self, exemplars: dict) -> tuple:
+        labels = [label for label, texts in exemplars.items() for _ in texts]
+        texts = [text for texts in exemplars.values() for text in texts]
+        return labels, self._embed(texts)
+
+    def _vote(self, index: tuple, vector) -> tuple:
+        """Similarity-weighted vote of the k nearest exemplars, returns (label, share of the vote, similarity per exemplar)"""
+        labels, matrix = index
+        similarities = matrix @ vector
+        nearest = np.argsort(-similarities)[:self.k]
+
+        scores = {}
+        for i in nearest:
+            scores[labels[i]] = scores.get(labels[i], 0.0) + max(float(similarities[i]), 0.0)
+        label = max(scores, key=scores.get)
+        total = sum(scores.values())
+        return label, scores[label] / total if total else 0.0, similarities
+
+# ===================================================
+# CANNED RESPONSE ROUTER
+# ===================================================
+class CannedResponseRouter:
+    """
+    Answer greetings, farewells, thanks and out-of-scope queries with their canned text
+
+    Only routes when the query is very similar to an exemplar of a canned intent and clearly closer
+    to it than to any other type, anything else (e.g. "Hola, mi perro tiene diarrea") goes to the LLM pipeline.
+    """
+
+    def __init__(self, classifier: LocalQueryClassifier, min_similarity: float = 0.90, min_margin: float = 0.03):
+        self.classifier = classifier
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+
+    def route(self, query: str) -> Optional[str]:
+        """Return the canned response for the query, or None if it needs the LLM"""
+        try:
+            classification = self.classifier.classify(query)
+        except Exception as e:
+            logger.error(f"Error routing query: {str(e)}")
+            return None
+
+        if (
+            classification.intent in CANNED_RESPONSES
+            and classification.similarity >= self.min_similarity
+            and classification.margin >= self.min_margin
+        ):
+            logger.info(f"Routed to canned response: {classification.intent}")
+            return CANNED_RESPONSES[classification.intent]
+        return None
@@ -0,0 +1,345 @@
+import time
+import random
+import asyncio
+import threading
+import itertools
+import logging
+
+from tracing import tracer
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Groq free tier limits for llama-3.3-70b-versatile (adjust to the account's plan)
+REQUESTS_PER_MINUTE = 30
+TOKENS_PER_MINUTE = 12000
+REQUESTS_PER_DAY = 1000
+TOKENS_PER_DAY = 100000
+
+# Completion tokens reserved per call before the real usage is known
+ESTIMATED_COMPLETION_TOKENS = 700
+
+# Rough tokens-per-character ratio for Spanish text with Llama's tokenizer
+def estimate_tokens(content) -> int:
+    """Estimate the token count of a prompt (string, list of messages or (role, text) tuples)"""
+    if isinstance(content, str):
+        return len(content) // 4 + 1
+    total = 0
+    for message in content or []:
+        if isinstance(message, dict):
+            total += estimate_tokens(str(message.get("content", ""))) + 4
+        elif isinstance(message, (tuple, list)):
+            total += estimate_tokens(str(message[-1])) + 4
+        else:
+            total += estimate_tokens(str(getattr(message, "content", message))) + 4
+    return total
+
+# Local tokenizer for exact prompt measurements (tiktoken comes with LiteLLM). Llama 3's vocabulary
+# extends cl100k_base, so its counts are close to what Groq bills
+TOKENIZER_ENCODING = "cl100k_base"
+_encoding = None
+
+def count_tokens(content) -> int:
+    """Token count of a prompt (same inputs as estimate_tokens), falling back to the estimate without tiktoken"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e: # Not installed, or the encoding can't be downloaded (offline)
+            logger.warning(f"tiktoken unavailable, estimating tokens from characters: {str(e)}")
+            _encoding = False
+    if _encoding is False:
+        return estimate_tokens(content)
+
+    if isinstance(content, str):
+        return len(_encoding.encode(content, disallowed_special=()))
+    total = 0
+    for message in content or []:
+        if isinstance(message, dict):
+            total += count_tokens(str(message.get("content", ""))) + 4
+        elif isinstance(message, (tuple, list)):
+            total += count_tokens(str(message[-1])) + 4
+        else:
+            total += count_tokens(str(getattr(message, "content", message))) + 4
+    return total
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether an exception is a provider rate limit (HTTP 429) error"""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    error_lower = str(error).lower()
+    return "429" in error_lower or "rate limit" in error_lower or "rate_limit" in error_lower
+
+class RateLimitExceeded(Exception):
+    """Raised instead of queueing when the wait for budget would be too long (e.g. daily quota spent)"""
+
+    def __init__(self, wait_seconds: float, daily: bool):
+        self.wait_seconds = wait_seconds
+        self.daily = daily
+        super().__init__(f"Rate limit budget exhausted ({'daily' if daily else 'per minute'}), retry in {wait_seconds:.0f}s")
+
+# ===================================================
+# TOKEN BUCKET
+# ===================================================
+class TokenBucket:
+    """Bucket holding up to `capacity` units, refilled continuously over `period` seconds"""
+
+    def __init__(self, capacity: float, period: float):
+        self.capacity = capacity
+        self.refill_rate = capacity / period
+        self.available = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (amounts above capacity only wait for a full bucket)"""
+        self.refill()
+        missing = min(amount, self.capacity) - self.available
+        return max(missing, 0.0) / self.refill_rate
+
+    def consume(self, amount: float):
+        """Take units out (negative amounts give them back)"""
+        self.refill()
+        self.available = min(self.capacity, self.available - amount)
+
+    def drain(self):
+        """Empty the bucket (the provider said we're over the limit)"""
+        self.refill()
+        self.available = min(self.available, 0.0)
+
+# ===================================================
+# SCHEDULER
+# ===================================================
+class RateLimitScheduler:
+    """
+    Client-side pacing of LLM calls under per-minute and per-day request/token quotas
+
+    Calls wait in FIFO order until every bucket has budget for them, tokens reserved up front
+    are corrected with the real usage afterwards, and 429 responses are retried with exponential
+    backoff (draining the minute buckets so queued calls back off too). Calls that would wait
+    longer than max_wait raise RateLimitExceeded right away so the UI can report the wait.
+    """
+
+    def __init__(self, requests_per_minute: int = REQUESTS_PER_MINUTE, tokens_per_minute: int = TOKENS_PER_MINUTE, requests_per_day: int = REQUESTS_PER_DAY, tokens_per_day: int = TOKENS_PER_DAY, max_retries: int = 3, max_wait: float = 90.0):
+        self.buckets = {
+            "requests_per_minute": TokenBucket(requests_per_minute, 60),
+            "tokens_per_minute": TokenBucket(tokens_per_minute, 60),
+            "requests_per_day": TokenBucket(requests_per_day, 24 * 60 * 60),
+            "tokens_per_day": TokenBucket(tokens_per_day, 24 * 60 * 60),
+        }
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.rate_limit_errors = 0
+        self._tickets = itertools.count()
+        self._queue = [] # Tickets waiting for budget, in arrival order
+        self._lock = threading.Condition()
+
+    # ---------------------------------------------------
+    # Budget
+    # ---------------------------------------------------
+    def estimate_wait(self, tokens: int = ESTIMATED_COMPLETION_TOKENS) -> float:
+        """Seconds a new call of `tokens` tokens would wait (including the calls queued ahead of it)"""
+        with self._lock:
+            return self._wait_time(tokens * (len(self._queue) + 1), len(self._queue) + 1)
+
+    def status(self) -> dict:
+        """Remaining budget per bucket, queue depth and wait estimate"""
+        with self._lock:
+            for bucket in self.buckets.values():
+                bucket.refill()
+            return {
+                "remaining": {name: int(bucket.available) for name, bucket in self.buckets.items()},
+                "limits": {name: int(bucket.capacity) for name, bucket in self.buckets.items()},
+                "queue_depth": len(self._queue),
+                "estimated_wait_seconds": self._wait_time(ESTIMATED_COMPLETION_TOKENS * (len(self._queue) + 1), len(self._queue) + 1),
+                "rate_limit_errors": self.rate_limit_errors,
+            }
+
+    def record(self, estimated_tokens: int, actual_tokens: int):
+        """Correct the tokens reserved for a finished call with its real usage"""
+        if actual_tokens is None:
+            return
+        with self._lock:
+            for name in ("tokens_per_minute", "tokens_per_day"):
+                self.buckets[name].consume(actual_tokens - estimated_tokens)
+            self._lock.notify_all()
+
+    # ---------------------------------------------------
+    # Acquiring budget
+    # ---------------------------------------------------
+    def acquire(self, tokens: int):
+        """Block until the call can be made (FIFO), then reserve its budget"""
+        with self._lock:
+            ticket = next(self._tickets)
+            self._queue.append(ticket)
+            try:
+                while True:
+                    wait = self._wait_time(tokens) if self._queue[0] == ticket else None
+                    if wait == 0:
+                        self._consume(tokens)
+                        return
+                    self._check_wait(tokens, self._queue.index(ticket) + 1)
+                    self._lock.wait(timeout=wait if wait is not None else 1.0)
+            finally:
+                self._queue.remove(ticket)
+                self._lock.notify_all()
+
+    async def acquire_async(self, tokens: int):
+        """Async counterpart of acquire() (waits with asyncio.sleep, no thread blocked)"""
+        with self._lock:
+            ticket = next(self._tickets)
+            self._queue.append(ticket)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._wait_time(tokens) if self._queue[0] == ticket else None
+                    if wait == 0:
+                        self._consume(tokens)
+                        return
+                    self._check_wait(tokens, self._queue.index(ticket) + 1)
+                await asyncio.sleep(wait if wait is not None else 0.05)
+        finally:
+            with self._lock:
+                self._queue.remove(ticket)
+                self._lock.notify_all()
+
+    # ---------------------------------------------------
+    # Calling
+    # ---------------------------------------------------
+    def call(self, function, estimated_tokens: int, usage=None):
+        """
+        Run function() within the quota, retrying rate limit errors with backoff
+
+        Args:
+            function: Zero-argument callable doing the LLM call
+            estimated_tokens: Prompt + completion tokens reserved before the call
+            usage: Optional callable mapping the result to the real total tokens
+        """
+        with tracer.span("llm_call", estimated_tokens=estimated_tokens) as span:
+            queue_wait = 0.0
+            for attempt in range(self.max_retries + 1):
+                wait_start = time.perf_counter()
+                self.acquire(estimated_tokens)
+                queue_wait += time.perf_counter() - wait_start
+                span.set(attempts=attempt + 1, queue_wait_seconds=queue_wait)
+                try:
+                    result = function()
+                except Exception as e:
+                    tracer.count("llm_requests_total", status="rate_limited" if is_rate_limit_error(e) else "error")
+                    self._on_error(e, estimated_tokens, attempt)
+                    time.sleep(self._backoff(e, attempt))
+                    continue
+                self._record_success(span, estimated_tokens, usage(result) if usage else None, queue_wait)
+                return result
+
+    async def call_async(self, function, estimated_tokens: int, usage=None):
+        """Async counterpart of call(), function() must return an awaitable"""
+        with tracer.span("llm_call", estimated_tokens=estimated_tokens) as span:
+            queue_wait = 0.0
+            for attempt in range(self.max_retries + 1):
+                wait_start = time.perf_counter()
+                await self.acquire_async(estimated_tokens)
+                queue_wait += time.perf_counter() - wait_start
+                span.set(attempts=attempt + 1, queue_wait_seconds=queue_wait)
+                try:
+                    result = await function()
+                except Exception as e:
+                    tracer.count("llm_requests_total", status="rate_limited" if is_rate_limit_error(e) else "error")
+                    self._on_error(e, estimated_tokens, attempt)
+                    await asyncio.sleep(self._backoff(e, attempt))
+                    continue
+                self._record_success(span, estimated_tokens, usage(result) if usage else None, queue_wait)
+                return result
+
+    def call_stream(self, function, estimated_tokens: int, usage=None):
+        """
+        Iterate function()'s stream within the quota, retrying rate limit errors raised before the first chunk
+
+        Chunks already handed out can't be taken back, so errors after the first one are raised.
+        usage maps the chunks received to the real total tokens, the reservation is corrected
+        with them even if the stream fails or the caller stops iterating early.
+        """
+        with tracer.span("llm_call", estimated_tokens=estimated_tokens, streaming=True) as span:
+            queue_wait = 0.0
+            for attempt in range(self.max_retries + 1):
+                wait_start = time.perf_counter()
+                self.acquire(estimated_tokens)
+                queue_wait += time.perf_counter() - wait_start
+                span.set(attempts=attempt + 1, queue_wait_seconds=queue_wait)
+                chunks = []
+                finished = False
+                try:
+                    for chunk in function():
+                        chunks.append(chunk)
+                        yield chunk
+                    finished = True
+                except Exception as e:
+                    tracer.count("llm_requests_total", status="rate_limited" if is_rate_limit_error(e) else "error")
+                    if chunks: # Part of the answer is already out
+                        raise
+                    self._on_error(e, estimated_tokens, attempt)
+                    time.sleep(self._backoff(e, attempt))
+                    continue
+                finally:
+                    if finished:
+                        self._record_success(span, estimated_tokens, usage(chunks) if usage else None, queue_wait)
+                    elif chunks: # Failed or closed midway, the tokens generated so far still count
+                        self.record(estimated_tokens, usage(chunks) if usage else None)
+                return
+
+    def _record_success(self, span, estimated_tokens: int, actual_tokens: int, queue_wait: float):
+        """Correct the reserved tokens and report the finished call"""
+        self.record(estimated_tokens, actual_tokens)
+        span.set(total_tokens=actual_tokens)
+        tracer.count("llm_requests_total", status="ok")
+        tracer.observe("llm_queue_wait_seconds", queue_wait)
+
+    # ---------------------------------------------------
+    # Internals (call with the lock held)
+    # ---------------------------------------------------
+    def _wait_time(self, tokens: int, requests: int = 1) -> float:
+        return max(
+            self.buckets["requests_per_minute"].wait_time(requests),
+            self.buckets["tokens_per_minute"].wait_time(tokens),
+            self.buckets["requests_per_day"].wait_time(requests),
+            self.buckets["tokens_per_day"].wait_time(tokens),
+        )
+
+    def _consume(self, tokens: int):
+        self.buckets["requests_per_minute"].consume(1)
+        self.buckets["tokens_per_minute"].consume(tokens)
+        self.buckets["requests_per_day"].consume(1)
+        self.buckets["tokens_per_day"].consume(tokens)
+
+    def _check_wait(self, tokens: int, position: int):
+        """Raise RateLimitExceeded if the call (at this queue position) would wait too long"""
+        minute_wait = max(self.buckets["requests_per_minute"].wait_time(position), self.buckets["tokens_per_minute"].wait_time(tokens * position))
+        day_wait = max(self.buckets["requests_per_day"].wait_time(position), self.buckets["tokens_per_day"].wait_time(tokens * position))
+        if max(minute_wait, day_wait) > self.max_wait:
+            raise RateLimitExceeded(max(minute_wait, day_wait), daily=day_wait > minute_wait)
+
+    def _on_error(self, error: Exception, estimated_tokens: int, attempt: int):
+        """Re-raise non rate limit errors and the last attempt, otherwise make everyone back off"""
+        self.record(estimated_tokens, 0) # The failed call didn't use its reserved tokens
+        if not is_rate_limit_error(error) or attempt == self.max_retries:
+            raise error
+        self.rate_limit_errors += 1
+        with self._lock:
+            self.buckets["requests_per_minute"].drain()
+            self.buckets["tokens_per_minute"].drain()
+        logger.warning(f"Rate limited by provider (attempt {attempt + 1}/{self.max_retries + 1}): {str(error)}")
+
+    def _backoff(self, error: Exception, attempt: int) -> float:
+        """Retry-After header if the provider sent one, exponential backoff with jitter otherwise"""
+        response = getattr(error, "response", None)
+        retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+        try:
+            return float(retry_after)
+        except (TypeError, ValueError):
+            return min(2 ** attempt * 2, 30) + random.uniform(0, 1)
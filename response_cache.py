@@ -0,0 +1,138 @@
+import time
+import threading
+import logging
+from collections import OrderedDict
+import numpy as np
+
+from tracing import tracer
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Default settings (adjustable)
+# e5 similarities are compressed towards 1.0 ("perro" vs "gato" with the same symptoms still scores ~0.95),
+# so the threshold must stay high to only match rephrasings of the same question
+SIMILARITY_THRESHOLD = 0.97
+TTL_SECONDS = 24 * 60 * 60
+MAX_ENTRIES = 500
+
+# ===================================================
+# SEMANTIC RESPONSE CACHE
+# ===================================================
+class SemanticResponseCache:
+    """
+    In-memory cache of final answers, matched by query embedding similarity
+
+    Entries expire after ttl_seconds, the least recently used entry is evicted once max_entries
+    is reached, and the whole cache is dropped whenever version_function() changes
+    (i.e. the knowledge base was re-indexed).
+    """
+
+    def __init__(self, embedding_function, version_function=None, threshold: float = SIMILARITY_THRESHOLD, ttl_seconds: float = TTL_SECONDS, max_entries: int = MAX_ENTRIES):
+        self.embedding_function = embedding_function
+        self.version_function = version_function
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # query -> (unit vector, answer, stored at), least recently used first
+        self._matrix = None # Stacked vectors of _entries, rebuilt lazily after changes
+        self._keys = []
+        self._version = None
+        self._lock = threading.Lock()
+
+    def lookup(self, query: str):
+        """Return the cached answer of the most similar previous query, or None"""
+        try:
+            vector = self._embed(query)
+        except Exception as e:
+            logger.error(f"Error embedding query for response cache: {str(e)}")
+            return None
+
+        with self._lock:
+            self._check_version()
+            self._expire()
+            if not self._entries:
+                self.misses += 1
+                tracer.count("response_cache_lookups_total", result="miss")
+                return None
+
+            if self._matrix is None:
+                self._keys = list(self._entries.keys())
+                self._matrix = np.stack([self._entries[key][0] for key in self._keys])
+            similarities = self._matrix @ vector
+            best = int(np.argmax(similarities))
+
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                tracer.count("response_cache_lookups_total", result="miss")
+                return None
+
+            key = self._keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            tracer.count("response_cache_lookups_total", result="hit")
+            logger.info(f"Response cache hit: \"{query}\" ≈ \"{key}\" ({similarities[best]:.3f})")
+            return self._entries[key][1]
+
+    def store(self, query: str, answer: str):
+        """Cache the final answer for a query"""
+        if not answer or self.max_entries <= 0:
+            return
+        try:
+            vector = self._embed(query)
+        except Exception as e:
+            logger.error(f"Error embedding query for response cache: {str(e)}")
+            return
+
+        with self._lock:
+            self._check_version()
+            self._entries[query] = (vector, answer, time.monotonic())
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> dict:
+        """Hit/miss counters and occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _embed(self, query: str):
+        """Unit-length query embedding (cosine similarity becomes a dot product)"""
+        vector = np.asarray(self.embedding_function([f"query: {query}"])[0], dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _check_version(self):
+        """Drop every entry if the knowledge base changed since they were stored"""
+        if self.version_function is None:
+            return
+        version = self.version_function()
+        if version != self._version:
+            if self._entries:
+                logger.info("Knowledge base changed, invalidating response cache")
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+
+    def _expire(self):
+        """Drop entries older than the TTL"""
+        now = time.monotonic()
+        expired = [key for key, (_, _, stored_at) in self._entries.items() if now - stored_at > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
@@ -0,0 +1,378 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from main import VeterinaryCrew
+from conversation_memory import ConversationMemory
+from rate_limiter import RateLimitExceeded
+from vector_db import retrieval_engine
+from tracing import tracer
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Service settings (environment variables, so every uvicorn worker process reads the same ones)
+SERVER_MODE = os.getenv("VET_SERVER_MODE", "fast") # Pipeline mode of VeterinaryCrew
+SERVER_MAX_CONCURRENCY = int(os.getenv("VET_SERVER_MAX_CONCURRENCY", "16")) # Queries processed at once per worker process
+SERVER_THREADS = int(os.getenv("VET_SERVER_THREADS", "32")) # Threads per worker process for blocking steps (embedding, search, crews)
+SERVER_TIMEOUT = float(os.getenv("VET_SERVER_TIMEOUT", "120"))
+SERVER_COMPACT_PROMPTS = os.getenv("VET_SERVER_COMPACT_PROMPTS", "").lower() in ("1", "true", "yes")
+SERVER_RESPONSE_CACHE = os.getenv("VET_SERVER_RESPONSE_CACHE", "1").lower() in ("1", "true", "yes")
+
+# Request limits
+MAX_BODY_BYTES = 64 * 1024
+MAX_QUERY_CHARS = 2000
+MAX_BATCH_SIZE = 32
+
+# Conversation memories kept per worker process (a load balancer should pin sessions to a worker)
+MAX_SESSIONS = 1000
+SESSION_TTL_SECONDS = 60 * 60
+
+class HTTPError(Exception):
+    """Error answered as {"error": message} with the given status"""
+
+    def __init__(self, status: int, message: str, headers: list = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or []
+
+# ===================================================
+# SESSIONS
+# ===================================================
+class SessionStore:
+    """Conversation memory per session ID, bounded in count and idle time (least recently used go first)"""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl_seconds: float = SESSION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict() # session ID -> (memory, last used), least recently used first
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: Optional[str]) -> Optional[ConversationMemory]:
+        """Memory of a session (a new one if unknown or expired), None without a session ID"""
+        if not session_id:
+            return None
+        now = time.monotonic()
+        entry = self._sessions.pop(session_id, None)
+        memory = entry[0] if entry is not None and now - entry[1] <= self.ttl_seconds else ConversationMemory()
+        self._sessions[session_id] = (memory, now)
+        while self._sessions:
+            _, (_, last_used) = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - last_used <= self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+        return memory
+
+# ===================================================
+# ASGI APPLICATION
+# ===================================================
+class VeterinaryService:
+    """
+    ASGI application serving a VeterinaryCrew, one per worker process
+
+    Every request of a process shares its crew, and with it the embedding model, the collection
+    and the response cache. The collection and the embedding cache on disk are opened read-only,
+    since every worker process shares them. Blocking steps run in the process's thread pool, at most
+    max_concurrency queries are processed at once.
+
+    Endpoints:
+        POST /query         {"query", "session_id"?, "timeout"?} -> {"response", "seconds"}
+        POST /query/stream  same body, server-sent events (classification, retrieval, token..., done)
+        POST /query/batch   {"queries": [...], "timeout"?} -> {"results": [{"response"} | {"error", "status"}]}
+        GET  /health        Liveness (the process answers)
+        GET  /ready         Readiness (embedding model loaded and collection open), 503 until then
+        GET  /metrics       Prometheus counters and histograms (with VET_TRACING=1)
+    """
+
+    def __init__(self, mode: str = SERVER_MODE, max_concurrency: int = SERVER_MAX_CONCURRENCY, threads: int = SERVER_THREADS, request_timeout: float = SERVER_TIMEOUT, compact_prompts: bool = SERVER_COMPACT_PROMPTS, use_response_cache: bool = SERVER_RESPONSE_CACHE):
+        self.mode = mode
+        self.max_concurrency = max_concurrency
+        self.threads = threads
+        self.request_timeout = request_timeout
+        self.compact_prompts = compact_prompts
+        self.use_response_cache = use_response_cache
+        self.crew = None
+        self.sessions = SessionStore()
+        self.started_at = None
+        self.routes = {
+            ("POST", "/query"): self.query,
+            ("POST", "/query/stream"): self.query_stream,
+            ("POST", "/query/batch"): self.query_batch,
+            ("GET", "/health"): self.health,
+            ("GET", "/ready"): self.ready,
+            ("GET", "/metrics"): self.metrics,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        path = scope["path"].rstrip("/") or "/"
+        handler = self.routes.get((scope["method"], path))
+        start = time.perf_counter()
+        status = 500
+        try:
+            if handler is None:
+                raise HTTPError(405 if any(route_path == path for _, route_path in self.routes) else 404, "Ruta no encontrada")
+            if self.crew is None:
+                self._start()
+            status = await handler(scope, receive, send)
+        except HTTPError as e:
+            status = e.status
+            await self._send_json(send, e.status, {"error": e.message}, e.headers)
+        except Exception as e:
+            logger.error(f"Error handling {scope['method']} {path}: {str(e)}")
+            await self._send_json(send, 500, {"error": "Error interno del servidor"})
+        finally:
+            route = path if handler is not None else "other" # Unknown paths would blow up the label cardinality
+            tracer.count("http_requests_total", route=route, status=str(status))
+            tracer.observe("http_request_seconds", time.perf_counter() - start, route=route)
+
+    # ---------------------------------------------------
+    # Lifecycle
+    # ---------------------------------------------------
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    self._start()
+                except Exception as e:
+                    logger.error(f"Error starting service: {str(e)}")
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                tracer.disable() # Closes the span log
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _start(self):
+        """Build the crew and start loading the model (readiness turns true once it's loaded)"""
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="service-worker"))
+        # Worker processes share the index and the embedding cache, which support a single writer:
+        # the service only reads them (python vector_db.py / ingest.py update the index)
+        retrieval_engine.read_only = True
+        self.crew = VeterinaryCrew(
+            mode=self.mode,
+            use_response_cache=self.use_response_cache,
+            max_concurrency=self.max_concurrency,
+            request_timeout=self.request_timeout,
+            compact_prompts=self.compact_prompts,
+        )
+        self.started_at = time.time()
+        retrieval_engine.warm_up(background=True)
+        logger.info(f"Service started (pid {os.getpid()}, mode {self.mode}, LLM backend {self.crew.llm_backend.name}, {self.max_concurrency} concurrent queries, {self.threads} threads)")
+
+    # ---------------------------------------------------
+    # Endpoints
+    # ---------------------------------------------------
+    async def query(self, scope, receive, send) -> int:
+        body = await self._read_json(receive)
+        query, memory, timeout = self._query_text(body.get("query")), self.sessions.get(self._session_id(body)), self._timeout(body)
+        start = time.perf_counter()
+        try:
+            response_text = await self.crew.arun(query, timeout=timeout, memory=memory)
+        except Exception as e:
+            raise self._query_error(e)
+        await self._send_json(send, 200, {"response": response_text, "seconds": time.perf_counter() - start})
+        return 200
+
+    async def query_stream(self, scope, receive, send) -> int:
+        body = await self._read_json(receive)
+        query, memory = self._query_text(body.get("query")), self.sessions.get(self._session_id(body))
+
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-cache")]})
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        stop = threading.Event()
+
+        # The generator runs in a single thread from start to end, so its tracing spans stay nested
+        def produce():
+            iterator = self.crew.stream(query, memory=memory)
+            try:
+                for event in iterator:
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+                    if stop.is_set(): # Client gone, the rest of the answer is dropped
+                        iterator.close()
+                        break
+            except Exception as e:
+                loop.call_soon_threadsafe(events.put_nowait, {"type": "error", "error": self._query_error(e).message})
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, None)
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            stop.set()
+
+        async with self.crew.concurrency_limit(): # Same limit as the /query requests
+            watcher = asyncio.ensure_future(watch_disconnect())
+            producer = asyncio.ensure_future(asyncio.to_thread(produce))
+            try:
+                while (event := await events.get()) is not None:
+                    if not stop.is_set():
+                        await send({"type": "http.response.body", "body": self._sse(event), "more_body": True})
+                await producer
+            finally:
+                watcher.cancel()
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+        return 200
+
+    async def query_batch(self, scope, receive, send) -> int:
+        body = await self._read_json(receive)
+        queries = body.get("queries")
+        if not isinstance(queries, list) or not queries:
+            raise HTTPError(400, "'queries' debe ser una lista no vacía")
+        if len(queries) > MAX_BATCH_SIZE:
+            raise HTTPError(400, f"Máximo {MAX_BATCH_SIZE} consultas por lote")
+        queries = [self._query_text(query) for query in queries]
+
+        start = time.perf_counter()
+        results = []
+        for result in await self.crew.run_many(queries, timeout=self._timeout(body)):
+            if isinstance(result, Exception):
+                error = self._query_error(result)
+                results.append({"error": error.message, "status": error.status})
+            else:
+                results.append({"response": result})
+        await self._send_json(send, 200, {"results": results, "seconds": time.perf_counter() - start})
+        return 200
+
+    async def health(self, scope, receive, send) -> int:
+        await self._send_json(send, 200, {"status": "ok", "pid": os.getpid(), "uptime_seconds": time.time() - self.started_at})
+        return 200
+
+    async def ready(self, scope, receive, send) -> int:
+        status = retrieval_engine.warm_status()
+        ready = all(status.values())
+        await self._send_json(send, 200 if ready else 503, {"ready": ready, **status, "llm_backend": self.crew.llm_backend.name, "response_cache": self.use_response_cache, "sessions": len(self.sessions)})
+        return 200 if ready else 503
+
+    async def metrics(self, scope, receive, send) -> int:
+        body = tracer.metrics.render().encode("utf-8")
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain; version=0.0.4; charset=utf-8"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+        return 200
+
+    # ---------------------------------------------------
+    # Helpers
+    # ---------------------------------------------------
+    @staticmethod
+    async def _read_json(receive) -> dict:
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise HTTPError(400, "Conexión cerrada por el cliente")
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise HTTPError(413, f"El cuerpo de la solicitud excede {MAX_BODY_BYTES} bytes")
+            chunks.append(chunk)
+            if not message.get("more_body", False):
+                break
+        try:
+            body = json.loads(b"".join(chunks) or b"{}")
+        except ValueError:
+            raise HTTPError(400, "El cuerpo de la solicitud no es JSON válido")
+        if not isinstance(body, dict):
+            raise HTTPError(400, "El cuerpo de la solicitud debe ser un objeto JSON")
+        return body
+
+    @staticmethod
+    def _query_text(query) -> str:
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(400, "'query' debe ser un texto no vacío")
+        if len(query) > MAX_QUERY_CHARS:
+            raise HTTPError(400, f"La consulta excede {MAX_QUERY_CHARS} caracteres")
+        return query.strip()
+
+    @staticmethod
+    def _session_id(body: dict) -> Optional[str]:
+        session_id = body.get("session_id")
+        if session_id is not None and (not isinstance(session_id, str) or len(session_id) > 128):
+            raise HTTPError(400, "'session_id' debe ser un texto de hasta 128 caracteres")
+        return session_id
+
+    def _timeout(self, body: dict) -> float:
+        timeout = body.get("timeout", self.request_timeout)
+        if not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise HTTPError(400, "'timeout' debe ser un número de segundos positivo")
+        return min(timeout, self.request_timeout)
+
+    @staticmethod
+    def _query_error(error: Exception) -> HTTPError:
+        """HTTP error for an exception raised while answering a query"""
+        if isinstance(error, RateLimitExceeded):
+            return HTTPError(429, f"Límite de solicitudes alcanzado, intenta de nuevo en {max(round(error.wait_seconds), 1)} segundos", [(b"retry-after", str(max(round(error.wait_seconds), 1)).encode())])
+        if isinstance(error, asyncio.TimeoutError):
+            return HTTPError(504, "La consulta excedió el tiempo máximo de respuesta")
+        logger.error(f"Error processing query: {str(error)}")
+        return HTTPError(500, "Error al procesar la consulta")
+
+    @staticmethod
+    def _sse(event: dict) -> bytes:
+        """Server-sent event of a stream() event"""
+        if event["type"] == "classification":
+            classification = event["classification"]
+            event = {
+                "type": "classification",
+                "query_type": classification.query_type,
+                "urgency": classification.urgency,
+                "needs_search": classification.needs_search,
+                "refined_query": classification.refined_query,
+                "seconds": event["seconds"],
+            }
+        elif event["type"] == "retrieval":
+            event = {"type": "retrieval", "found": event["knowledge"] is not None, "seconds": event["seconds"]}
+        return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+
+    @staticmethod
+    async def _send_json(send, status: int, data: dict, headers: list = None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *(headers or [])]})
+        await send({"type": "http.response.body", "body": body})
+
+app = VeterinaryService()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the veterinary chatbot over HTTP (ASGI, uvicorn)")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (0.0.0.0 behind a load balancer)")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes, each loads the embedding model once")
+    parser.add_argument("--threads", type=int, default=SERVER_THREADS, help="Threads per worker for blocking steps")
+    parser.add_argument("--max-concurrency", type=int, default=SERVER_MAX_CONCURRENCY, help="Queries processed at once per worker")
+    parser.add_argument("--mode", default=SERVER_MODE, choices=VeterinaryCrew.PIPELINE_MODES, help="Pipeline mode")
+    parser.add_argument("--llm-backend", help="groq or stub (defaults to VET_LLM_BACKEND or groq)")
+    parser.add_argument("--compact-prompts", action="store_true", help="Use the compact prompts")
+    parser.add_argument("--no-response-cache", action="store_true", help="Answer every query with the pipeline (load tests)")
+    args = parser.parse_args()
+
+    # Worker processes import this module again, the settings reach them through the environment
+    os.environ.update({
+        "VET_SERVER_MODE": args.mode,
+        "VET_SERVER_THREADS": str(args.threads),
+        "VET_SERVER_MAX_CONCURRENCY": str(args.max_concurrency),
+        "VET_SERVER_COMPACT_PROMPTS": "1" if args.compact_prompts or SERVER_COMPACT_PROMPTS else "0",
+        "VET_SERVER_RESPONSE_CACHE": "0" if args.no_response_cache or not SERVER_RESPONSE_CACHE else "1",
+    })
+    if args.llm_backend:
+        os.environ["VET_LLM_BACKEND"] = args.llm_backend
+
+    import uvicorn
+    uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers, log_level="info")
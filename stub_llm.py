@@ -0,0 +1,338 @@
+import os
+import re
+import time
+import json
+import math
+import random
+import asyncio
+import threading
+import unicodedata
+import logging
+from types import SimpleNamespace
+from typing import Any, Iterator, AsyncIterator, List, Optional
+
+from crewai.llms.base_llm import BaseLLM
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict, Field
+
+from query_router import (
+    extract_filters,
+    VETERINARIA,
+    SISTEMA,
+    FUERA_DE_ALCANCE,
+    EMERGENCIA,
+    NO_EMERGENCIA,
+    GREETING_RESPONSE,
+    FAREWELL_RESPONSE,
+    THANKS_RESPONSE,
+    OUT_OF_SCOPE_RESPONSE,
+)
+from rate_limiter import count_tokens
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds before each stub call answers (its first token when streaming), as a distribution:
+# "0.5" or "fixed:0.5", "uniform:0.2,0.8", "normal:0.8,0.2" (mean, std), "lognormal:0.8,0.5" (median, sigma),
+# "exponential:0.8" (mean). A Groq call of the specialist takes 1-3 s
+STUB_LATENCY = os.getenv("VET_STUB_LATENCY", "fixed:0.5")
+STUB_TOKEN_LATENCY = float(os.getenv("VET_STUB_TOKEN_LATENCY", "0")) # Seconds per completion token on top (Groq generates ~250 tokens/s)
+STUB_RESPONSE_TOKENS = int(os.getenv("VET_STUB_RESPONSE_TOKENS", "0")) # Specialist answers padded to about this many tokens (0: scripted length)
+STUB_SEED = int(os.getenv("VET_STUB_SEED", "0")) # Same seed, same sequence of latencies
+
+# Sentences padding the specialist's answers up to the response tokens
+FILLER_SENTENCES = [
+    "Se recomienda confirmar el diagnóstico con pruebas complementarias antes de iniciar el tratamiento.",
+    "La dosis debe ajustarse al peso, la edad y la función renal y hepática del paciente.",
+    "Vigila la hidratación, el apetito y la actitud del animal durante las primeras 48 horas.",
+    "Ante cualquier empeoramiento, el paciente debe ser valorado de nuevo por un veterinario.",
+]
+
+# Keywords of the scripted classification (lowercase, without accents)
+SYSTEM_KEYWORDS = {
+    "farewell": ["adios", "hasta luego", "hasta pronto", "nos vemos", "bye"],
+    "thanks": ["gracias", "te lo agradezco"],
+    "greeting": ["hola", "buenos dias", "buenas tardes", "buenas noches", "que puedes hacer", "quien eres"],
+}
+VETERINARY_KEYWORDS = ["perro", "perra", "cachorro", "gato", "gata", "gatito", "mascota", "canin", "felin", "veterinari", "sintoma", "tratamiento", "dosis", "diagnostic", "vacuna", "enfermedad", "vomit", "diarrea", "cojera", "parvo", "anestesia"]
+EMERGENCY_KEYWORDS = ["chocolate", "convuls", "sangr", "hemorragia", "no respira", "no puede respirar", "intoxic", "veneno", "atropell", "shock", "hinchado", "muy debil"]
+
+# Where the prompts of VeterinaryTasks carry the values the script needs
+QUERY_PATTERN = re.compile(r"(?:CONSULTA(?: ORIGINAL)?|Clasifica la consulta):\s*(.+)")
+REFINED_QUERY_PATTERN = re.compile(r"Consulta refinada:\s*(.+)")
+TOOL_NAME_PATTERN = re.compile(r"Tool Name:\s*(.+)")
+CLASSIFICATION_MARKERS = ("clasificala", "Clasifica la consulta")
+
+def _normalize(text: str) -> str:
+    return "".join(char for char in unicodedata.normalize("NFD", text.lower()) if unicodedata.category(char) != "Mn")
+
+# ===================================================
+# LATENCY AND USAGE
+# ===================================================
+class LatencyDistribution:
+    """Seconds a stub call waits, sampled from a distribution spec ("kind:param,param", see STUB_LATENCY)"""
+
+    PARAMETERS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exponential": 1}
+
+    def __init__(self, spec):
+        self.spec = str(spec)
+        kind, _, params = self.spec.partition(":")
+        if not params: # A bare number is a fixed latency
+            kind, params = "fixed", kind
+        try:
+            self.params = [float(param) for param in params.split(",")]
+        except ValueError:
+            raise ValueError(f"Invalid latency spec '{self.spec}'")
+        if self.PARAMETERS.get(kind) != len(self.params) or any(param < 0 for param in self.params):
+            raise ValueError(f"Invalid latency spec '{self.spec}', expected one of {list(self.PARAMETERS)} with non-negative parameters")
+        self.kind = kind
+
+    def __repr__(self) -> str:
+        return f"LatencyDistribution('{self.spec}')"
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "normal":
+            return max(rng.gauss(*self.params), 0.0)
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(self.params[0]), self.params[1]) if self.params[0] > 0 else 0.0
+        return rng.expovariate(1 / self.params[0]) if self.params[0] > 0 else 0.0
+
+class StubStats:
+    """Calls, tokens and simulated seconds of the stub LLMs sharing it (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.prompt_tokens = 0
+            self.completion_tokens = 0
+            self.latency_seconds = 0.0
+
+    def add(self, prompt_tokens: int, completion_tokens: int, latency_seconds: float):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.latency_seconds += latency_seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "mean_latency_seconds": self.latency_seconds / self.calls if self.calls else 0.0,
+            }
+
+class StubSettings:
+    """Behaviour shared by the CrewAI and LangChain stubs: latency, answer length, seed and counters"""
+
+    def __init__(self, latency=STUB_LATENCY, token_latency: float = STUB_TOKEN_LATENCY, response_tokens: int = STUB_RESPONSE_TOKENS, seed: int = STUB_SEED, stats: StubStats = None):
+        self.latency = latency if isinstance(latency, LatencyDistribution) else LatencyDistribution(latency)
+        self.token_latency = token_latency
+        self.response_tokens = response_tokens
+        self.seed = seed
+        self.stats = stats or StubStats()
+        # One generator per stub, so repeated prompts get fresh latencies; under concurrency the calls
+        # draw from the same sequence in whatever order they land, same samples on every rerun
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def respond(self, messages) -> tuple:
+        """(scripted answer, prompt tokens, completion tokens, first token seconds, seconds per completion token)"""
+        prompt, last_message = _prompt(messages)
+        text = scripted_response(prompt, last_message, self.response_tokens)
+        prompt_tokens, completion_tokens = count_tokens(prompt), count_tokens(text)
+        with self._rng_lock:
+            first_token_seconds = self.latency.sample(self._rng)
+        self.stats.add(prompt_tokens, completion_tokens, first_token_seconds + completion_tokens * self.token_latency)
+        return text, prompt_tokens, completion_tokens, first_token_seconds, self.token_latency
+
+# ===================================================
+# SCRIPT
+# ===================================================
+def scripted_classification(query: str) -> tuple:
+    """(query type, urgency, system intent) from keywords, the same answer every time"""
+    text = _normalize(query)
+    if any(word in text for word in VETERINARY_KEYWORDS) or extract_filters(query):
+        urgency = EMERGENCIA if any(word in text for word in EMERGENCY_KEYWORDS) else NO_EMERGENCIA
+        return VETERINARIA, urgency, None
+    for intent, words in SYSTEM_KEYWORDS.items():
+        if any(word in text for word in words):
+            return SISTEMA, None, intent
+    return FUERA_DE_ALCANCE, None, None
+
+def classification_output(query: str) -> str:
+    """Classification agent's expected output for a query"""
+    query_type, urgency, _ = scripted_classification(query)
+    if query_type != VETERINARIA:
+        return f"- Tipo: {query_type}\n- Búsqueda de información necesaria: No"
+    filters = extract_filters(query)
+    return "\n".join([
+        f"- Tipo: {query_type}",
+        f"- Urgencia: {urgency}",
+        "- Búsqueda de información necesaria: Sí",
+        f"- Consulta refinada: {query}",
+        f"- Filtros: enfermedad={(filters and filters.disease) or '-'}, categoría={(filters and filters.category) or '-'}, especie={(filters and filters.species) or '-'}",
+    ])
+
+def pad_response(text: str, response_tokens: int) -> str:
+    """Text followed by filler sentences up to about response_tokens tokens"""
+    sentences = [text]
+    while count_tokens(" ".join(sentences)) < response_tokens:
+        sentences.append(FILLER_SENTENCES[(len(sentences) - 1) % len(FILLER_SENTENCES)])
+    return " ".join(sentences)
+
+def specialist_output(query: str, response_tokens: int = 0) -> str:
+    """Specialist's answer: the canned texts for system/out-of-scope queries, a fixed text (padded to response_tokens) otherwise"""
+    query_type, urgency, intent = scripted_classification(query)
+    if query_type == SISTEMA:
+        return {"farewell": FAREWELL_RESPONSE, "thanks": THANKS_RESPONSE}.get(intent, GREETING_RESPONSE)
+    if query_type == FUERA_DE_ALCANCE:
+        return OUT_OF_SCOPE_RESPONSE
+    prefix = "⚠️ EMERGENCIA VETERINARIA:\n\n" if urgency == EMERGENCIA else ""
+    return pad_response(f"{prefix}Respuesta simulada a \"{query}\" (LLM de prueba, sin conexión a Groq). La información recuperada de la base de conocimientos se resumiría aquí con sus dosis, protocolos y valores diagnósticos.", response_tokens)
+
+def scripted_response(prompt: str, last_message: str = "", response_tokens: int = 0) -> str:
+    """
+    ReAct-formatted answer of a CrewAI agent, recognised from its prompt
+
+    The retrieval agent first gets an Action calling its tool, then a Final Answer repeating
+    the tool's Observation. Direct chat calls (the specialist) use only the text after "Final Answer:".
+    """
+    query_match = QUERY_PATTERN.search(prompt)
+    query = query_match.group(1).strip() if query_match else prompt.strip().splitlines()[-1] if prompt.strip() else ""
+
+    tool_match = TOOL_NAME_PATTERN.search(prompt)
+    if tool_match: # Retrieval agent
+        if "\nObservation:" in last_message:
+            return f"Thought: I now know the final answer\nFinal Answer: {last_message.rsplit('Observation:', 1)[1].strip()}"
+        refined_match = REFINED_QUERY_PATTERN.search(prompt)
+        if refined_match is None:
+            return "Thought: I now know the final answer\nFinal Answer: BÚSQUEDA NO REQUERIDA"
+        tool_input = json.dumps({"query": refined_match.group(1).strip()}, ensure_ascii=False)
+        return f"Thought: Busco la consulta refinada\nAction: {tool_match.group(1).strip()}\nAction Input: {tool_input}"
+
+    if any(marker in prompt for marker in CLASSIFICATION_MARKERS):
+        return f"Thought: I now can give a great answer\nFinal Answer: {classification_output(query)}"
+    return f"Thought: I now can give a great answer\nFinal Answer: {specialist_output(query, response_tokens)}"
+
+def _message_text(message) -> str:
+    if isinstance(message, dict):
+        return str(message.get("content", ""))
+    if isinstance(message, (tuple, list)):
+        return str(message[-1])
+    return str(getattr(message, "content", message))
+
+def _prompt(messages) -> tuple:
+    """(whole prompt text, last message text)"""
+    if isinstance(messages, str):
+        return messages, messages
+    texts = [_message_text(message) for message in messages or []]
+    return "\n".join(texts), texts[-1] if texts else ""
+
+# ===================================================
+# STUB LLMS
+# ===================================================
+class StubLLM(BaseLLM):
+    """
+    CrewAI LLM answering from the script after a sampled delay (no network, no API key)
+
+    Token counts are reported to CrewAI's callbacks like LiteLLM's usage, so CrewOutput.token_usage
+    and the agents' token totals work as with Groq.
+    """
+
+    def __init__(self, settings: StubSettings = None):
+        super().__init__(model="stub", temperature=0)
+        self.settings = settings or StubSettings()
+
+    @property
+    def stats(self) -> StubStats:
+        return self.settings.stats
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None, from_agent=None) -> str:
+        start = time.time()
+        text, prompt_tokens, completion_tokens, first_token_seconds, token_seconds = self.settings.respond(messages)
+        time.sleep(first_token_seconds + completion_tokens * token_seconds)
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens, prompt_tokens_details=None)
+        for callback in callbacks or []:
+            if hasattr(callback, "log_success_event"):
+                callback.log_success_event(kwargs={"model": self.model}, response_obj={"usage": usage}, start_time=start, end_time=time.time())
+        return text
+
+    def supports_function_calling(self) -> bool:
+        return False # Tools go through the ReAct text format the script writes
+
+class StubChatModel(BaseChatModel):
+    """LangChain chat model for the direct specialist calls (invoke, ainvoke and stream), answering from the script with usage_metadata"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    settings: StubSettings = Field(default_factory=StubSettings)
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    @property
+    def stats(self) -> StubStats:
+        return self.settings.stats
+
+    def _respond(self, messages: List[BaseMessage]) -> tuple:
+        """(answer message, first token seconds, seconds per completion token)"""
+        text, prompt_tokens, completion_tokens, first_token_seconds, token_seconds = self.settings.respond(messages)
+        usage = {"input_tokens": prompt_tokens, "output_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        message = AIMessage(content=text.split("Final Answer:", 1)[-1].strip(), usage_metadata=usage)
+        return message, first_token_seconds, completion_tokens * token_seconds
+
+    def _result(self, message: AIMessage) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"token_usage": message.usage_metadata, "model_name": "stub"})
+
+    @staticmethod
+    def _chunks(message: AIMessage) -> list:
+        """Word chunks of an answer, the last one carrying the usage (like a provider's final stream chunk)"""
+        words = re.findall(r"\S+\s*", message.content) or [""]
+        return [AIMessageChunk(content=word, usage_metadata=message.usage_metadata if i == len(words) - 1 else None) for i, word in enumerate(words)]
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        message, first_token_seconds, generation_seconds = self._respond(messages)
+        time.sleep(first_token_seconds + generation_seconds)
+        return self._result(message)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        message, first_token_seconds, generation_seconds = self._respond(messages)
+        await asyncio.sleep(first_token_seconds + generation_seconds) # Doesn't hold a thread, like the real async client
+        return self._result(message)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        message, first_token_seconds, generation_seconds = self._respond(messages)
+        chunks = self._chunks(message)
+        time.sleep(first_token_seconds) # Time to first token
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(generation_seconds / len(chunks))
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        message, first_token_seconds, generation_seconds = self._respond(messages)
+        chunks = self._chunks(message)
+        await asyncio.sleep(first_token_seconds)
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(generation_seconds / len(chunks))
+            yield ChatGenerationChunk(message=chunk)
+
+def create_stub_llms(latency=STUB_LATENCY, token_latency: float = STUB_TOKEN_LATENCY, response_tokens: int = STUB_RESPONSE_TOKENS, seed: int = STUB_SEED) -> tuple:
+    """(CrewAI LLM, chat model) sharing one set of settings and counters"""
+    settings = StubSettings(latency=latency, token_latency=token_latency, response_tokens=response_tokens, seed=seed)
+    return StubLLM(settings), StubChatModel(settings=settings)
@@ -0,0 +1,83 @@
+import zlib
+import unittest
+
+import numpy as np
+
+from conversation_memory import ConversationMemory, is_follow_up
+from response_cache import SemanticResponseCache
+
+def fake_embedding_function(texts: list) -> list:
+    """Same text, same vector; different texts are nearly orthogonal"""
+    return [np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(64) for text in texts]
+
+class FollowUpTest(unittest.TestCase):
+    def test_short_standalone_questions_are_not_follow_ups(self):
+        for query in ("¿Qué es el parvovirus canino?", "Tengo dolor de cabeza", "¿Cómo estás?", "Mi gato no come", "Hola", "Síntomas de diabetes"):
+            with self.subTest(query=query):
+                self.assertFalse(is_follow_up(query))
+
+    def test_follow_ups(self):
+        for query in ("¿y la dosis?", "¿Y en gatos?", "¿Eso es grave?", "La dosis", "¿Cuánto tiempo dura?", "Pero ¿es contagioso?", "¿Y si vomita?"):
+            with self.subTest(query=query):
+                self.assertTrue(is_follow_up(query))
+
+    def test_long_queries_stand_alone(self):
+        self.assertFalse(is_follow_up("Y si mi perro lleva tres días vomitando y no quiere comer nada"))
+
+class ContextualizeTest(unittest.TestCase):
+    def setUp(self):
+        self.memory = ConversationMemory()
+        self.memory.add_turn("Mi perro comió chocolate", "⚠️ EMERGENCIA VETERINARIA: acude al veterinario.")
+
+    def test_follow_up_gets_previous_question(self):
+        self.assertEqual(self.memory.contextualize("¿y la dosis?"), "Mi perro comió chocolate ¿y la dosis?")
+
+    def test_standalone_short_questions_are_kept(self):
+        for query in ("¿Qué es el parvovirus canino?", "Tengo dolor de cabeza"):
+            with self.subTest(query=query):
+                self.assertEqual(self.memory.contextualize(query), query)
+
+    def test_no_history(self):
+        self.assertEqual(ConversationMemory().contextualize("¿y la dosis?"), "¿y la dosis?")
+
+class SharedResponseCacheTest(unittest.TestCase):
+    """Two chats asking the same short question about different diseases (VeterinaryCrew's cache flow)"""
+
+    def setUp(self):
+        self.cache = SemanticResponseCache(fake_embedding_function)
+
+    def ask(self, memory: ConversationMemory, query: str, answer: str) -> str:
+        cache_key = memory.cache_key(query)
+        cached_answer = self.cache.lookup(cache_key) if cache_key is not None else None
+        if cached_answer is not None:
+            answer = cached_answer
+        elif cache_key is not None:
+            self.cache.store(cache_key, answer)
+        memory.add_turn(query, answer)
+        return answer
+
+    def test_history_dependent_answers_stay_in_their_chat(self):
+        parvovirus_chat, diabetes_chat = ConversationMemory(), ConversationMemory()
+        self.ask(parvovirus_chat, "¿Qué es el parvovirus canino?", "Gastroenteritis viral aguda.")
+        self.ask(diabetes_chat, "¿Qué es la diabetes felina?", "Trastorno endocrino.")
+
+        self.assertEqual(self.ask(parvovirus_chat, "¿Es contagioso?", "Sí, muy contagioso por vía fecal-oral."), "Sí, muy contagioso por vía fecal-oral.")
+        self.assertEqual(self.ask(diabetes_chat, "¿Es contagioso?", "No, la diabetes no se contagia."), "No, la diabetes no se contagia.")
+
+    def test_standalone_questions_are_shared(self):
+        first_chat, second_chat = ConversationMemory(), ConversationMemory()
+        self.ask(first_chat, "Hola", "¡Hola!")
+        self.ask(first_chat, "¿Qué es el parvovirus canino?", "Gastroenteritis viral aguda.")
+        self.assertEqual(self.ask(second_chat, "¿Qué es el parvovirus canino?", "Otra respuesta."), "Gastroenteritis viral aguda.")
+
+    def test_cache_keys(self):
+        memory = ConversationMemory()
+        self.assertEqual(memory.cache_key("¿Es contagioso?"), "¿Es contagioso?") # No history yet
+        memory.add_turn("¿Qué es el parvovirus canino?", "Gastroenteritis viral aguda.")
+        for query in ("¿Es contagioso?", "¿Cómo se trata?", "¿Qué dosis?", "¿y en gatos?"):
+            with self.subTest(query=query):
+                self.assertIsNone(memory.cache_key(query))
+        self.assertEqual(memory.cache_key("Síntomas de diabetes en gatos"), "Síntomas de diabetes en gatos")
+
+if __name__ == "__main__":
+    unittest.main()
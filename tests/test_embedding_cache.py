@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from embedding_cache import CachedEmbeddingFunction, EmbeddingCache
+
+def vector(value: float):
+    return np.full(4, value, dtype=np.float32)
+
+class EmbeddingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def open(self, max_entries: int = 3) -> EmbeddingCache:
+        return EmbeddingCache(self.cache_dir, "test/model", max_entries=max_entries)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = self.open()
+        cache.put_many(["a", "b", "c"], [vector(1), vector(2), vector(3)])
+        cache.get("a") # b becomes the least recently used
+        cache.put_many(["d"], [vector(4)])
+        self.assertIsNone(cache.get("b"))
+        np.testing.assert_array_equal(cache.get("a"), vector(1))
+        np.testing.assert_array_equal(cache.get("d"), vector(4))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_reopened_cache_replays_the_log(self):
+        cache = self.open()
+        cache.put_many(["a", "b", "c"], [vector(1), vector(2), vector(3)])
+        cache.put_many(["d", "e"], [vector(4), vector(5)])
+
+        reopened = self.open()
+        self.assertEqual(reopened.stats()["entries"], 3)
+        self.assertIsNone(reopened.get("a"))
+        self.assertIsNone(reopened.get("b"))
+        for key, value in (("c", 3), ("d", 4), ("e", 5)):
+            np.testing.assert_array_equal(reopened.get(key), vector(value))
+
+    def test_crash_before_the_remap_drops_the_evicted_key(self):
+        cache = self.open()
+        cache.put_many(["a", "b", "c"], [vector(1), vector(2), vector(3)])
+        row = cache._entries["a"]
+        # Crash after the row was released and overwritten, before the new key was logged
+        cache._append_log([f"- {row}\n"])
+        cache._vectors[row] = vector(9)
+        cache._vectors.flush()
+
+        reopened = self.open()
+        self.assertIsNone(reopened.get("a"))
+        np.testing.assert_array_equal(reopened.get("b"), vector(2))
+        reopened.put_many(["d"], [vector(4)]) # The released row is free again, nothing is evicted
+        self.assertEqual(reopened.stats()["evictions"], 0)
+        np.testing.assert_array_equal(self.open().get("d"), vector(4))
+
+    def test_cache_built_with_another_size_is_discarded(self):
+        cache = self.open()
+        cache.put_many(["a"], [vector(1)])
+
+        resized = self.open(max_entries=5)
+        self.assertEqual(resized.stats()["entries"], 0)
+        self.assertFalse(os.listdir(resized.path))
+
+    def test_cached_function_only_embeds_misses(self):
+        embedded = []
+        def factory():
+            def embed(texts):
+                embedded.extend(texts)
+                return [vector(len(text)) for text in texts]
+            return embed
+
+        function = CachedEmbeddingFunction(factory, "test/model", self.open())
+        function(["uno", "dos"])
+        vectors = function(["uno", "tres", "tres"])
+        self.assertEqual(embedded, ["uno", "dos", "tres"])
+        np.testing.assert_array_equal(vectors[2], vector(4))
+
+if __name__ == "__main__":
+    unittest.main()
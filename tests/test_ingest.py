@@ -0,0 +1,74 @@
+import os
+import json
+import zlib
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import vector_db
+from ingest import ingest_directory, MANIFEST_FILE
+
+TEXT = "El parvovirus canino causa vómitos severos y diarrea hemorrágica en cachorros no vacunados. " * 5
+
+def fake_embedding_function(texts: list) -> list:
+    return [np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(16) for text in texts]
+
+class IngestDirectoryTest(unittest.TestCase):
+    """Manifest, chunk files and collection of ingested folders (NumPy backend, fake embeddings)"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.engine = vector_db.RetrievalEngine(db_path=os.path.join(self.path, "db"), backend="numpy", cache_size=0, ingested_chunks_path=os.path.join(self.path, "chunks"))
+        self.engine._embedding_function = fake_embedding_function
+        patcher = mock.patch.object(vector_db, "retrieval_engine", self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for folder in ("a", "b"):
+            os.makedirs(os.path.join(self.path, folder))
+            self.write(folder, "manual.txt")
+
+    def write(self, folder: str, name: str, text: str = TEXT):
+        with open(os.path.join(self.path, folder, name), "w", encoding="utf-8") as document:
+            document.write(text)
+
+    def ingest(self, folder: str) -> dict:
+        return ingest_directory(os.path.join(self.path, folder), workers=1)
+
+    def manifest(self) -> dict:
+        with open(os.path.join(self.path, "chunks", MANIFEST_FILE), encoding="utf-8") as manifest_file:
+            return json.load(manifest_file)
+
+    def chunk_sources(self) -> list:
+        return sorted(metadata["chunk_source"] for metadata in self.engine.collection.get()["metadatas"])
+
+    def test_same_file_name_in_two_folders(self):
+        self.ingest("a")
+        chunks = self.engine.collection.count()
+        self.ingest("b")
+        self.assertEqual(self.engine.collection.count(), 2 * chunks)
+        self.assertEqual(sorted(self.manifest()), sorted(os.path.join(self.path, folder, "manual.txt") for folder in ("a", "b")))
+
+    def test_unchanged_files_are_skipped(self):
+        self.assertEqual(self.ingest("a")["files_ingested"], 1)
+        counts = self.ingest("a")
+        self.assertEqual((counts["files_ingested"], counts["files_skipped"]), (0, 1))
+
+    def test_deleted_documents_are_removed_from_their_folder_only(self):
+        self.write("a", "notas.txt", TEXT.replace("parvovirus", "moquillo"))
+        self.ingest("a")
+        self.ingest("b")
+        os.remove(os.path.join(self.path, "a", "notas.txt"))
+
+        counts = self.ingest("a")
+        self.assertEqual(counts["files_removed"], 1)
+        self.assertGreater(counts["chunks_removed"], 0)
+        self.assertEqual(set(self.chunk_sources()), {"manual.txt"})
+        self.assertEqual(len(self.manifest()), 2)
+        self.assertEqual(len([name for name in os.listdir(os.path.join(self.path, "chunks")) if name.endswith(".jsonl")]), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from lexical_index import BM25Index, fold, reciprocal_rank_fusion, stem, tokenize
+
+class StemTest(unittest.TestCase):
+    def test_singular_and_plural_share_a_stem(self):
+        for singular, plural in (("perro", "perros"), ("síntoma", "síntomas"), ("vómito", "vómitos"), ("enfermedad", "enfermedades"), ("convulsión", "convulsiones"), ("tratamiento", "tratamientos"), ("gato", "gatos")):
+            with self.subTest(singular=singular):
+                self.assertEqual(stem(fold(singular)), stem(fold(plural)))
+
+    def test_masculine_and_feminine_share_a_stem(self):
+        self.assertEqual(stem("perro"), stem("perras"))
+        self.assertEqual(stem(fold("clínico")), stem(fold("clínicas")))
+
+    def test_short_words_are_kept(self):
+        self.assertEqual(stem("gvd"), "gvd")
+        self.assertEqual(stem("tos"), "tos")
+
+    def test_tokenize_folds_and_drops_stopwords(self):
+        self.assertEqual(tokenize("Los VÓMITOS del perro"), ["vomit", "perr"])
+
+class BM25IndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add("parvo", "Parvovirus canino: vómitos severos y diarrea hemorrágica en cachorros", {"disease": "parvovirus"})
+        self.index.add("diabetes", "Diabetes mellitus en gatos: poliuria, polidipsia y pérdida de peso", {"disease": "diabetes"})
+        self.index.add("gvd", "Dilatación gástrica en perros de raza grande", {"disease": "gvd"})
+
+    def test_query_and_document_differ_in_number(self):
+        self.assertEqual(self.index.search("vómito")[0][0], "parvo")
+        self.assertEqual(self.index.search("gato")[0][0], "diabetes")
+        self.assertEqual(self.index.search("perro")[0][0], "gvd")
+
+    def test_documents_sharing_no_term_are_left_out(self):
+        self.assertEqual(self.index.search("insuficiencia renal"), [])
+
+    def test_where_filters_by_metadata(self):
+        results = self.index.search("perros vómitos", where=lambda metadata: metadata["disease"] == "gvd")
+        self.assertEqual([doc_id for doc_id, _ in results], ["gvd"])
+
+    def test_add_again_replaces_and_remove_drops(self):
+        self.index.add("gvd", "Torsión gástrica", {"disease": "gvd"})
+        self.assertEqual(self.index.search("perro"), [])
+        self.index.remove("parvo")
+        self.assertEqual(self.index.search("vómitos"), [])
+        self.assertEqual(len(self.index), 2)
+
+class RankFusionTest(unittest.TestCase):
+    def test_ids_ranked_high_in_both_lists_win(self):
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "a", "d"]])
+        self.assertEqual({doc_id for doc_id, _ in fused[:2]}, {"a", "b"})
+        self.assertEqual(len(fused), 4)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from unittest import mock
+
+from rate_limiter import RateLimitExceeded, RateLimitScheduler, TokenBucket
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch("rate_limiter.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.bucket = TokenBucket(capacity=60, period=60) # 1 unit per second
+
+    def test_refills_continuously_up_to_capacity(self):
+        self.bucket.consume(60)
+        self.clock.now += 10
+        self.bucket.refill()
+        self.assertAlmostEqual(self.bucket.available, 10)
+        self.clock.now += 120
+        self.bucket.refill()
+        self.assertEqual(self.bucket.available, 60)
+
+    def test_wait_time_until_the_amount_is_available(self):
+        self.bucket.consume(50)
+        self.assertEqual(self.bucket.wait_time(10), 0)
+        self.assertAlmostEqual(self.bucket.wait_time(30), 20)
+        self.assertAlmostEqual(self.bucket.wait_time(600), 50) # Above capacity, waits for a full bucket
+
+    def test_negative_consume_gives_units_back_and_drain_empties(self):
+        self.bucket.consume(40)
+        self.bucket.consume(-30)
+        self.assertAlmostEqual(self.bucket.available, 50)
+        self.bucket.drain()
+        self.assertEqual(self.bucket.available, 0)
+
+class RateLimitSchedulerTest(unittest.TestCase):
+    def test_acquire_reserves_budget_and_record_corrects_it(self):
+        scheduler = RateLimitScheduler(requests_per_minute=10, tokens_per_minute=1000, requests_per_day=100, tokens_per_day=10000)
+        scheduler.acquire(300)
+        scheduler.record(300, 100)
+        remaining = scheduler.status()["remaining"]
+        self.assertEqual(remaining["requests_per_minute"], 9)
+        self.assertEqual(remaining["tokens_per_minute"], 900)
+        self.assertEqual(remaining["tokens_per_day"], 9900)
+
+    def test_call_raises_instead_of_waiting_too_long(self):
+        scheduler = RateLimitScheduler(requests_per_minute=1, max_wait=5)
+        scheduler.acquire(10)
+        with self.assertRaises(RateLimitExceeded) as raised:
+            scheduler.acquire(10)
+        self.assertFalse(raised.exception.daily)
+        self.assertGreater(raised.exception.wait_seconds, 5)
+
+    def test_call_retries_rate_limit_errors(self):
+        # Generous limits, so the drained minute buckets refill within milliseconds
+        scheduler = RateLimitScheduler(requests_per_minute=60000, tokens_per_minute=6000000)
+        attempts = []
+        def function():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise Exception("Error code: 429 - rate limit reached")
+            return "respuesta"
+
+        with mock.patch("rate_limiter.time.sleep") as sleep:
+            self.assertEqual(scheduler.call(function, 100), "respuesta")
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(scheduler.rate_limit_errors, 2)
+
+    def test_other_errors_are_raised_without_retrying(self):
+        scheduler = RateLimitScheduler()
+        with self.assertRaises(ValueError):
+            scheduler.call(mock.Mock(side_effect=ValueError("bad request")), 100)
+        self.assertEqual(scheduler.status()["remaining"]["tokens_per_minute"], scheduler.buckets["tokens_per_minute"].capacity)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from response_cache import SemanticResponseCache
+
+# Hand-picked query vectors: "rephrased" is ~0.99 similar to "original", "other" ~0.95
+VECTORS = {
+    "query: original": [1.0, 0.0, 0.0],
+    "query: rephrased": [1.0, 0.14, 0.0],
+    "query: other": [1.0, 0.0, 0.33],
+    "query: unrelated": [0.0, 1.0, 0.0],
+}
+
+def embed(texts):
+    return [np.array(VECTORS[text], dtype=np.float32) for text in texts]
+
+class SemanticResponseCacheTest(unittest.TestCase):
+    def test_rephrasing_above_the_threshold_hits(self):
+        cache = SemanticResponseCache(embed)
+        cache.store("original", "respuesta")
+        self.assertEqual(cache.lookup("rephrased"), "respuesta")
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_similar_query_below_the_threshold_misses(self):
+        cache = SemanticResponseCache(embed)
+        cache.store("original", "respuesta")
+        self.assertIsNone(cache.lookup("other"))
+        self.assertIsNone(cache.lookup("unrelated"))
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = SemanticResponseCache(embed, ttl_seconds=60)
+        with mock.patch("response_cache.time.monotonic", return_value=1000.0):
+            cache.store("original", "respuesta")
+        with mock.patch("response_cache.time.monotonic", return_value=1059.0):
+            self.assertEqual(cache.lookup("original"), "respuesta")
+        with mock.patch("response_cache.time.monotonic", return_value=1061.0):
+            self.assertIsNone(cache.lookup("original"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = SemanticResponseCache(embed, max_entries=2)
+        cache.store("original", "respuesta 1")
+        cache.store("unrelated", "respuesta 2")
+        cache.lookup("original") # "unrelated" becomes the least recently used
+        cache.store("other", "respuesta 3")
+        self.assertIsNone(cache.lookup("unrelated"))
+        self.assertEqual(cache.lookup("original"), "respuesta 1")
+
+    def test_version_change_drops_every_entry(self):
+        version = [1]
+        cache = SemanticResponseCache(embed, version_function=lambda: version[0])
+        cache.store("original", "respuesta")
+        self.assertEqual(cache.lookup("original"), "respuesta")
+        version[0] = 2
+        self.assertIsNone(cache.lookup("original"))
+
+if __name__ == "__main__":
+    unittest.main()
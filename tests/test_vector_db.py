@@ -0,0 +1,92 @@
+import os
+import zlib
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import vector_db
+from vector_db import RetrievalFilter, RetrievalHit, build_snapshot, insert_diseases, query_diseases_batch
+
+KNOWLEDGE_BASE = {
+    "parvovirus_symptoms": {"content": "SÍNTOMAS PARVOVIRUS: vómitos severos y diarrea hemorrágica.", "category": "symptoms", "disease": "parvovirus"},
+    "parvovirus_treatment": {"content": "TRATAMIENTO PARVOVIRUS: fluidoterapia y antieméticos.", "category": "treatment", "disease": "parvovirus"},
+    "diabetes_symptoms": {"content": "SÍNTOMAS DIABETES: poliuria, polidipsia y pérdida de peso.", "category": "symptoms", "disease": "diabetes"},
+}
+
+def fake_embedding_function(texts: list) -> list:
+    """Random vector per text without its e5 prefix, so a query equal to a chunk is at distance 0"""
+    return [np.random.default_rng(zlib.crc32(text.split(": ", 1)[-1].encode("utf-8"))).standard_normal(16) for text in texts]
+
+class RetrievalTestCase(unittest.TestCase):
+    """Retrieval engine on the NumPy backend with fake embeddings"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.engine = vector_db.RetrievalEngine(db_path=os.path.join(self.path, "db"), backend="numpy", cache_size=0, ingested_chunks_path=os.path.join(self.path, "chunks"))
+        self.engine._embedding_function = fake_embedding_function
+        patcher = mock.patch.object(vector_db, "retrieval_engine", self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+class RetrievalFilterTest(RetrievalTestCase):
+    def test_built_in_labels_are_kept_and_unknown_ones_dropped(self):
+        filters = RetrievalFilter.from_values(disease="parvovirus", category="inventada", species="perro")
+        self.assertEqual((filters.disease, filters.category, filters.species), ("parvovirus", None, "perro"))
+        self.assertIsNone(RetrievalFilter.from_values(disease="rabia", urgency="QUIZAS"))
+
+    def test_labels_of_indexed_documents_are_kept(self):
+        self.assertIsNone(RetrievalFilter.from_values(disease="leptospirosis"))
+        insert_diseases({"leptospirosis_prevention": {
+            "content": "LEPTOSPIROSIS: vacunación anual de perros expuestos a agua estancada y roedores.",
+            "disease": "leptospirosis",
+            "category": "prevention",
+        }})
+        filters = RetrievalFilter.from_values(disease="leptospirosis", category="prevention")
+        self.assertEqual((filters.disease, filters.category), ("leptospirosis", "prevention"))
+        hits = self.engine.lexical_index.search("vacunación", where=filters.matches)
+        self.assertEqual([chunk_id for chunk_id, _ in hits], ["leptospirosis_prevention"])
+
+class QueryBatchTest(RetrievalTestCase):
+    def setUp(self):
+        super().setUp()
+        insert_diseases(KNOWLEDGE_BASE)
+
+    def test_one_typed_result_per_query_in_order(self):
+        queries = [KNOWLEDGE_BASE[chunk_id]["content"] for chunk_id in ("diabetes_symptoms", "parvovirus_treatment")]
+        results = query_diseases_batch(queries, n_results=2, batch_size=1, mode="vector")
+        self.assertEqual([result.query for result in results], queries)
+        top_hit = results[0].hits[0]
+        self.assertIsInstance(top_hit, RetrievalHit)
+        self.assertEqual((top_hit.chunk_id, top_hit.disease, top_hit.category), ("diabetes_symptoms", "diabetes", "symptoms"))
+        self.assertEqual(top_hit.content, KNOWLEDGE_BASE["diabetes_symptoms"]["content"]) # Without the "passage: " prefix
+        self.assertAlmostEqual(top_hit.distance, 0.0, places=5)
+        self.assertEqual([hit.chunk_id for hit in results[1].relevant], ["parvovirus_treatment"])
+
+    def test_filters_apply_to_every_query(self):
+        filters = RetrievalFilter.from_values(disease="parvovirus")
+        results = query_diseases_batch(["vómitos", "poliuria"], n_results=3, filters=filters, mode="vector")
+        for result in results:
+            self.assertEqual({hit.disease for hit in result.hits}, {"parvovirus"})
+
+class SnapshotTest(RetrievalTestCase):
+    def test_rebuild_embeds_only_edited_chunks_and_switches(self):
+        first = build_snapshot(dict(KNOWLEDGE_BASE))
+        self.assertEqual((first["copied"], first["embedded"]), (0, 3))
+
+        edited = {**KNOWLEDGE_BASE, "diabetes_symptoms": {**KNOWLEDGE_BASE["diabetes_symptoms"], "content": "SÍNTOMAS DIABETES: poliuria y polidipsia."}}
+        second = build_snapshot(edited)
+        self.assertEqual((second["copied"], second["embedded"]), (2, 1))
+        self.assertEqual(second["previous"], first["collection"])
+        self.assertEqual(self.engine.active_collection_name, second["collection"])
+        self.assertEqual(self.engine.collection.get(ids=["diabetes_symptoms"])["documents"], ["passage: SÍNTOMAS DIABETES: poliuria y polidipsia."])
+
+        self.assertEqual(build_snapshot(edited), second) # Up to date, nothing rebuilt
+        other_process = vector_db.RetrievalEngine(db_path=self.engine.db_path, backend="numpy", cache_size=0)
+        self.assertEqual(other_process.active_collection_name, second["collection"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from vector_store import NumpyCollection, matches_where
+
+class MatchesWhereTest(unittest.TestCase):
+    def test_operators_and_combinations(self):
+        metadata = {"disease": "parvovirus", "species": "perro"}
+        self.assertTrue(matches_where(metadata, {"disease": "parvovirus"}))
+        self.assertTrue(matches_where(metadata, {"$and": [{"species": {"$in": ["perro", "gato"]}}, {"disease": {"$ne": "diabetes"}}]}))
+        self.assertTrue(matches_where(metadata, {"$or": [{"disease": "diabetes"}, {"species": {"$eq": "perro"}}]}))
+        self.assertFalse(matches_where(metadata, {"species": {"$nin": ["perro"]}}))
+        with self.assertRaises(ValueError):
+            matches_where(metadata, {"disease": {"$gt": 1}})
+
+class NumpyCollectionTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.embeddings = np.random.default_rng(0).normal(size=(40, 8)).astype(np.float32)
+        self.ids = [f"doc_{i}" for i in range(40)]
+        self.metadatas = [{"disease": "parvovirus" if i % 2 else "diabetes"} for i in range(40)]
+
+    def open(self, **kwargs) -> NumpyCollection:
+        return NumpyCollection(self.path, initial_capacity=16, **kwargs)
+
+    def fill(self, collection: NumpyCollection):
+        collection.upsert(ids=self.ids, embeddings=self.embeddings, documents=[f"texto {i}" for i in range(40)], metadatas=self.metadatas)
+
+    def brute_force(self, query, n_results: int, rows=None) -> list:
+        rows = list(range(40)) if rows is None else rows
+        unit = self.embeddings / np.linalg.norm(self.embeddings, axis=1, keepdims=True)
+        similarities = unit[rows] @ (query / np.linalg.norm(query))
+        return [self.ids[rows[i]] for i in np.argsort(-similarities)[:n_results]]
+
+    def test_query_returns_the_exact_top_k(self):
+        collection = self.open()
+        self.fill(collection) # Grows past initial_capacity
+        queries = np.random.default_rng(1).normal(size=(3, 8)).astype(np.float32)
+        result = collection.query(query_embeddings=queries, n_results=5)
+        for query, ids, distances in zip(queries, result["ids"], result["distances"]):
+            self.assertEqual(ids, self.brute_force(query, 5))
+            self.assertEqual(distances, sorted(distances))
+
+    def test_where_restricts_the_candidates(self):
+        collection = self.open()
+        self.fill(collection)
+        query = self.embeddings[3]
+        result = collection.query(query_embeddings=[query], n_results=4, where={"disease": "parvovirus"})
+        self.assertEqual(result["ids"][0], self.brute_force(query, 4, rows=list(range(1, 40, 2))))
+        self.assertEqual(result["ids"][0][0], "doc_3")
+        self.assertAlmostEqual(result["distances"][0][0], 0.0, places=5)
+
+    def test_upsert_replaces_and_merges_metadata(self):
+        collection = self.open()
+        self.fill(collection)
+        collection.upsert(ids=["doc_0"], embeddings=[self.embeddings[5]], metadatas=[{"category": "sintomas", "disease": None}])
+        record = collection.get(ids=["doc_0"])
+        self.assertEqual(record["documents"], ["texto 0"])
+        self.assertEqual(record["metadatas"], [{"category": "sintomas"}])
+        self.assertEqual(collection.count(), 40)
+
+    def test_deleted_records_are_not_returned_and_rows_are_reused(self):
+        collection = self.open()
+        self.fill(collection)
+        collection.delete(where={"disease": "diabetes"})
+        self.assertEqual(collection.count(), 20)
+        result = collection.query(query_embeddings=[self.embeddings[0]], n_results=40)
+        self.assertEqual(len(result["ids"][0]), 20)
+        self.assertNotIn("doc_0", result["ids"][0])
+        collection.upsert(ids=["nuevo"], embeddings=[self.embeddings[0]])
+        self.assertLess(collection._rows["nuevo"], 40)
+
+    def test_reopened_collection_replays_the_log(self):
+        collection = self.open()
+        self.fill(collection)
+        collection.delete(ids=["doc_1", "doc_2"])
+        collection.upsert(ids=["doc_3"], embeddings=[self.embeddings[3]], documents=["texto nuevo"])
+
+        reopened = self.open()
+        self.assertEqual(reopened.count(), 38)
+        self.assertEqual(reopened.get(ids=["doc_1", "doc_3"])["documents"], ["texto nuevo"])
+        query = self.embeddings[10]
+        self.assertEqual(reopened.query(query_embeddings=[query], n_results=3)["ids"][0], collection.query(query_embeddings=[query], n_results=3)["ids"][0])
+
+    def test_float16_matches_float32_ranking(self):
+        collection = self.open(dtype="float16")
+        self.fill(collection)
+        query = self.embeddings[7]
+        self.assertEqual(collection.query(query_embeddings=[query], n_results=1)["ids"][0], ["doc_7"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import secrets
+import threading
+import contextvars
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tracing settings (environment variables, so a deployment can be traced without code changes)
+TRACING_ENABLED = os.getenv("VET_TRACING", "").lower() in ("1", "true", "yes")
+TRACE_LOG_PATH = os.getenv("VET_TRACE_LOG", "./traces/spans.jsonl") # One JSON line per finished span ("" keeps only metrics)
+METRICS_HOST = "127.0.0.1" # The endpoint is local only
+METRICS_PORT = int(os.getenv("VET_METRICS_PORT", "9464"))
+METRIC_PREFIX = "vet_"
+
+# Histogram buckets (seconds), from a cached embedding to a slow LLM call
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Span of the operation running in this thread/task (asyncio tasks and asyncio.to_thread copy it)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# ===================================================
+# SPANS
+# ===================================================
+class Span:
+    """One timed operation of a request, linked to its parent through the current context"""
+
+    __slots__ = ("tracer", "name", "attributes", "trace_id", "span_id", "parent_id", "start", "duration", "error", "_start_perf", "_token")
+
+    def __init__(self, tracer, name: str, attributes: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.trace_id = None
+        self.span_id = secrets.token_hex(4)
+        self.parent_id = None
+        self.start = None
+        self.duration = None
+        self.error = None
+        self._start_perf = None
+        self._token = None
+
+    def set(self, **attributes):
+        """Add attributes (token counts, cache hits, result sizes...)"""
+        self.attributes.update(attributes)
+        return self
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.start = time.time()
+        self._start_perf = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.duration = time.perf_counter() - self._start_perf
+        try:
+            _current_span.reset(self._token)
+        except ValueError: # Exited from another context (e.g. a generator resumed elsewhere)
+            _current_span.set(None)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.tracer._finish(self)
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+class _NoopSpan:
+    """Stands in for every span while tracing is disabled (entering, exiting and set() do nothing)"""
+
+    __slots__ = ()
+
+    def set(self, **attributes):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+NOOP_SPAN = _NoopSpan()
+
+# ===================================================
+# METRICS
+# ===================================================
+class MetricsRegistry:
+    """Prometheus-style counters and histograms kept in memory"""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {} # (name, labels) -> value
+        self._histograms = {} # (name, labels) -> [count per bucket..., sum, count]
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, labels: dict = None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: dict = None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def snapshot(self) -> dict:
+        """Current values ({"counters": {...}, "histograms": {...}} keyed by name and labels)"""
+        with self._lock:
+            return {
+                "counters": {self._series(name, labels): value for (name, labels), value in self._counters.items()},
+                "histograms": {self._series(name, labels): {"sum": values[-2], "count": values[-1]} for (name, labels), values in self._histograms.items()},
+            }
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for metric_type, series in (("counter", self._counters), ("histogram", self._histograms)):
+                for name in sorted({name for name, _ in series}):
+                    lines.append(f"# TYPE {METRIC_PREFIX}{name} {metric_type}")
+                    for (series_name, labels), values in sorted(series.items()):
+                        if series_name != name:
+                            continue
+                        if metric_type == "counter":
+                            lines.append(f"{self._series(METRIC_PREFIX + name, labels)} {values}")
+                            continue
+                        for bound, count in zip(self.buckets, values): # Already cumulative (observe() counts every bucket >= value)
+                            lines.append(f"{self._series(METRIC_PREFIX + name + '_bucket', labels + (('le', repr(bound)),))} {count}")
+                        lines.append(f"{self._series(METRIC_PREFIX + name + '_bucket', labels + (('le', '+Inf'),))} {values[-1]}")
+                        lines.append(f"{self._series(METRIC_PREFIX + name + '_sum', labels)} {values[-2]}")
+                        lines.append(f"{self._series(METRIC_PREFIX + name + '_count', labels)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _series(name: str, labels: tuple) -> str:
+        if not labels:
+            return name
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+        return name + "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+# ===================================================
+# TRACER
+# ===================================================
+class Tracer:
+    """
+    Per-request spans exported as JSON lines, plus counters and histograms served to Prometheus
+
+    While disabled every call returns right after checking `enabled` (span() hands out a shared
+    no-op span), so the instrumentation can stay in the hot paths.
+    """
+
+    def __init__(self, enabled: bool = TRACING_ENABLED, log_path: str = TRACE_LOG_PATH):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.metrics = MetricsRegistry()
+        self._log_file = None
+        self._log_lock = threading.Lock()
+        self._server = None
+
+    def enable(self, log_path: str = None):
+        if log_path is not None:
+            self.log_path = log_path
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        with self._log_lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+
+    # ---------------------------------------------------
+    # Recording
+    # ---------------------------------------------------
+    def span(self, name: str, **attributes):
+        """Context manager timing a block as a child of the current span"""
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def current_span(self):
+        """Innermost open span (the no-op span outside any span or while disabled)"""
+        return (_current_span.get() if self.enabled else None) or NOOP_SPAN
+
+    def annotate(self, **attributes):
+        """Add attributes to the current span"""
+        self.current_span().set(**attributes)
+
+    def record_span(self, name: str, start: float, duration: float, **attributes):
+        """Record an already finished operation (e.g. reported by a callback) under the current span"""
+        if not self.enabled:
+            return
+        span = Span(self, name, attributes)
+        parent = _current_span.get()
+        span.trace_id = parent.trace_id if parent else secrets.token_hex(8)
+        span.parent_id = parent.span_id if parent else None
+        span.start = start
+        span.duration = duration
+        self._finish(span)
+
+    def count(self, name: str, value: float = 1, **labels):
+        """Increment a counter"""
+        if self.enabled:
+            self.metrics.inc(name, value, labels)
+
+    def observe(self, name: str, value: float, **labels):
+        """Add an observation to a histogram"""
+        if self.enabled:
+            self.metrics.observe(name, value, labels)
+
+    def _finish(self, span: Span):
+        self.metrics.observe("span_duration_seconds", span.duration, {"span": span.name})
+        if span.error:
+            self.metrics.inc("span_errors_total", 1, {"span": span.name})
+        if not self.log_path:
+            return
+        try:
+            line = json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n"
+            with self._log_lock:
+                if self._log_file is None:
+                    os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+                    self._log_file = open(self.log_path, "a", encoding="utf-8", buffering=1) # Line buffered, tail -f friendly
+                self._log_file.write(line)
+        except Exception as e: # Tracing must never break a request
+            logger.error(f"Error writing span: {str(e)}")
+
+    # ---------------------------------------------------
+    # Endpoint
+    # ---------------------------------------------------
+    def serve(self, port: int = METRICS_PORT, host: str = METRICS_HOST):
+        """Serve GET /metrics (Prometheus text format) from a daemon thread, once per process"""
+        if self._server is not None:
+            return self._server
+        registry = self.metrics
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # Scrapes every few seconds would flood the log
+                return
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e: # Another process (e.g. a second Streamlit worker) already serves the port
+            logger.warning(f"Metrics endpoint not started on {host}:{port}: {str(e)}")
+            return None
+        threading.Thread(target=self._server.serve_forever, name="metrics-endpoint", daemon=True).start()
+        logger.info(f"Metrics endpoint at http://{host}:{port}/metrics")
+        return self._server
+
+tracer = Tracer()
@@ -1,29 +1,294 @@
 import os
+import json
+import time
 import shutil
-import chromadb
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+import hashlib
+import threading
 import logging
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from tracing import tracer
 
 # Initialize Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize ChromaDB with persistence
+# ChromaDB persistence and embedding model settings
 DB_PATH = "./vector_db"
-chroma_client = chromadb.PersistentClient(path=DB_PATH)
+COLLECTION_NAME = "veterinary_diseases"
+EMBEDDING_MODEL = "intfloat/multilingual-e5-base" # Multilingual for Spanish
+EMBEDDING_ENGINES = ("sentence_transformers", "onnx")
+EMBEDDING_ENGINE = "sentence_transformers" # "onnx" runs the exported (int8) model with ONNX Runtime, see onnx_embedding.py
+ONNX_MODEL_DIR = "./models/multilingual-e5-base-onnx"
+ONNX_MODEL_FILE = "model_int8.onnx" # "model.onnx" for the unquantized export
+VECTOR_BACKENDS = ("chroma", "numpy")
+VECTOR_BACKEND = "chroma" # "chroma" (HNSW) or "numpy" (exact search over a memory-mapped matrix, see vector_store.py)
+VECTOR_DTYPE = "float32" # Stored vector precision for the numpy backend ("float16" halves its size but searches slower)
+
+# Embedding cache settings (see embedding_cache.py)
+EMBEDDING_CACHE_PATH = "./embedding_cache"
+EMBEDDING_CACHE_SIZE = 20000 # Max cached embeddings, least recently used are evicted (0 disables the cache)
+
+# Chunks ingested from documents (written by ingest.py, one JSONL file per source document)
+INGESTED_CHUNKS_PATH = "./ingested_chunks"
+
+# Versioned index snapshots (each knowledge base + embedding model gets its own collection)
+SNAPSHOT_FILE = "current_index.json" # Pointer to the active snapshot, inside DB_PATH (replaced atomically)
+SNAPSHOT_CHECK_SECONDS = 2.0 # How often running processes look for a newer snapshot
+
+# Bulk indexing settings
+INDEX_BATCH_SIZE = 64 # Chunks embedded and upserted per call (adjustable)
+STORED_HASHES_PAGE_SIZE = 5000 # IDs/metadatas fetched per page when comparing content hashes
+INDEX_SCHEMA_VERSION = 3 # Bump when the stored document/metadata layout changes (re-indexes every chunk once)
+
+# Retrieval settings
+N_RESULTS = 10 # Chunks retrieved per query before thresholding
+DISTANCE_THRESHOLD = 0.20 # Max cosine distance for a chunk to count as relevant
+QUERY_BATCH_SIZE = 256 # Queries embedded and searched per call in query_diseases_batch
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
+RETRIEVAL_MODE = "hybrid" # Dense + BM25 fused with reciprocal rank fusion ("lexical" never loads the model)
+LEXICAL_MIN_SCORE = 4.0 # Min BM25 score for a keyword match to count as relevant regardless of its distance
+
+# Lazily-initialized retrieval engine
+# Importing chromadb, loading the SentenceTransformer and opening the collection take seconds,
+# so nothing is created at import time: every handle is built on first use (or by warm_up())
+class RetrievalEngine:
+   """Own the ChromaDB client, embedding function and collection, creating them on first use"""
+
+   def __init__(self, db_path: str = DB_PATH, collection_name: str = COLLECTION_NAME, model_name: str = EMBEDDING_MODEL, cache_path: str = EMBEDDING_CACHE_PATH, cache_size: int = EMBEDDING_CACHE_SIZE, backend: str = VECTOR_BACKEND, vector_dtype: str = VECTOR_DTYPE, embedding_engine: str = EMBEDDING_ENGINE, onnx_model_dir: str = ONNX_MODEL_DIR, onnx_model_file: str = ONNX_MODEL_FILE, ingested_chunks_path: str = INGESTED_CHUNKS_PATH, read_only: bool = False):
+      if backend not in VECTOR_BACKENDS:
+         raise ValueError(f"Unknown vector backend {backend!r}, expected one of {VECTOR_BACKENDS}")
+      if embedding_engine not in EMBEDDING_ENGINES:
+         raise ValueError(f"Unknown embedding engine {embedding_engine!r}, expected one of {EMBEDDING_ENGINES}")
+      self.embedding_engine = embedding_engine
+      self.ingested_chunks_path = ingested_chunks_path
+      self.onnx_model_dir = onnx_model_dir
+      self.onnx_model_file = onnx_model_file
+      self.db_path = db_path
+      self.backend = backend
+      self.vector_dtype = vector_dtype
+      self.collection_name = collection_name
+      self.model_name = model_name
+      self.cache_path = cache_path
+      self.cache_size = cache_size
+      self.read_only = read_only # Never write the collection or the embedding cache (processes sharing them with others), set before first use
+      self._client = None
+      self._embedding_function = None
+      self._collection = None
+      self._lexical_index = None
+      self._labels = None # (lexical index, index generation, {label: values}) of the last labels() call
+      self.snapshot = None # Active snapshot pointer (None until one is built, the legacy collection is used)
+      self._snapshot_mtime = None
+      self._snapshot_checked_at = float("-inf")
+      self.index_generation = 0 # Bumped whenever the indexed knowledge base changes (invalidates answer caches)
+      self._lock = threading.RLock() # Streamlit serves sessions from several threads, only one of them must build the handles
+
+   @property
+   def client(self):
+      """ChromaDB persistent client"""
+      if self._client is None:
+         with self._lock:
+            if self._client is None:
+               import chromadb # Deferred import (chromadb alone takes ~1s to import)
+               self._client = chromadb.PersistentClient(path=self.db_path)
+      return self._client
+
+   @property
+   def embedding_function(self):
+      """Cached Sentence Transformers embedding function (the model loads on the first cache miss)"""
+      if self._embedding_function is None:
+         with self._lock:
+            if self._embedding_function is None:
+               from embedding_cache import EmbeddingCache, CachedEmbeddingFunction
+               self._embedding_function = CachedEmbeddingFunction(
+                  factory=self._create_model_embedding_function,
+                  model_name=self.embedding_id,
+                  cache=EmbeddingCache(self.cache_path, self.embedding_id, max_entries=self.cache_size, read_only=self.read_only)
+               )
+      return self._embedding_function
+
+   @property
+   def embedding_id(self) -> str:
+      """Model name plus engine, quantized vectors differ slightly so they're cached separately"""
+      if self.embedding_engine == "onnx":
+         return f"{self.model_name}@onnx-{os.path.splitext(self.onnx_model_file)[0]}"
+      return self.model_name
+
+   def _create_model_embedding_function(self):
+      """Sentence Transformers (or ONNX Runtime) embedding function (loads the model)"""
+      if self.embedding_engine == "onnx":
+         from onnx_embedding import OnnxEmbeddingFunction
+         return OnnxEmbeddingFunction(self.onnx_model_dir, model_file=self.onnx_model_file)
+      from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+      return SentenceTransformerEmbeddingFunction(model_name=self.model_name)
+
+   @property
+   def collection(self):
+      """Active snapshot's collection in ChromaDB (or its NumPy replacement)"""
+      self._refresh_snapshot()
+      if self._collection is None:
+         with self._lock:
+            if self._collection is None:
+               self._collection = self.open_collection(self.active_collection_name)
+      return self._collection
+
+   @property
+   def active_collection_name(self) -> str:
+      """Collection of the active snapshot (collection_name itself before the first snapshot)"""
+      self._refresh_snapshot()
+      return self.snapshot["collection"] if self.snapshot else self.collection_name
+
+   @property
+   def snapshot_path(self) -> str:
+      return os.path.join(self.db_path, SNAPSHOT_FILE)
+
+   def open_collection(self, name: str, metadata: dict = None):
+      """Create or get a collection by name (snapshots are built in their own collection before they're switched to)"""
+      if self.backend == "numpy":
+         from vector_store import NumpyCollection # Deferred import, like chromadb
+         return NumpyCollection(os.path.join(self.db_path, "numpy", name), dtype=self.vector_dtype, metadata=metadata, read_only=self.read_only)
+      if self.read_only: # Only built by the indexing process (python vector_db.py)
+         return self.client.get_collection(name=name, embedding_function=None)
+      # Embeddings are always computed by the engine (through the cache) and passed explicitly,
+      # so the collection doesn't bind an embedding function (opening it doesn't load the model)
+      return self.client.get_or_create_collection(
+         name=name,
+         embedding_function=None,
+         metadata={"hnsw:space": "cosine", **(metadata or {})} # Use Cosine Distance instead of default L2 distance (better for semantic similarity)
+      )
+
+   def drop_collection(self, name: str):
+      """Delete a collection that no snapshot points to anymore"""
+      try:
+         if self.backend == "numpy":
+            path = os.path.join(self.db_path, "numpy", name)
+            if not os.path.isdir(path): # Never written to (e.g. the legacy collection of a fresh install)
+               return
+            shutil.rmtree(path)
+         else:
+            self.client.delete_collection(name)
+         logger.info(f"Deleted old index snapshot {name}")
+      except Exception as e:
+         logger.warning(f"Couldn't delete old index snapshot {name}: {str(e)}")
+
+   def switch_snapshot(self, snapshot: dict):
+      """Make a snapshot the active one for every process using db_path (atomic rename of the pointer file)"""
+      os.makedirs(self.db_path, exist_ok=True)
+      with open(f"{self.snapshot_path}.tmp", "w", encoding="utf-8") as snapshot_file:
+         json.dump(snapshot, snapshot_file, ensure_ascii=False, indent=2)
+      os.replace(f"{self.snapshot_path}.tmp", self.snapshot_path)
+      with self._lock:
+         self._snapshot_checked_at = float("-inf") # Pick it up right away in this process
+      self._refresh_snapshot()
+
+   def _refresh_snapshot(self):
+      """Follow the pointer file when another process switched snapshots (checked every SNAPSHOT_CHECK_SECONDS)"""
+      now = time.monotonic()
+      if now - self._snapshot_checked_at < SNAPSHOT_CHECK_SECONDS:
+         return
+      with self._lock:
+         self._snapshot_checked_at = now
+         try:
+            mtime = os.stat(self.snapshot_path).st_mtime_ns
+         except FileNotFoundError:
+            mtime = None
+         if mtime == self._snapshot_mtime:
+            return
+         self._snapshot_mtime = mtime
+
+         snapshot = None
+         if mtime is not None:
+            with open(self.snapshot_path, encoding="utf-8") as snapshot_file:
+               snapshot = json.load(snapshot_file)
+         if snapshot == self.snapshot:
+            return
+         # Queries already running keep the old collection object, new ones open the new snapshot
+         self.snapshot = snapshot
+         self._collection = None
+         self._lexical_index = None # Rebuilt with the chunks ingested since
+         self.index_generation += 1
+         logger.info(f"Using index snapshot {self.active_collection_name}")
+
+   @property
+   def lexical_index(self) -> BM25Index:
+      """BM25 index over KNOWLEDGE_BASE and ingested documents (built in memory, no model or database)"""
+      self._refresh_snapshot()
+      if self._lexical_index is None:
+         with self._lock:
+            if self._lexical_index is None:
+               lexical_index = BM25Index()
+               for chunk_key, chunk_data in {**KNOWLEDGE_BASE, **load_ingested_chunks(self.ingested_chunks_path)}.items():
+                  lexical_index.add(chunk_key, chunk_data["content"], _chunk_metadata(False, chunk_data, chunk_hash(chunk_data)))
+               self._lexical_index = lexical_index
+      return self._lexical_index
 
-# Use Sentence Transformers embedding function
-embedding_function = SentenceTransformerEmbeddingFunction(
-   model_name="intfloat/multilingual-e5-base" # Multilingual for Spanish
-)
+   def labels(self, name: str) -> set:
+      """Values of a chunk label ("disease", "category") across the indexed chunks, built-in and ingested"""
+      lexical_index = self.lexical_index
+      with self._lock:
+         if self._labels is None or self._labels[0] is not lexical_index or self._labels[1] != self.index_generation:
+            labels = {"disease": set(), "category": set()}
+            for _, metadata in list(lexical_index.documents.values()):
+               labels["disease"].add(metadata.get("chunk_disease"))
+               labels["category"].add(metadata.get("chunk_category"))
+            self._labels = (lexical_index, self.index_generation, labels)
+         return self._labels[2][name]
 
-# Create or get collection in ChromaDB
-# The embedding function will be used when adding documents
-collection = chroma_client.get_or_create_collection(
-   name="veterinary_diseases",
-   embedding_function=embedding_function,
-   metadata={"hnsw:space": "cosine"} # Use Cosine Distance instead of default L2 distance (better for semantic similarity)
-)
+   @property
+   def is_warm(self) -> bool:
+      """Whether the model is loaded and the collection is open"""
+      return all(self.warm_status().values())
+
+   def warm_status(self) -> dict:
+      """Which handles are already loaded (readiness checks)"""
+      return {
+         "embedding_model": self._embedding_function is not None and self._embedding_function.is_loaded,
+         "collection": self._collection is not None,
+      }
+
+   def warm_up(self, background: bool = False):
+      """Eagerly create client, model and collection so the first query doesn't pay for them
+
+      Args:
+         background: Run in a daemon thread and return it instead of blocking
+      """
+      if background:
+         thread = threading.Thread(target=self.warm_up, name="retrieval-warm-up", daemon=True)
+         thread.start()
+         return thread
+
+      try:
+         self.collection
+         self.embedding_function.inner(["query: warm up"]) # Load the model and run a first (uncached) forward pass
+         logger.info("Retrieval engine warmed up")
+      except Exception as e:
+         logger.error(f"Error warming up retrieval engine: {str(e)}")
+      return None
+
+   def reset(self):
+      """Drop cached handles (e.g. after the database folder was deleted)"""
+      with self._lock:
+         self._collection = None
+         self._client = None
+         self._lexical_index = None
+         self.snapshot = None
+         self._snapshot_mtime = None
+         self._snapshot_checked_at = float("-inf")
+         self.index_generation += 1
+
+retrieval_engine = RetrievalEngine()
+
+# Backwards compatibility: chroma_client, embedding_function and collection used to be module-level globals
+def __getattr__(name: str):
+   if name == "chroma_client":
+      return retrieval_engine.client
+   if name == "embedding_function":
+      return retrieval_engine.embedding_function
+   if name == "collection":
+      return retrieval_engine.collection
+   raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # KNOWLEDGE BASE (chunked veterinary diseases)
 KNOWLEDGE_BASE = {
@@ -276,91 +541,494 @@ KNOWLEDGE_BASE = {
     },
 }
 
+# Species and urgency of each disease, stored with its chunks so retrieval can be filtered by them
+# (chunks may override them with their own "species"/"urgency" keys)
+SPECIES_DOG = "perro"
+SPECIES_CAT = "gato"
+SPECIES_BOTH = "ambos"
+
+DISEASE_SPECIES = {
+    "parvovirus": SPECIES_DOG,
+    "ehrlichiosis": SPECIES_DOG,
+    "gvd": SPECIES_DOG,
+    "diabetes": SPECIES_BOTH,
+    "dermatitis_atopica": SPECIES_BOTH,
+    "renal_cronica": SPECIES_BOTH,
+    "braquicefalico": SPECIES_DOG,
+    "chocolate": SPECIES_DOG,
+    "acl": SPECIES_DOG,
+    "anesthesia": SPECIES_DOG,
+}
+
+# Same labels as the classification step (EMERGENCIA/NO_EMERGENCIA)
+DISEASE_URGENCY = {
+    "parvovirus": "EMERGENCIA",
+    "gvd": "EMERGENCIA",
+    "chocolate": "EMERGENCIA",
+}
+
+# Content hash stored in each chunk's metadata to detect edited chunks
+def chunk_hash(chunk_data: dict) -> str:
+   """Hash everything that is stored for a chunk (content, labels and storage layout)"""
+   payload = "\x1f".join([str(INDEX_SCHEMA_VERSION), chunk_data["content"], chunk_data["category"], chunk_data["disease"], chunk_data.get("species", ""), chunk_data.get("urgency", "")])
+   return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# Read the stored content hash of chunks, without pulling documents or embeddings
+def _stored_hashes(collection, page_size: int = STORED_HASHES_PAGE_SIZE, ids: List[str] = None) -> dict:
+   """Map chunk IDs (all of them, or only the given ones) to their stored content hash (None for chunks indexed before hashing)"""
+   stored_hashes = {}
+   if ids is not None: # Look up just these IDs, so incremental ingestion doesn't scan the whole collection
+      for start in range(0, len(ids), page_size):
+         page = collection.get(ids=ids[start:start + page_size], include=["metadatas"])
+         for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+            stored_hashes[chunk_id] = (metadata or {}).get("content_hash")
+      return stored_hashes
+
+   offset = 0
+   while True:
+      page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+      for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+         stored_hashes[chunk_id] = (metadata or {}).get("content_hash")
+      if len(page["ids"]) < page_size:
+         return stored_hashes
+      offset += page_size
+
+# Metadata stored per chunk (the ID and content already live in the record's id and document)
+def _chunk_metadata(stored: bool, chunk_data: dict, content_hash: str) -> dict:
+   metadata = {
+      "chunk_category": chunk_data["category"],
+      "chunk_disease": chunk_data["disease"],
+      "chunk_species": chunk_data.get("species", DISEASE_SPECIES.get(chunk_data["disease"], SPECIES_BOTH)),
+      "chunk_urgency": chunk_data.get("urgency", DISEASE_URGENCY.get(chunk_data["disease"], "NO_EMERGENCIA")),
+      "content_hash": content_hash,
+   }
+   if "source" in chunk_data: # Chunks ingested from documents (see ingest.py)
+      metadata.update({"chunk_source": chunk_data["source"], "chunk_page": chunk_data.get("page", 0)})
+   if stored: # Upserts merge metadata, None deletes keys left by older layouts
+      metadata.update({"chunk_id": None, "chunk_content": None})
+   return metadata
+
 # Populate database with all knowledge base's chunks
-def insert_diseases():
-   """Store all Veterinary Diseases in ChromaDB"""
+def insert_diseases(knowledge_base: dict = None, batch_size: int = INDEX_BATCH_SIZE, collection=None) -> dict:
+   """
+   Store all Veterinary Diseases in ChromaDB
+
+   Only new chunks and chunks whose content hash changed are embedded, in batches of
+   batch_size, and upserted in bulk, so running it again is cheap and picks up edits.
+
+   Args:
+      knowledge_base: Chunks to index (defaults to KNOWLEDGE_BASE)
+      batch_size: Chunks embedded and upserted per call
+      collection: Collection to write to (defaults to the active snapshot's, kept in sync with keyword search)
+
+   Returns:
+      Counts of added, updated, unchanged and failed chunks
+   """
+   if knowledge_base is None:
+      knowledge_base = KNOWLEDGE_BASE
    logger.info("\nIndexing Veterinary Diseases...")
 
-   # Grab all existing IDs from collection to avoid duplicates ahead
-   existing_docs = collection.get()
-   existing_ids = set(existing_docs.get("ids", []))
+   active = collection is None # A snapshot being built isn't searched yet
+   if active:
+      collection = retrieval_engine.collection
+   stored_hashes = _stored_hashes(collection, ids=list(knowledge_base))
+   counts = {"added": 0, "updated": 0, "unchanged": 0, "failed": 0}
+
+   # Keep only new or edited chunks
+   pending = []
+   for chunk_key, chunk_data in knowledge_base.items():
+      content_hash = chunk_hash(chunk_data)
+      if stored_hashes.get(chunk_key) == content_hash:
+         counts["unchanged"] += 1
+         continue
+      pending.append((chunk_key, chunk_data, content_hash))
 
-   for chunk_key, chunk_data in KNOWLEDGE_BASE.items():
-      # Safe insertion
+   for start in range(0, len(pending), batch_size):
+      batch = pending[start:start + batch_size]
+      ids = [chunk_key for chunk_key, _, _ in batch]
+
+      # Safe insertion (a failed batch doesn't stop the remaining ones)
       try:
-         # Skip document if it already exists (avoids duplicates)
-         if chunk_key in existing_ids:
-            logger.info(f"{chunk_key} already exists in collection, skipping...")
-            continue # Jump to the next iteration (code below doesn't execute for this iteration)
-
-         collection.add(
-            ids=[chunk_key],
-            documents=[f"passage: {chunk_data['content']}"], # Used for embedding and search
-            metadatas=[{"chunk_id": chunk_key, "chunk_content": chunk_data["content"], "chunk_category": chunk_data["category"], "chunk_disease": chunk_data["disease"]}] # Used for retrieval
+         documents = [f"passage: {chunk_data['content']}" for _, chunk_data, _ in batch] # Used for embedding, search and as the retrieved content
+         collection.upsert(
+            ids=ids,
+            documents=documents,
+            embeddings=retrieval_engine.embedding_function(documents), # One forward pass per batch
+            metadatas=[_chunk_metadata(chunk_key in stored_hashes, chunk_data, content_hash) for chunk_key, chunk_data, content_hash in batch] # Used for retrieval
          )
-         logger.info(f"Stored: {chunk_key} → {chunk_data['content'][:50]}...")
+         for chunk_key, chunk_data, content_hash in batch:
+            counts["updated" if chunk_key in stored_hashes else "added"] += 1
+            if active:
+               retrieval_engine.lexical_index.add(chunk_key, chunk_data["content"], _chunk_metadata(False, chunk_data, content_hash)) # Keep keyword search in sync
+         logger.info(f"Stored {start + len(batch)}/{len(pending)} chunks ({ids[0]} … {ids[-1]})")
 
       except Exception as e: # Catch any exception that happens during insertion
-         logger.error(f"Error inserting {chunk_key}: {str(e)}")
+         counts["failed"] += len(batch)
+         logger.error(f"Error inserting batch {ids[0]} … {ids[-1]}: {str(e)}")
 
-# Function to compare query to collection's content and return matches
-def query_diseases(query: str) -> str:
-   """Query VectorDB for Veterinary Diseases"""
-   logger.info(f"Searching collection for \"{query}\" matches")
+   if active and (counts["added"] or counts["updated"]):
+      retrieval_engine.index_generation += 1
+   logger.info(f"Indexing finished: {counts}")
+   return counts
 
+# Read the chunks ingest.py extracted from documents
+def load_ingested_chunks(path: str = INGESTED_CHUNKS_PATH) -> dict:
+   """Map chunk IDs to chunk data for every ingested document (empty if nothing was ingested)"""
+   chunks = {}
+   if not os.path.isdir(path):
+      return chunks
+   for file_name in sorted(os.listdir(path)):
+      if not file_name.endswith(".jsonl"):
+         continue
+      with open(os.path.join(path, file_name), encoding="utf-8") as chunks_file:
+         for line in chunks_file:
+            chunk = json.loads(line)
+            chunks[chunk.pop("id")] = chunk
+   return chunks
+
+# Identify the indexed knowledge base (changes whenever chunks are added, edited or the collection is reset)
+def knowledge_base_version() -> str:
+   """Version of the indexed knowledge base, used to invalidate cached answers"""
+   return f"{retrieval_engine.active_collection_name}:{retrieval_engine.index_generation}"
+
+# Fingerprint of a whole knowledge base (names its snapshot)
+def knowledge_base_hash(knowledge_base: dict) -> str:
+   """Hash of every chunk ID and content hash, independent of insertion order"""
+   digest = hashlib.sha256()
+   for chunk_key in sorted(knowledge_base):
+      digest.update(f"{chunk_key}\x1f{chunk_hash(knowledge_base[chunk_key])}\n".encode("utf-8"))
+   return digest.hexdigest()
+
+# Copy stored chunks (with their embeddings) that a new snapshot keeps unchanged
+def _copy_unchanged(source, target, knowledge_base: dict, page_size: int = STORED_HASHES_PAGE_SIZE) -> int:
+   """Copy chunks whose stored content hash still matches, so only new and edited chunks are embedded"""
+   source_hashes = _stored_hashes(source, page_size, ids=list(knowledge_base))
+   target_hashes = _stored_hashes(target, page_size, ids=list(source_hashes)) # A resumed build already has some
+   unchanged = [chunk_key for chunk_key, content_hash in source_hashes.items() if content_hash == chunk_hash(knowledge_base[chunk_key]) and target_hashes.get(chunk_key) != content_hash]
+
+   for start in range(0, len(unchanged), page_size):
+      page = source.get(ids=unchanged[start:start + page_size], include=["documents", "metadatas", "embeddings"])
+      target.upsert(ids=page["ids"], embeddings=page["embeddings"], documents=page["documents"], metadatas=page["metadatas"])
+   return len(unchanged)
+
+# Build (or update) the index as a new versioned snapshot and switch to it
+def build_snapshot(knowledge_base: dict = None, batch_size: int = INDEX_BATCH_SIZE) -> dict:
+   """
+   Index the knowledge base into a versioned collection and make it the active one
+
+   The snapshot is named after the embedding model and the knowledge base hash. Unchanged
+   chunks are copied from the active snapshot with their embeddings, only new and edited
+   chunks are embedded and removed ones are simply not copied. Running processes keep
+   searching the old snapshot until the pointer file is atomically replaced, then switch on
+   their next query. The snapshot before the previous one is deleted.
+
+   Args:
+      knowledge_base: Chunks to index (defaults to KNOWLEDGE_BASE plus ingested documents)
+      batch_size: Chunks embedded and upserted per call
+
+   Returns:
+      Active snapshot pointer (collection, knowledge base hash, embedding model, chunk counts)
+   """
+   if knowledge_base is None:
+      knowledge_base = {**KNOWLEDGE_BASE, **load_ingested_chunks(retrieval_engine.ingested_chunks_path)}
+
+   kb_hash = knowledge_base_hash(knowledge_base)
+   embedding_id = retrieval_engine.embedding_id
+   version = hashlib.sha256(f"{INDEX_SCHEMA_VERSION}\x1f{embedding_id}\x1f{kb_hash}".encode("utf-8")).hexdigest()[:12]
+   name = f"{retrieval_engine.collection_name}_{version}"
+
+   current_collection = retrieval_engine.collection # Also loads the current pointer
+   current = retrieval_engine.snapshot
+   if current and current["collection"] == name:
+      logger.info(f"Index snapshot {name} is up to date")
+      return current
+
+   logger.info(f"Building index snapshot {name} ({len(knowledge_base)} chunks)")
+   target = retrieval_engine.open_collection(name, metadata={"kb_hash": kb_hash, "embedding_model": embedding_id, "schema_version": INDEX_SCHEMA_VERSION})
+
+   # Reverting to a kept snapshot: drop chunks ingested into it while it was active
+   stale_ids = [chunk_key for chunk_key in _stored_hashes(target) if chunk_key not in knowledge_base]
+   if stale_ids:
+      target.delete(ids=stale_ids)
+
+   # Embeddings can only be reused from a snapshot of the same model (collections built before snapshots used model_name)
+   copied = 0
+   if (current["embedding_model"] if current else retrieval_engine.model_name) == embedding_id:
+      copied = _copy_unchanged(current_collection, target, knowledge_base)
+      logger.info(f"Copied {copied} unchanged chunks from {retrieval_engine.active_collection_name}")
+
+   counts = insert_diseases(knowledge_base, batch_size, collection=target)
+   if counts["failed"]: # Keep serving the current snapshot, rerunning resumes this build
+      raise RuntimeError(f"{counts['failed']} chunks couldn't be indexed, {name} was not activated")
+
+   snapshot = {
+      "collection": name,
+      "kb_hash": kb_hash,
+      "embedding_model": embedding_id,
+      "schema_version": INDEX_SCHEMA_VERSION,
+      "chunks": len(knowledge_base),
+      "copied": copied,
+      "embedded": counts["added"] + counts["updated"],
+      "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+      "previous": retrieval_engine.active_collection_name,
+   }
+   retrieval_engine.switch_snapshot(snapshot)
+   logger.info(f"Switched to index snapshot {name}")
+
+   # Processes may still be on the previous snapshot for a few seconds, the one before it is unused
+   if current and current.get("previous") not in (None, name, current["collection"]):
+      retrieval_engine.drop_collection(current["previous"])
+   return snapshot
+
+# Structured retrieval results
+@dataclass
+class RetrievalHit:
+   """One retrieved chunk"""
+   chunk_id: str
+   disease: str
+   category: str
+   content: str
+   distance: Optional[float] = None # Cosine distance (None if only the keyword search found it)
+   lexical_score: Optional[float] = None # BM25 score (None if only the vector search found it)
+   score: float = 0.0 # Reciprocal rank fusion score in hybrid mode
+
+@dataclass
+class RetrievalResult:
+   """Ranked hits of one query (all n_results, relevant ones are under the threshold or strong keyword matches)"""
+   query: str
+   hits: List[RetrievalHit] = field(default_factory=list)
+   threshold: float = DISTANCE_THRESHOLD
+   lexical_min_score: float = LEXICAL_MIN_SCORE
+
+   @property
+   def relevant(self) -> List[RetrievalHit]:
+      return [
+         hit for hit in self.hits
+         if (hit.distance is not None and hit.distance < self.threshold)
+         or (hit.lexical_score is not None and hit.lexical_score >= self.lexical_min_score)
+      ]
+
+@dataclass
+class RetrievalFilter:
+   """Restrict a search to chunks with these labels (None means any)"""
+   disease: Optional[str] = None
+   category: Optional[str] = None
+   species: Optional[str] = None # Chunks for both species always match
+   urgency: Optional[str] = None
+
+   @classmethod
+   def from_values(cls, disease: str = None, category: str = None, species: str = None, urgency: str = None) -> Optional["RetrievalFilter"]:
+      """Build a filter from untrusted values (e.g. LLM output), dropping labels no indexed chunk uses"""
+      filters = cls(
+         disease=disease if _is_known_label("disease", disease) else None,
+         category=category if _is_known_label("category", category) else None,
+         species=species if species in (SPECIES_DOG, SPECIES_CAT) else None,
+         urgency=urgency if urgency in ("EMERGENCIA", "NO_EMERGENCIA") else None,
+      )
+      return filters if filters.where() else None
+
+   def where(self) -> Optional[dict]:
+      """Chroma where clause"""
+      clauses = []
+      if self.disease:
+         clauses.append({"chunk_disease": self.disease})
+      if self.category:
+         clauses.append({"chunk_category": self.category})
+      if self.species:
+         clauses.append({"chunk_species": {"$in": [self.species, SPECIES_BOTH]}})
+      if self.urgency:
+         clauses.append({"chunk_urgency": self.urgency})
+      if not clauses:
+         return None
+      return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+   def matches(self, metadata: dict) -> bool:
+      """Same test as where(), for the in-memory keyword index"""
+      return (
+         (not self.disease or metadata.get("chunk_disease") == self.disease)
+         and (not self.category or metadata.get("chunk_category") == self.category)
+         and (not self.species or metadata.get("chunk_species") in (self.species, SPECIES_BOTH))
+         and (not self.urgency or metadata.get("chunk_urgency") == self.urgency)
+      )
+
+# Built-in labels are checked first, so keyword filters (e.g. labelling chunks in ingestion workers) never build the index
+def _is_known_label(name: str, value: Optional[str]) -> bool:
+   if not value:
+      return False
+   if any(chunk[name] == value for chunk in KNOWLEDGE_BASE.values()):
+      return True
+   return value in retrieval_engine.labels(name)
+
+# Stored documents carry the e5 "passage: " prefix
+def _passage_content(document: str) -> str:
+   return document[len("passage: "):] if document and document.startswith("passage: ") else (document or "")
+
+# Dense search of a batch of queries (one forward pass and one collection.query)
+def _vector_hits(queries: List[str], n_results: int, filters: RetrievalFilter = None) -> List[List[RetrievalHit]]:
+   query_embeddings = retrieval_engine.embedding_function([f"query: {query}" for query in queries]) # Cached queries are skipped, the rest share one forward pass
+   with tracer.span("vector_search", backend=retrieval_engine.backend, queries=len(queries), n_results=n_results, filtered=filters is not None):
+      response = retrieval_engine.collection.query(
+         query_embeddings=query_embeddings,
+         n_results=n_results,
+         where=filters.where() if filters else None, # Only the matching chunks are searched
+         include=["documents", "metadatas", "distances"] # IDs are always returned
+      )
+   return [
+      [
+         RetrievalHit(
+            chunk_id=chunk_id,
+            disease=(metadata or {}).get("chunk_disease", "unknown"),
+            category=(metadata or {}).get("chunk_category", "unknown"),
+            content=_passage_content(document),
+            distance=distance,
+         )
+         for chunk_id, document, metadata, distance in zip(ids, documents, metadatas, distances)
+      ]
+      for ids, documents, metadatas, distances in zip(response["ids"], response["documents"], response["metadatas"], response["distances"])
+   ]
+
+# Keyword search of one query (in memory, no model or database involved)
+def _lexical_hits(query: str, n_results: int, filters: RetrievalFilter = None) -> List[RetrievalHit]:
+   lexical_index = retrieval_engine.lexical_index
+   hits = []
+   with tracer.span("lexical_search", n_results=n_results, filtered=filters is not None):
+      ranking = lexical_index.search(query, n_results, where=filters.matches if filters else None)
+   for chunk_id, lexical_score in ranking:
+      content, metadata = lexical_index.get(chunk_id)
+      hits.append(RetrievalHit(
+         chunk_id=chunk_id,
+         disease=metadata.get("chunk_disease", "unknown"),
+         category=metadata.get("chunk_category", "unknown"),
+         content=content,
+         lexical_score=lexical_score,
+      ))
+   return hits
+
+# Merge both rankings, keeping the distance and BM25 score of chunks found by both
+def _fuse(vector_hits: List[RetrievalHit], lexical_hits: List[RetrievalHit], n_results: int) -> List[RetrievalHit]:
+   hits = {hit.chunk_id: hit for hit in vector_hits}
+   for lexical_hit in lexical_hits:
+      if lexical_hit.chunk_id in hits:
+         hits[lexical_hit.chunk_id].lexical_score = lexical_hit.lexical_score
+      else:
+         hits[lexical_hit.chunk_id] = lexical_hit
+   fused = []
+   for chunk_id, score in reciprocal_rank_fusion([[hit.chunk_id for hit in vector_hits], [hit.chunk_id for hit in lexical_hits]])[:n_results]:
+      hits[chunk_id].score = score
+      fused.append(hits[chunk_id])
+   return fused
+
+# Search many queries at once
+def query_diseases_batch(queries: List[str], n_results: int = N_RESULTS, threshold: float = DISTANCE_THRESHOLD, batch_size: int = QUERY_BATCH_SIZE, filters: RetrievalFilter = None, mode: str = None) -> List[RetrievalResult]:
+   """
+   Query VectorDB for many queries in bulk
+
+   Args:
+      queries: User or refined queries
+      n_results: Chunks retrieved per query
+      threshold: Max distance for a hit to be relevant
+      batch_size: Queries embedded and searched per call
+      filters: Only search chunks with these labels (same for every query)
+      mode: "vector", "hybrid" or "lexical" (defaults to RETRIEVAL_MODE)
+
+   Returns:
+      One RetrievalResult per query, in the same order (errors are raised, not formatted)
+   """
+   mode = mode or RETRIEVAL_MODE
+   if mode not in RETRIEVAL_MODES:
+      raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
+
+   results = []
+   for start in range(0, len(queries), batch_size):
+      batch = queries[start:start + batch_size]
+      if mode == "lexical":
+         batch_hits = [_lexical_hits(query, n_results, filters) for query in batch]
+      elif mode == "vector":
+         batch_hits = _vector_hits(batch, n_results, filters)
+      else:
+         batch_hits = [_fuse(vector_hits, _lexical_hits(query, n_results, filters), n_results) for query, vector_hits in zip(batch, _vector_hits(batch, n_results, filters))]
+      results.extend(RetrievalResult(query=query, hits=hits, threshold=threshold) for query, hits in zip(batch, batch_hits))
+   return results
+
+# Search one query
+def retrieve(query: str, n_results: int = N_RESULTS, threshold: float = DISTANCE_THRESHOLD, filters: RetrievalFilter = None, mode: str = None) -> RetrievalResult:
+   """
+   Ranked chunks for a query (errors are raised, use query_diseases for the tool's text)
+
+   A filtered search with no relevant hit is repeated over the whole collection,
+   so a wrongly guessed disease or category costs one extra search instead of the answer.
+   """
+   with tracer.span("retrieval", mode=mode or RETRIEVAL_MODE, filters=str(filters) if filters else None) as span:
+      result = query_diseases_batch([query], n_results=n_results, threshold=threshold, filters=filters, mode=mode)[0]
+      if filters and not result.relevant:
+         logger.info(f"No relevant chunks with {filters}, searching the whole collection")
+         result = query_diseases_batch([query], n_results=n_results, threshold=threshold, mode=mode)[0]
+         filters = None
+         span.set(unfiltered_fallback=True)
+      if tracer.enabled: # Distances as data instead of log text
+         span.set(
+            hits=len(result.hits),
+            relevant=len(result.relevant),
+            distances=[round(hit.distance, 4) for hit in result.hits if hit.distance is not None],
+            top_chunk=result.hits[0].chunk_id if result.hits else None,
+         )
+
+   logger.info(f"Retrieved {len(result.hits)} chunks for \"{query}\" ({mode or RETRIEVAL_MODE}{f', {filters}' if filters else ''}), {len(result.relevant)} relevant")
+   if logger.isEnabledFor(logging.DEBUG): # Per-hit lines only when debugging
+      relevant_ids = {hit.chunk_id for hit in result.relevant}
+      for i, hit in enumerate(result.hits):
+         distance = f"{hit.distance:.3f}" if hit.distance is not None else "-"
+         lexical_score = f"{hit.lexical_score:.2f}" if hit.lexical_score is not None else "-"
+         logger.debug(f" {i+1}. [{hit.disease}/{hit.category}] {hit.chunk_id}: distance {distance}, bm25 {lexical_score}{' ✓' if hit.chunk_id in relevant_ids else ''}")
+   return result
+
+# Render a retrieval result as the text the agents read
+def format_retrieval(result: RetrievalResult) -> str:
+   """Spanish summary of the relevant chunks (or the best match flagged as low confidence)"""
+   # Check for valid results
+   if not result.hits:
+      return "No relevant diseases found."
+
+   filtered_results = [hit.content for hit in result.relevant]
+   # If nothing passed, return best unfiltered match
+   if not filtered_results:
+         return f"Se encontró información potencialmente relacionada, pero con bajos niveles de confianza:\n\n{result.hits[0].content}"
+   # If only one result passed, return it
+   if len(filtered_results) == 1:
+         return filtered_results[0]
+   # If multiple results passed, return them
+   summary = "\n\n".join([f"• {content}" for content in filtered_results])
+   return f"Se encontró información relevante:\n\n{summary}"
+
+# Function to compare query to collection's content and return matches
+def query_diseases(query: str, filters: RetrievalFilter = None) -> str:
+   """Query VectorDB for Veterinary Diseases (optionally only chunks matching filters)"""
    try:
       # Vector similarity search
       # Compares query embedding to every chunks content embedding
       # Returns most similar chunks content
-      results = collection.query(
-         query_texts=[f"query: {query}"], # Used for embedding and search
-         n_results=10, # Return top 10 results, even if not relevant (adjustable)
-         include=["metadatas", "distances"] # Used for retrieval (id's by default, metadatas and distances)
-      )
+      return format_retrieval(retrieve(query, filters=filters))
 
-      # Check for valid results
-      if not results or not results.get("metadatas") or not results["metadatas"][0]:
-         return "No relevant diseases found."
-      
-      # Log all results
-      logger.info(f"Top 10 results:")
-      for i, (metadata, distance) in enumerate(zip(results["metadatas"][0], results["distances"][0])):
-         chunk_id = metadata.get("chunk_id", "unknown")
-         chunk_disease = metadata.get("chunk_disease", "unknown")
-         chunk_category = metadata.get("chunk_category", "unknown")
-         logger.info(f" {i+1}. [{chunk_disease}/{chunk_category}] {chunk_id}: {distance:.3f}")
-      
-      # Filter results by distance threshold
-      filtered_results = []
-      
-      for i, metadata in enumerate(results["metadatas"][0]):
-         distance = results["distances"][0][i]
-         if distance < 0.20: # Adjustable threshold
-            filtered_results.append(metadata.get("chunk_content", ""))
-            logger.info(f"   ✓ Using result {i+1}")
-
-      # Format response
-      # If nothing passed, return best unfiltered match
-      if not filtered_results and results["metadatas"][0]:
-            best_match = results["metadatas"][0][0].get("chunk_content", "")
-            return f"Se encontró información potencialmente relacionada, pero con bajos niveles de confianza:\n\n{best_match}"
-      # If only one result passed, return it
-      if len(filtered_results) == 1:
-            return filtered_results[0]
-      # If multiple results passed, return them
-      if filtered_results:
-            summary = "\n\n".join([f"• {content}" for content in filtered_results])
-            return f"Se encontró información relevante:\n\n{summary}"
-         
    except Exception as e: # Catch any errors during search
       logger.error(f"Error querying collection: {str(e)}")
       return "An error occured while querying collection"
 
+# Compare two queries (decides whether the results of one can stand in for the other)
+def query_similarity(query: str, other: str) -> float:
+   """Cosine similarity of two queries' e5 embeddings (both usually come from the embedding cache)"""
+   if " ".join(query.lower().split()) == " ".join(other.lower().split()):
+      return 1.0
+   first, second = retrieval_engine.embedding_function([f"query: {query}", f"query: {other}"])
+   dot = sum(float(a) * float(b) for a, b in zip(first, second))
+   norms = sum(float(a) ** 2 for a in first) ** 0.5 * sum(float(b) ** 2 for b in second) ** 0.5
+   return dot / norms if norms else 0.0
+
 # Utility to reset collection
-def reset_collection(): # Use when modified knowledge base, changed embedding model or testing fresh installs
+def reset_collection(): # Use when testing fresh installs (model and knowledge base changes get a new snapshot from build_snapshot)
     """Utility function to reset the collection if needed."""
     try:
-        shutil.rmtree(DB_PATH)
+        retrieval_engine.reset()
+        shutil.rmtree(retrieval_engine.db_path)
         logger.info("Collection deleted successfully.")
     except Exception as e:
         logger.info(f"Collection doesn't exist or couldn't be deleted: {e}")
@@ -370,10 +1038,10 @@ if __name__ == "__main__":
 #    reset_collection()
 
    # Check collection
-#    print(collection.get())
+#    print(retrieval_engine.collection.get())
 
-   # Create collection and index chunks
-   insert_diseases()
+   # Index chunks into a new snapshot (no-op if nothing changed) and switch running apps to it
+   build_snapshot()
 
    # TESTING QUERIES
 #    test_queries = [
@@ -0,0 +1,310 @@
+import os
+import json
+import threading
+import logging
+import numpy as np
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Rows converted to float32 per matrix product when searching a float16 matrix
+SEARCH_BLOCK_ROWS = 16384
+
+# ===================================================
+# WHERE CLAUSES
+# ===================================================
+def matches_where(metadata: dict, where: dict) -> bool:
+    """Evaluate the subset of Chroma's where syntax used by vector_db ($and, $or, $eq, $ne, $in, $nin)"""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if operator == "$eq" and value != operand:
+                    return False
+                if operator == "$ne" and value == operand:
+                    return False
+                if operator == "$in" and value not in operand:
+                    return False
+                if operator == "$nin" and value in operand:
+                    return False
+                if operator not in ("$eq", "$ne", "$in", "$nin"):
+                    raise ValueError(f"Unsupported where operator {operator!r}")
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+# ===================================================
+# NUMPY COLLECTION
+# ===================================================
+class NumpyCollection:
+    """
+    Exact cosine search over a memory-mapped embedding matrix
+
+    Implements the part of chromadb's Collection API that vector_db uses (upsert, query, get,
+    delete, count), so it can replace the Chroma collection for small knowledge bases: one
+    matrix product per query batch, no HNSW graph, SQLite or client start-up. Rows are stored
+    unit-length (float32 or float16) and records go to an append-only log replayed on open.
+    The files are meant to be written by a single process at a time, other processes can open
+    them read_only.
+    """
+
+    VECTORS_FILE = "vectors.bin"
+    META_FILE = "meta.json"
+    RECORDS_FILE = "records.log"
+
+    def __init__(self, path: str, dtype: str = "float32", initial_capacity: int = 1024, metadata: dict = None, read_only: bool = False):
+        self.path = path
+        self.read_only = read_only
+        self.dtype = np.dtype(dtype)
+        self.initial_capacity = initial_capacity
+        self.metadata = metadata or {} # Collection-level metadata (like Chroma's), saved with the matrix
+        self._vectors = None
+        self._dim = None
+        self._capacity = 0
+        self._rows = {} # id -> row
+        self._records = {} # id -> (document, metadata)
+        self._row_ids = [] # row -> id (None for free rows)
+        self._free_rows = []
+        self._live = np.zeros(0, dtype=bool) # row -> holds a record (kept as an array so queries don't loop in Python)
+        self._log_lines = 0
+        self._lock = threading.RLock()
+        self._load()
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    # ---------------------------------------------------
+    # Writing
+    # ---------------------------------------------------
+    def upsert(self, ids: list, embeddings, documents: list = None, metadatas: list = None):
+        """Insert or replace records (metadata is merged like Chroma's, None values delete keys)"""
+        self._check_writable()
+        embeddings = self._normalize(embeddings)
+        with self._lock:
+            if self._vectors is None:
+                self._open_vectors(embeddings.shape[1], max(self.initial_capacity, len(ids)))
+            if embeddings.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {embeddings.shape[1]} doesn't match collection dimension {self._dim}")
+
+            lines = []
+            for i, record_id in enumerate(ids):
+                row = self._rows.get(record_id)
+                if row is None:
+                    row = self._allocate_row()
+                    self._rows[record_id] = row
+                    self._row_ids[row] = record_id
+                    self._live[row] = True
+                self._vectors[row] = embeddings[i]
+
+                document, metadata = self._records.get(record_id, (None, {}))
+                if documents is not None:
+                    document = documents[i]
+                if metadatas is not None and metadatas[i]:
+                    metadata = {**metadata, **metadatas[i]}
+                    metadata = {key: value for key, value in metadata.items() if value is not None}
+                self._records[record_id] = (document, metadata)
+                lines.append(json.dumps({"id": record_id, "row": row, "document": document, "metadata": metadata}, ensure_ascii=False) + "\n")
+
+            # Vectors are flushed before the log points at them
+            self._vectors.flush()
+            self._append(lines)
+
+    def delete(self, ids: list = None, where: dict = None):
+        """Remove records by ID and/or metadata"""
+        self._check_writable()
+        with self._lock:
+            if ids is None:
+                ids = list(self._rows)
+            if where:
+                ids = [record_id for record_id in ids if record_id in self._records and matches_where(self._records[record_id][1], where)]
+            lines = []
+            for record_id in ids:
+                row = self._rows.pop(record_id, None)
+                if row is None:
+                    continue
+                self._records.pop(record_id, None)
+                self._row_ids[row] = None
+                self._live[row] = False
+                self._free_rows.append(row)
+                lines.append(json.dumps({"id": record_id, "deleted": True}) + "\n")
+            self._append(lines)
+
+    # ---------------------------------------------------
+    # Reading
+    # ---------------------------------------------------
+    def query(self, query_embeddings, n_results: int = 10, where: dict = None, include: list = ("metadatas", "documents", "distances")) -> dict:
+        """Exact top-k by cosine distance (1 - cosine similarity), same result layout as Chroma"""
+        queries = self._normalize(query_embeddings)
+        include = set(include or ())
+        with self._lock:
+            result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+            if self._vectors is None or not self._rows:
+                for _ in range(len(queries)):
+                    for values in result.values():
+                        values.append([])
+                return self._select(result, include)
+
+            used = len(self._row_ids)
+            valid = self._live[:used].copy()
+            if where:
+                for row in np.flatnonzero(valid):
+                    valid[row] = matches_where(self._records[self._row_ids[row]][1], where)
+
+            similarities = self._similarities(queries, used) # (queries, rows)
+            similarities[:, ~valid] = -np.inf
+            k = min(n_results, int(valid.sum()))
+
+            for row_similarities in similarities:
+                if k == 0:
+                    top_rows = np.empty(0, dtype=np.int64)
+                else:
+                    top_rows = np.argpartition(-row_similarities, k - 1)[:k]
+                    top_rows = top_rows[np.argsort(-row_similarities[top_rows], kind="stable")]
+                ids = [self._row_ids[row] for row in top_rows]
+                result["ids"].append(ids)
+                result["documents"].append([self._records[record_id][0] for record_id in ids])
+                result["metadatas"].append([dict(self._records[record_id][1]) for record_id in ids])
+                result["distances"].append([float(1.0 - row_similarities[row]) for row in top_rows])
+            return self._select(result, include)
+
+    def get(self, ids: list = None, where: dict = None, limit: int = None, offset: int = 0, include: list = ("metadatas", "documents")) -> dict:
+        """Records in insertion order, optionally by ID and/or metadata"""
+        include = set(include or ())
+        with self._lock:
+            record_ids = [record_id for record_id in (ids if ids is not None else self._records) if record_id in self._records]
+            if where:
+                record_ids = [record_id for record_id in record_ids if matches_where(self._records[record_id][1], where)]
+            record_ids = record_ids[offset:offset + limit if limit is not None else None]
+            result = {
+                "ids": record_ids,
+                "documents": [self._records[record_id][0] for record_id in record_ids],
+                "metadatas": [dict(self._records[record_id][1]) for record_id in record_ids],
+            }
+            if "embeddings" in include:
+                result["embeddings"] = [np.array(self._vectors[self._rows[record_id]], dtype=np.float32) for record_id in record_ids]
+            return self._select(result, include)
+
+    # ---------------------------------------------------
+    # Internals (call with the lock held)
+    # ---------------------------------------------------
+    @staticmethod
+    def _normalize(embeddings) -> np.ndarray:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    @staticmethod
+    def _select(result: dict, include: set) -> dict:
+        """Drop fields that weren't asked for (IDs are always returned, like Chroma)"""
+        return {key: (values if key == "ids" or key in include else None) for key, values in result.items()}
+
+    def _similarities(self, queries: np.ndarray, rows: int) -> np.ndarray:
+        """Cosine similarity of every query with the first `rows` rows"""
+        if self.dtype == np.float32:
+            return queries @ np.asarray(self._vectors[:rows]).T
+        # NumPy has no fast float16 matrix product, convert block by block instead of the whole matrix
+        similarities = np.empty((len(queries), rows), dtype=np.float32)
+        for start in range(0, rows, SEARCH_BLOCK_ROWS):
+            end = min(start + SEARCH_BLOCK_ROWS, rows)
+            similarities[:, start:end] = queries @ np.asarray(self._vectors[start:end], dtype=np.float32).T
+        return similarities
+
+    def _allocate_row(self) -> int:
+        if self._free_rows:
+            return self._free_rows.pop()
+        row = len(self._row_ids)
+        if row >= self._capacity:
+            self._grow(self._capacity * 2)
+        self._row_ids.append(None)
+        return row
+
+    def _check_writable(self):
+        if self.read_only:
+            raise PermissionError(f"Collection at {self.path} is open read-only")
+
+    def _open_vectors(self, dim: int, capacity: int, mode: str = "w+"):
+        """Create (or open) the memory-mapped vector matrix"""
+        os.makedirs(self.path, exist_ok=True)
+        self._dim = dim
+        self._capacity = capacity
+        self._vectors = np.memmap(os.path.join(self.path, self.VECTORS_FILE), dtype=self.dtype, mode=mode, shape=(capacity, dim))
+        self._live = np.concatenate([self._live, np.zeros(capacity - len(self._live), dtype=bool)])
+        if mode == "w+":
+            self._write_meta()
+
+    def _grow(self, capacity: int):
+        """Double the matrix file (amortized, existing rows are kept in place)"""
+        self._vectors.flush()
+        del self._vectors
+        with open(os.path.join(self.path, self.VECTORS_FILE), "r+b") as vectors_file:
+            vectors_file.truncate(capacity * self._dim * self.dtype.itemsize)
+        self._open_vectors(self._dim, capacity, mode="r+")
+        self._write_meta()
+
+    def _write_meta(self):
+        meta_path = os.path.join(self.path, self.META_FILE)
+        with open(f"{meta_path}.tmp", "w", encoding="utf-8") as meta_file:
+            json.dump({"dim": self._dim, "dtype": self.dtype.name, "capacity": self._capacity, "metadata": self.metadata}, meta_file)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def _append(self, lines: list):
+        if not lines:
+            return
+        with open(os.path.join(self.path, self.RECORDS_FILE), "a", encoding="utf-8") as records_file:
+            records_file.writelines(lines)
+        self._log_lines += len(lines)
+
+        # Replaced and deleted records pile up, rewrite the log once it doubles
+        if self._log_lines > 2 * max(len(self._records), self.initial_capacity):
+            self._compact()
+
+    def _load(self):
+        """Replay the records log over an existing matrix"""
+        meta_path = os.path.join(self.path, self.META_FILE)
+        records_path = os.path.join(self.path, self.RECORDS_FILE)
+        if not os.path.exists(meta_path):
+            return
+
+        with open(meta_path, encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        if np.dtype(meta["dtype"]) != self.dtype:
+            raise ValueError(f"Collection at {self.path} stores {meta['dtype']}, not {self.dtype.name}")
+        self.metadata = meta.get("metadata", self.metadata)
+        self._open_vectors(meta["dim"], meta["capacity"], mode="r" if self.read_only else "r+")
+
+        if os.path.exists(records_path):
+            with open(records_path, encoding="utf-8") as records_file:
+                for line in records_file:
+                    self._log_lines += 1
+                    entry = json.loads(line)
+                    if entry.get("deleted"):
+                        self._rows.pop(entry["id"], None)
+                        self._records.pop(entry["id"], None)
+                        continue
+                    self._rows[entry["id"]] = entry["row"]
+                    self._records[entry["id"]] = (entry["document"], entry["metadata"])
+
+        used = max(self._rows.values(), default=-1) + 1
+        self._row_ids = [None] * used
+        for record_id, row in self._rows.items():
+            self._row_ids[row] = record_id
+            self._live[row] = True
+        self._free_rows = [row for row in range(used - 1, -1, -1) if self._row_ids[row] is None]
+        logger.info(f"Loaded NumPy collection: {len(self._rows)} records from {self.path}")
+
+    def _compact(self):
+        """Rewrite the records log with one line per live record"""
+        records_path = os.path.join(self.path, self.RECORDS_FILE)
+        with open(f"{records_path}.tmp", "w", encoding="utf-8") as records_file:
+            for record_id, (document, metadata) in self._records.items():
+                records_file.write(json.dumps({"id": record_id, "row": self._rows[record_id], "document": document, "metadata": metadata}, ensure_ascii=False) + "\n")
+        os.replace(f"{records_path}.tmp", records_path)
+        self._log_lines = len(self._records)